@@ -0,0 +1,375 @@
+import asyncio
+import fnmatch
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import requests
+
+from database import SessionLocal
+from metrics import ALERT_EVENTS, ALERT_SINK_ERRORS, ALERTS_SENT
+from models import AlertOutbox, AnomalyAction
+
+# Rules as a JSON list, inline or in a file; without rules nothing is dispatched
+ALERT_RULES = os.getenv("ALERT_RULES", "")
+ALERT_RULES_FILE = os.getenv("ALERT_RULES_FILE", "")
+# Destinations of the file and webhook sinks; a sink without one is unavailable
+ALERT_FILE_PATH = os.getenv("ALERT_FILE_PATH", "")
+ALERT_WEBHOOK_URL = os.getenv("ALERT_WEBHOOK_URL", "")
+ALERT_WEBHOOK_TIMEOUT = float(os.getenv("ALERT_WEBHOOK_TIMEOUT", "5"))
+# Seconds between polls of the outbox, and events taken per poll
+ALERT_POLL_INTERVAL = float(os.getenv("ALERT_POLL_INTERVAL", "1.0"))
+ALERT_POLL_BATCH = int(os.getenv("ALERT_POLL_BATCH", "500"))
+# Anomalies listed in a digest, highest severity first; the rest are only counted
+ALERT_DIGEST_MAX_ITEMS = 20
+# Episodes remembered per rule for deduplication, and how far back they are reloaded after a restart
+ALERT_DEDUP_SIZE = 100000
+ALERT_DEDUP_RELOAD_HOURS = 24
+
+NOTIFICATION_SENT = "notification_sent"
+
+
+class AlertRule:
+    """Which anomalies alert whom, and how often.
+
+    An anomaly matches when its severity is at least min_severity and its type and
+    location are among anomaly_types and locations (fnmatch patterns; None matches
+    everything), and, with a bbox [min_lon, min_lat, max_lon, max_lat], it lies inside.
+    Each episode alerts once per rule. With digest_seconds, matches are collected for
+    that long and sent as one digest; otherwise each is sent at once, and matches beyond
+    max_per_minute are folded into a digest sent when the rate allows.
+    """
+
+    def __init__(self, name: str, sinks: List[str], min_severity: float = 0.0,
+                 anomaly_types: Optional[List[str]] = None, locations: Optional[List[str]] = None,
+                 bbox: Optional[List[float]] = None, max_per_minute: float = 10.0, digest_seconds: float = 0.0):
+        self.name = name
+        self.sinks = list(sinks)
+        self.min_severity = min_severity
+        self.anomaly_types = set(anomaly_types) if anomaly_types else None
+        self.locations = list(locations) if locations else None
+        self.bbox = bbox
+        self.max_per_minute = max_per_minute
+        self.digest_seconds = digest_seconds
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if event["severity"] < self.min_severity:
+            return False
+        if self.anomaly_types is not None and event["anomaly_type"] not in self.anomaly_types:
+            return False
+        if self.locations is not None and \
+                not any(fnmatch.fnmatchcase(event["location"] or "", pattern) for pattern in self.locations):
+            return False
+        if self.bbox is not None:
+            latitude, longitude = event.get("latitude"), event.get("longitude")
+            if latitude is None or longitude is None:
+                return False
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            if not (min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon):
+                return False
+        return True
+
+
+def load_rules() -> List[AlertRule]:
+    source = ALERT_RULES
+    if ALERT_RULES_FILE:
+        with open(ALERT_RULES_FILE) as f:
+            source = f.read()
+    return [AlertRule(**rule) for rule in json.loads(source)] if source.strip() else []
+
+
+class LogSink:
+    def send(self, alert: Dict[str, Any]):
+        print(f"ALERT [{alert['rule']}] {alert['summary']}")
+
+
+class FileSink:
+    """Appends alerts as JSON lines, e.g. for tests or a log shipper"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, alert: Dict[str, Any]):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(alert) + "\n")
+
+
+class WebhookSink:
+    def __init__(self, url: str, timeout: float = ALERT_WEBHOOK_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alert: Dict[str, Any]):
+        requests.post(self.url, json=alert, timeout=self.timeout).raise_for_status()
+
+
+def default_sinks() -> Dict[str, Any]:
+    sinks = {"log": LogSink()}
+    if ALERT_FILE_PATH:
+        sinks["file"] = FileSink(ALERT_FILE_PATH)
+    if ALERT_WEBHOOK_URL:
+        sinks["webhook"] = WebhookSink(ALERT_WEBHOOK_URL)
+    return sinks
+
+
+class _RuleState:
+    """Rate limit tokens, pending digest and alerted episodes of one rule"""
+
+    def __init__(self, rule: AlertRule, now: float):
+        self.rule = rule
+        self.tokens = rule.max_per_minute
+        self.refilled_at = now
+        # (outbox id, event) of matches waiting for the digest; their outbox rows are kept until it is sent
+        self.pending: List[Tuple[int, Dict[str, Any]]] = []
+        self.digest_due: Optional[float] = None
+        self.alerted: "OrderedDict[int, None]" = OrderedDict()
+
+    def take_token(self, now: float) -> bool:
+        self.tokens = min(self.rule.max_per_minute,
+                          self.tokens + (now - self.refilled_at) * self.rule.max_per_minute / 60)
+        self.refilled_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def remember(self, anomaly_id: int) -> bool:
+        """Mark an episode as alerted; False if it already was"""
+        if anomaly_id in self.alerted:
+            return False
+        self.alerted[anomaly_id] = None
+        if len(self.alerted) > ALERT_DEDUP_SIZE:
+            self.alerted.popitem(last=False)
+        return True
+
+
+class AlertDispatcher:
+    """Matches recorded anomalies against alert rules and sends alerts from a background task.
+
+    Anomalies are staged in the alert_outbox table in the transaction that records
+    them, by any worker, so recording never waits for a sink. One worker runs the
+    dispatcher (a coordinator singleton): it drains the outbox and applies
+    deduplication, rate limits and digest windows per rule for the whole deployment.
+    An event leaves the outbox once its alerts are sent, so the next dispatcher
+    picks up the digests a stopped one still held. It sends through the rule's sinks in a thread and records one AnomalyAction per
+    alerted anomaly, in a bulk insert per alert.
+    """
+
+    def __init__(self, rules: Optional[List[AlertRule]] = None, sinks: Optional[Dict[str, Any]] = None,
+                 session_factory=SessionLocal, poll_interval: float = ALERT_POLL_INTERVAL,
+                 poll_batch: int = ALERT_POLL_BATCH):
+        self.rules = rules if rules is not None else load_rules()
+        self.sinks = sinks if sinks is not None else default_sinks()
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.poll_batch = poll_batch
+        self._states: Dict[str, _RuleState] = {}
+        # Last outbox id taken; rows up to it that are not deleted are held by pending digests
+        self._taken_id = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        for rule in self.rules:
+            missing = [sink for sink in rule.sinks if sink not in self.sinks]
+            if missing:
+                print(f"Alert rule {rule.name} uses unavailable sinks {missing}")
+
+    async def start(self):
+        if not self.rules:
+            return
+        # Fresh state on every start: another worker may have dispatched since this one last led
+        self._states = {rule.name: _RuleState(rule, time.monotonic()) for rule in self.rules}
+        self._taken_id = 0
+        self._stopping = asyncio.Event()
+        await asyncio.get_running_loop().run_in_executor(None, self._reload_alerted)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Send pending digests and stop"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    def stage(self, db, events: List[Dict[str, Any]]):
+        """Queue recorded anomalies for dispatch in db's transaction; the caller commits"""
+        if not self.rules or not events:
+            return
+        db.bulk_insert_mappings(AlertOutbox, [
+            {"event": json.dumps(event, default=str), "created_at": datetime.utcnow()} for event in events
+        ])
+
+    def _take(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """(outbox id, event) of the oldest staged anomalies not taken yet"""
+        db = self.session_factory()
+        try:
+            rows = db.query(AlertOutbox.id, AlertOutbox.event)\
+                .filter(AlertOutbox.id > self._taken_id)\
+                .order_by(AlertOutbox.id)\
+                .limit(self.poll_batch)\
+                .all()
+        finally:
+            db.close()
+        return [(outbox_id, json.loads(event)) for outbox_id, event in rows]
+
+    def _held(self) -> Set[int]:
+        return {outbox_id for state in self._states.values() for outbox_id, _ in state.pending}
+
+    def _done(self, outbox_ids: List[int]):
+        """Delete the outbox rows of events no pending digest holds"""
+        held = self._held()
+        outbox_ids = [outbox_id for outbox_id in outbox_ids if outbox_id not in held]
+        if not outbox_ids:
+            return
+        db = self.session_factory()
+        try:
+            for start in range(0, len(outbox_ids), self.poll_batch):
+                chunk = outbox_ids[start:start + self.poll_batch]
+                db.query(AlertOutbox).filter(AlertOutbox.id.in_(chunk)).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _reload_alerted(self):
+        """Remember episodes already alerted, by this worker or another, so they do not alert again"""
+        since = datetime.utcnow() - timedelta(hours=ALERT_DEDUP_RELOAD_HOURS)
+        db = self.session_factory()
+        try:
+            rows = db.query(AnomalyAction.anomaly_id, AnomalyAction.description)\
+                .filter(AnomalyAction.action_type == NOTIFICATION_SENT, AnomalyAction.timestamp >= since)\
+                .order_by(AnomalyAction.id)\
+                .all()
+        finally:
+            db.close()
+        for anomaly_id, description in rows:
+            # Descriptions start with "[rule name]"
+            name = (description or "")[1:].split("]", 1)[0]
+            if name in self._states:
+                self._states[name].remember(anomaly_id)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            stopping = self._stopping.is_set()
+            try:
+                staged = await loop.run_in_executor(None, self._take)
+                for outbox_id, event in staged:
+                    await self._dispatch(outbox_id, event)
+                if staged:
+                    self._taken_id = staged[-1][0]
+                    # Sent or unmatched events leave the outbox; a crash before this only repeats deduplicated ones
+                    await loop.run_in_executor(None, self._done, [outbox_id for outbox_id, _ in staged])
+            except Exception as e:
+                staged = []
+                print(f"Error dispatching alerts: {e}")
+            try:
+                sent = await self._send_due_digests(flush_all=stopping)
+                await loop.run_in_executor(None, self._done, sent)
+            except Exception as e:
+                print(f"Error sending alert digests: {e}")
+            if stopping:
+                return
+            if len(staged) < self.poll_batch:
+                due = [state.digest_due for state in self._states.values() if state.digest_due is not None]
+                timeout = max(0.0, min(due) - time.monotonic()) if due else self.poll_interval
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), min(timeout, self.poll_interval))
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _dispatch(self, outbox_id: int, event: Dict[str, Any]):
+        for state in self._states.values():
+            rule = state.rule
+            if not rule.matches(event):
+                continue
+            if not state.remember(event["anomaly_id"]):
+                ALERT_EVENTS.labels(outcome="duplicate").inc()
+                continue
+            ALERT_EVENTS.labels(outcome="matched").inc()
+            now = time.monotonic()
+            if not rule.digest_seconds and not state.pending and state.take_token(now):
+                await self._send(rule, [event])
+                continue
+            # Digest rule, or over the rate limit: collect until the window closes
+            state.pending.append((outbox_id, event))
+            if state.digest_due is None:
+                state.digest_due = now + (rule.digest_seconds or 60 / max(rule.max_per_minute, 1e-9))
+
+    async def _send_due_digests(self, flush_all: bool = False) -> List[int]:
+        """Send the digests that are due; returns the outbox ids of their events"""
+        now = time.monotonic()
+        sent = []
+        for state in self._states.values():
+            if not state.pending or (not flush_all and state.digest_due > now):
+                continue
+            if not flush_all and not state.take_token(now):
+                # Still over the rate limit; try again once a token has accrued
+                state.digest_due = now + 60 / max(state.rule.max_per_minute, 1e-9)
+                continue
+            pending, state.pending, state.digest_due = state.pending, [], None
+            await self._send(state.rule, [event for _, event in pending])
+            sent.extend(outbox_id for outbox_id, _ in pending)
+        return sent
+
+    async def _send(self, rule: AlertRule, events: List[Dict[str, Any]]):
+        await asyncio.get_running_loop().run_in_executor(None, self._deliver, rule, events)
+
+    def _deliver(self, rule: AlertRule, events: List[Dict[str, Any]]):
+        kind = "digest" if len(events) > 1 else "single"
+        alert = build_alert(rule, events, kind)
+        delivered = []
+        for name in rule.sinks:
+            sink = self.sinks.get(name)
+            if sink is None:
+                continue
+            try:
+                sink.send(alert)
+                delivered.append(name)
+            except Exception as e:
+                ALERT_SINK_ERRORS.labels(sink=name).inc()
+                print(f"Error sending alert of rule {rule.name} to {name}: {e}")
+        if not delivered:
+            return
+        ALERTS_SENT.labels(rule=rule.name, kind=kind).inc()
+        description = f"[{rule.name}] {kind} alert sent via {', '.join(delivered)}: {alert['summary']}"
+        db = self.session_factory()
+        try:
+            db.bulk_insert_mappings(AnomalyAction, [
+                {"anomaly_id": event["anomaly_id"], "action_type": NOTIFICATION_SENT,
+                 "description": description, "timestamp": datetime.utcnow()}
+                for event in events
+            ])
+            db.commit()
+        except Exception as e:
+            print(f"Error recording alert actions of rule {rule.name}: {e}")
+        finally:
+            db.close()
+
+
+def build_alert(rule: AlertRule, events: List[Dict[str, Any]], kind: str) -> Dict[str, Any]:
+    by_type: Dict[str, int] = {}
+    by_location: Dict[str, int] = {}
+    for event in events:
+        by_type[event["anomaly_type"]] = by_type.get(event["anomaly_type"], 0) + 1
+        by_location[event["location"]] = by_location.get(event["location"], 0) + 1
+    worst = sorted(events, key=lambda event: event["severity"], reverse=True)
+    if kind == "single":
+        summary = f"{worst[0]['anomaly_type']} at {worst[0]['location']}: {worst[0]['description']}"
+    else:
+        summary = f"{len(events)} anomalies at {len(by_location)} locations, worst severity {worst[0]['severity']:.2f}"
+    return {
+        "rule": rule.name,
+        "kind": kind,
+        "summary": summary,
+        "count": len(events),
+        "by_type": by_type,
+        "by_location": by_location,
+        "anomalies": worst[:ALERT_DIGEST_MAX_ITEMS],
+        "sent_at": datetime.utcnow().isoformat()
+    }
+
+
+alert_dispatcher = AlertDispatcher()
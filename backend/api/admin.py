@@ -1,16 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse, Response
 from sqlalchemy.orm import Session
 from typing import List, Dict
 from datetime import datetime, timedelta
+import asyncio
 
 from database import get_db
+from profiling import (
+    MAX_SAMPLING_SECONDS, PROFILING_ENABLED, TimedRoute,
+    format_collapsed, request_profiler, sampling_profiler
+)
 from models import User, Anomaly, AuditLog
+from response_cache import ANOMALIES, AUDIT, USERS, response_cache
+import fast_json
 from .auth import get_current_user
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+# Columns of the audit log list in the fast JSON path, in response field order
+AUDIT_LOG_FIELDS = ["id", "user", "action", "details", "timestamp", "ip_address"]
+AUDIT_LOG_COLUMNS = [AuditLog.id, User.username, AuditLog.action, AuditLog.details, AuditLog.timestamp,
+                     AuditLog.ip_address]
 
 @router.get("/dashboard", response_model=dict)
 async def get_dashboard_stats(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -21,6 +35,10 @@ async def get_dashboard_stats(
             detail="Only admins can access dashboard stats"
         )
     
+    cached = response_cache.lookup(request, [ANOMALIES, USERS, AUDIT], role=current_user.role)
+    if cached.response is not None:
+        return cached.response
+    
     # Get total counts
     total_users = db.query(User).count()
     total_anomalies = db.query(Anomaly).count()
@@ -38,7 +56,7 @@ async def get_dashboard_stats(
         .limit(10)\
         .all()
     
-    return {
+    return cached.store({
         "stats": {
             "total_users": total_users,
             "total_anomalies": total_anomalies,
@@ -63,10 +81,11 @@ async def get_dashboard_stats(
             }
             for log in recent_activity
         ]
-    }
+    })
 
 @router.get("/audit-logs", response_model=List[dict])
 async def get_audit_logs(
+    request: Request,
     start_date: datetime = None,
     end_date: datetime = None,
     user_id: int = None,
@@ -90,6 +109,13 @@ async def get_audit_logs(
     if user_id:
         query = query.filter(AuditLog.user_id == user_id)
     
+    if fast_json.FAST_JSON_ENABLED:
+        rows = query.outerjoin(User, AuditLog.user_id == User.id)\
+            .with_entities(*AUDIT_LOG_COLUMNS)\
+            .order_by(AuditLog.timestamp.desc())\
+            .all()
+        return fast_json.json_response(request, fast_json.encode_rows(AUDIT_LOG_FIELDS, rows))
+    
     logs = query.order_by(AuditLog.timestamp.desc()).all()
     
     return [
@@ -138,4 +164,82 @@ async def get_system_health(
             "version": "1.0.0",
             "last_updated": datetime.utcnow()
         }
-    }
\ No newline at end of file
+    }
+
+def require_profiling_admin(current_user: User = Depends(get_current_user)):
+    # Behave as if the endpoints did not exist unless profiling was enabled at deploy time
+    if not PROFILING_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profiling is disabled"
+        )
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can use the profiler"
+        )
+    return current_user
+
+@router.post("/profiling/requests", response_model=dict)
+async def profile_next_requests(
+    route: str,
+    count: int = 1,
+    current_user: User = Depends(require_profiling_admin)
+):
+    if count < 1 or count > 100:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="count must be between 1 and 100"
+        )
+    request_profiler.arm(route, count)
+    return {"message": f"Profiling the next {count} request(s) to {route}"}
+
+@router.get("/profiling/requests", response_model=dict)
+async def list_request_profiles(current_user: User = Depends(require_profiling_admin)):
+    return {
+        "armed": request_profiler.armed(),
+        "profiles": [result.summary() for result in request_profiler.results]
+    }
+
+@router.get("/profiling/requests/{profile_id}")
+async def get_request_profile(
+    profile_id: int,
+    format: str = "text",
+    limit: int = 50,
+    current_user: User = Depends(require_profiling_admin)
+):
+    result = request_profiler.get(profile_id)
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    if format == "pstats":
+        return Response(
+            result.to_bytes(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f"attachment; filename=request-{profile_id}.prof"}
+        )
+    return PlainTextResponse(result.text(limit))
+
+@router.post("/profiling/sample")
+async def sample_profile(
+    seconds: float = 10.0,
+    interval_ms: float = 5.0,
+    current_user: User = Depends(require_profiling_admin)
+):
+    if seconds <= 0 or seconds > MAX_SAMPLING_SECONDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"seconds must be between 0 and {MAX_SAMPLING_SECONDS}"
+        )
+    if sampling_profiler.busy:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A sampling session is already running"
+        )
+    # Sample from a worker thread so the event loop keeps serving the traffic being profiled
+    stacks = await asyncio.get_running_loop().run_in_executor(
+        None, sampling_profiler.run, seconds, interval_ms / 1000
+    )
+    return PlainTextResponse(format_collapsed(stacks))
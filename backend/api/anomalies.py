@@ -1,13 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 
 from database import get_db
+from profiling import TimedRoute
 from models import Anomaly, AnomalyAction, User
+from episodes import episode_aggregator
+from response_cache import ANOMALIES, response_cache
+import fast_json
+import geo
 from .auth import get_current_user
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+# Columns of the anomaly list in the fast JSON path, in response field order
+ANOMALY_LIST_FIELDS = [
+    "id", "timestamp", "location", "anomaly_type", "severity", "description", "status",
+    "assigned_to", "last_seen_at", "duration_seconds", "record_count", "latitude", "longitude"
+]
+ANOMALY_LIST_COLUMNS = [
+    Anomaly.id, Anomaly.timestamp, Anomaly.location, Anomaly.anomaly_type, Anomaly.severity,
+    Anomaly.description, Anomaly.status, User.username, Anomaly.last_seen_at, Anomaly.duration_seconds,
+    Anomaly.record_count, Anomaly.latitude, Anomaly.longitude
+]
 
 @router.post("/", response_model=dict)
 async def create_anomaly(
@@ -15,6 +31,8 @@ async def create_anomaly(
     anomaly_type: str,
     severity: float,
     description: str,
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -25,7 +43,10 @@ async def create_anomaly(
         severity=severity,
         description=description,
         status="detected",
-        assigned_to_id=current_user.id
+        assigned_to_id=current_user.id,
+        latitude=latitude,
+        longitude=longitude,
+        geohash=geo.encode_optional(latitude, longitude)
     )
     
     db.add(anomaly)
@@ -41,15 +62,27 @@ async def create_anomaly(
     
     db.add(action)
     db.commit()
+    response_cache.invalidate(ANOMALIES)
     
     return {"message": "Anomaly created successfully", "anomaly_id": anomaly.id}
 
 @router.get("/", response_model=List[dict])
 async def get_anomalies(
+    request: Request,
     status: Optional[str] = None,
     severity_min: Optional[float] = None,
+    model_version: Optional[str] = None,
+    bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat"),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0),
     db: Session = Depends(get_db)
 ):
+    # Unchanged polls are answered from the cache without touching the database
+    cached = response_cache.lookup(request, [ANOMALIES])
+    if cached.response is not None:
+        return cached.response
+
     query = db.query(Anomaly)
     
     # Apply filters
@@ -57,10 +90,30 @@ async def get_anomalies(
         query = query.filter(Anomaly.status == status)
     if severity_min is not None:
         query = query.filter(Anomaly.severity >= severity_min)
+    if model_version:
+        query = query.filter(Anomaly.model_version == model_version)
+    if bbox:
+        try:
+            query = query.filter(geo.bbox_condition(Anomaly, *geo.parse_bbox(bbox)))
+        except ValueError as e:
+            # The status filter shadows fastapi.status in this function
+            raise HTTPException(status_code=422, detail=str(e))
+    if radius_km is not None or lat is not None or lon is not None:
+        if radius_km is None or lat is None or lon is None:
+            raise HTTPException(status_code=422,
+                                detail="lat, lon and radius_km go together")
+        query = query.filter(geo.radius_condition(Anomaly, lat, lon, radius_km))
+    
+    if fast_json.FAST_JSON_ENABLED:
+        # Plain tuples from one joined query, encoded without ORM objects or per-item validation
+        rows = query.outerjoin(User, Anomaly.assigned_to_id == User.id)\
+            .with_entities(*ANOMALY_LIST_COLUMNS)\
+            .all()
+        return cached.store_body(fast_json.encode_rows(ANOMALY_LIST_FIELDS, rows))
     
     # Get results
     anomalies = query.all()
-    return [
+    return cached.store([
         {
             "id": a.id,
             "timestamp": a.timestamp,
@@ -69,16 +122,26 @@ async def get_anomalies(
             "severity": a.severity,
             "description": a.description,
             "status": a.status,
-            "assigned_to": a.assigned_to.username if a.assigned_to else None
+            "assigned_to": a.assigned_to.username if a.assigned_to else None,
+            "last_seen_at": a.last_seen_at,
+            "duration_seconds": a.duration_seconds,
+            "record_count": a.record_count,
+            "latitude": a.latitude,
+            "longitude": a.longitude
         }
         for a in anomalies
-    ]
+    ])
 
 @router.get("/{anomaly_id}", response_model=dict)
 async def get_anomaly(
+    request: Request,
     anomaly_id: int,
     db: Session = Depends(get_db)
 ):
+    cached = response_cache.lookup(request, [ANOMALIES])
+    if cached.response is not None:
+        return cached.response
+
     anomaly = db.query(Anomaly).filter(Anomaly.id == anomaly_id).first()
     if not anomaly:
         raise HTTPException(
@@ -86,7 +149,7 @@ async def get_anomaly(
             detail="Anomaly not found"
         )
     
-    return {
+    return cached.store({
         "id": anomaly.id,
         "timestamp": anomaly.timestamp,
         "location": anomaly.location,
@@ -96,8 +159,13 @@ async def get_anomaly(
         "ai_report": anomaly.ai_report,
         "status": anomaly.status,
         "assigned_to": anomaly.assigned_to.username if anomaly.assigned_to else None,
-        "resolved_at": anomaly.resolved_at
-    }
+        "resolved_at": anomaly.resolved_at,
+        "last_seen_at": anomaly.last_seen_at,
+        "duration_seconds": anomaly.duration_seconds,
+        "record_count": anomaly.record_count,
+        "latitude": anomaly.latitude,
+        "longitude": anomaly.longitude
+    })
 
 @router.put("/{anomaly_id}/status", response_model=dict)
 async def update_anomaly_status(
@@ -117,6 +185,8 @@ async def update_anomaly_status(
     anomaly.status = status
     if status == "resolved":
         anomaly.resolved_at = datetime.utcnow()
+        # Later records of the same kind start a new episode
+        episode_aggregator.forget(anomaly.id)
     
     # Create action log
     action = AnomalyAction(
@@ -127,6 +197,7 @@ async def update_anomaly_status(
     
     db.add(action)
     db.commit()
+    response_cache.invalidate(ANOMALIES)
     
     return {"message": "Anomaly status updated successfully"}
 
@@ -170,5 +241,6 @@ async def assign_anomaly(
     
     db.add(action)
     db.commit()
+    response_cache.invalidate(ANOMALIES)
     
     return {"message": "Anomaly assigned successfully"}
\ No newline at end of file
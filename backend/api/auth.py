@@ -7,9 +7,11 @@ from datetime import datetime, timedelta
 from typing import Optional
 
 from database import get_db
+from profiling import TimedRoute, timing_span
 from models import User
+from response_cache import USERS, response_cache
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 import os
 from dotenv import load_dotenv
@@ -47,17 +49,18 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    with timing_span("auth"):
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            raise credentials_exception
+        return user
 
 @router.post("/token/")
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
@@ -101,5 +104,6 @@ async def register_user(username: str, email: str, password: str, full_name: str
     db.add(user)
     db.commit()
     db.refresh(user)
+    response_cache.invalidate(USERS)
     
     return {"message": "User registered successfully"}
\ No newline at end of file
@@ -1,52 +1,90 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Request, status
+from sqlalchemy import func, insert
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
+import asyncio
+import hmac
 import json
 import os
 import requests
+import time
+import uuid
 
 from database import get_db
+from profiling import TimedRoute, add_timing
 from models import TrafficData, User, Anomaly
+from database import SessionLocal
+from metrics import INGEST_RECORDS, ML_CALL_LATENCY
+from response_cache import ANOMALIES, response_cache
+from durable_queue import RAW_TOPIC, SCORED_TOPIC
+from persister import record_anomalies, traffic_queue, traffic_row
+from ingest import INGEST_API_KEY, IngestError, ingest_batches, parse_and_validate
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+# Same port as the ML service's ML_PORT
+ML_SERVICE_URL = os.getenv("ML_SERVICE_URL", "http://ml_service:8001")
+# Seconds before a call to the ML service is given up
+ML_SERVICE_TIMEOUT = float(os.getenv("ML_SERVICE_TIMEOUT", "30"))
+# Synthetic data file shared with the ML service simulator
+TRAFFIC_DATA_FILE = os.getenv(
+    "TRAFFIC_DATA_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'synthetic_traffic_data.json')
+)
+# Records returned from the queue, like the simulator's data file
+RECENT_TRAFFIC_LIMIT = 1000
+# Records per ML service call when scoring ingested batches without the queue
+INGEST_SCORING_CHUNK = int(os.getenv("INGEST_SCORING_CHUNK", "5000"))
 
 @router.get("/", response_model=List[dict])
 async def get_traffic_data(db: Session = Depends(get_db)):
+    if traffic_queue is not None:
+        # Scoring and persistence happen in the queue pipeline; only serve the latest records
+        messages = await asyncio.get_running_loop().run_in_executor(
+            None, traffic_queue.tail, SCORED_TOPIC, RECENT_TRAFFIC_LIMIT
+        )
+        return [message.payload["record"] for message in messages]
     try:
-        # Read from the synthetic data file using relative path
-        file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'synthetic_traffic_data.json')
-        with open(file_path, 'r') as f:
+        with open(TRAFFIC_DATA_FILE, 'r') as f:
             traffic_data = json.load(f)
             
         # Send data to ML service for anomaly detection
         try:
+            start = time.perf_counter()
             ml_response = requests.post(
-                'http://ml_service:8001/detect',
-                json={"data": traffic_data}
+                f'{ML_SERVICE_URL}/detect',
+                json={"data": traffic_data},
+                timeout=ML_SERVICE_TIMEOUT
             )
+            elapsed = time.perf_counter() - start
+            ML_CALL_LATENCY.labels(endpoint="detect").observe(elapsed)
+            add_timing("ml", elapsed)
             anomalies = ml_response.json().get('anomalies', [])
             
             # Process anomalies from the response data
+            scored = []
             for i, is_anomaly in enumerate(anomalies):
                 if is_anomaly:
                     # Get detailed analysis for the anomaly
+                    start = time.perf_counter()
                     analysis = requests.post(
-                        'http://ml_service:8001/analyze',
-                        json=traffic_data[i]
+                        f'{ML_SERVICE_URL}/analyze',
+                        json=traffic_data[i],
+                        timeout=ML_SERVICE_TIMEOUT
                     ).json()
+                    elapsed = time.perf_counter() - start
+                    ML_CALL_LATENCY.labels(endpoint="analyze").observe(elapsed)
+                    add_timing("ml", elapsed)
                     
-                    # Store anomaly in database
-                    anomaly = Anomaly(
-                        location="System",
-                        anomaly_type=analysis.get('anomaly_type', 'Unknown'),
-                        severity=analysis.get('severity', 0.5),
-                        description=analysis.get('description', ''),
-                        status="detected"
-                    )
-                    db.add(anomaly)
-            
+                    scored.append((traffic_data[i], analysis))
+            scored.extend(_new_regime_changes(db))
+
+            # Merge into the open episode of each type and location, or start one
+            events = record_anomalies(db, scored)
             db.commit()
+            if events:
+                response_cache.invalidate(ANOMALIES)
             
             # Return the original traffic data for the frontend
             return traffic_data
@@ -58,4 +96,119 @@ async def get_traffic_data(db: Session = Depends(get_db)):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
-        )
\ No newline at end of file
+        )
+
+
+def _new_regime_changes(db: Session) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """(record, analysis) of the regime changes the ML service's drift monitor found after the last one recorded"""
+    start = time.perf_counter()
+    try:
+        response = requests.get(f'{ML_SERVICE_URL}/drift', timeout=ML_SERVICE_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        # The detector's anomalies are recorded all the same
+        print(f"Warning: could not fetch drift change points: {e}")
+        return []
+    ML_CALL_LATENCY.labels(endpoint="drift").observe(time.perf_counter() - start)
+    # The service reports its latest change points every time; older ones are already episodes
+    latest = db.query(func.max(Anomaly.last_seen_at)).filter(Anomaly.anomaly_type == "regime_change").scalar()
+    return [
+        (change, change) for change in response.json().get("change_points", [])
+        if change.get("timestamp") and (latest is None or datetime.fromisoformat(change["timestamp"]) > latest)
+    ]
+
+
+def _insert_traffic(records: List[Dict[str, Any]]):
+    db = SessionLocal()
+    try:
+        # Core executemany: no ORM objects or per-row flush bookkeeping
+        db.execute(insert(TrafficData), [traffic_row(record) for record in records])
+        db.commit()
+    finally:
+        db.close()
+
+
+def _score_ingested(batch_id: str, records: List[Dict[str, Any]]):
+    """Score an ingested batch with the ML service in chunks and record its anomalies"""
+    try:
+        flagged = []
+        for start in range(0, len(records), INGEST_SCORING_CHUNK):
+            chunk = records[start:start + INGEST_SCORING_CHUNK]
+            began = time.perf_counter()
+            response = requests.post(f'{ML_SERVICE_URL}/detect', json={"data": chunk}, timeout=ML_SERVICE_TIMEOUT)
+            response.raise_for_status()
+            ML_CALL_LATENCY.labels(endpoint="detect").observe(time.perf_counter() - began)
+            flagged.extend(record for record, is_anomaly in zip(chunk, response.json()["anomalies"]) if is_anomaly)
+        analyses = []
+        for start in range(0, len(flagged), INGEST_SCORING_CHUNK):
+            began = time.perf_counter()
+            response = requests.post(f'{ML_SERVICE_URL}/analyze/batch',
+                                     json={"data": flagged[start:start + INGEST_SCORING_CHUNK]},
+                                     timeout=ML_SERVICE_TIMEOUT)
+            response.raise_for_status()
+            ML_CALL_LATENCY.labels(endpoint="analyze_batch").observe(time.perf_counter() - began)
+            analyses.extend(response.json()["analyses"])
+        db = SessionLocal()
+        try:
+            events = record_anomalies(db, zip(flagged, analyses))
+            db.commit()
+        finally:
+            db.close()
+        if events:
+            response_cache.invalidate(ANOMALIES)
+        ingest_batches.update(batch_id, status="scored", anomalies=len(flagged))
+    except Exception as e:
+        print(f"Error scoring ingest batch {batch_id}: {e}")
+        ingest_batches.update(batch_id, status="failed", error=str(e))
+
+
+@router.post("/ingest", status_code=status.HTTP_202_ACCEPTED)
+async def ingest_traffic_data(request: Request, background_tasks: BackgroundTasks,
+                              x_api_key: Optional[str] = Header(None)):
+    """Bulk intake for sensors: NDJSON (one record per line) or columnar JSON (one array per field).
+
+    Rows are validated column-wise and invalid ones rejected individually. Valid rows are
+    appended to the traffic queue when it is enabled; otherwise they are inserted at once
+    and scored in the background. Poll GET /ingest/{batch_id} for progress.
+    """
+    if not INGEST_API_KEY:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Set INGEST_API_KEY to enable ingestion")
+    if not hmac.compare_digest(x_api_key or "", INGEST_API_KEY):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
+    body = await request.body()
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    batch_id = uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+    try:
+        # Parsing and validation are CPU-bound; keep them off the event loop
+        batch = await loop.run_in_executor(None, parse_and_validate, body, content_type, batch_id)
+    except IngestError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    INGEST_RECORDS.labels(outcome="rejected").inc(batch.rejected)
+    if not batch.records:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail={"message": "No valid records", "errors": batch.errors})
+
+    accepted = len(batch.records)
+    if traffic_queue is not None:
+        # Registered first, so the persister finds the batch to count its records against
+        await loop.run_in_executor(None, lambda: ingest_batches.add(
+            batch_id, status="queued", accepted=accepted, rejected=batch.rejected
+        ))
+        await loop.run_in_executor(None, traffic_queue.append, RAW_TOPIC, batch.records)
+    else:
+        await loop.run_in_executor(None, _insert_traffic, batch.records)
+        await loop.run_in_executor(None, lambda: ingest_batches.add(
+            batch_id, status="persisted", accepted=accepted, rejected=batch.rejected, persisted=accepted
+        ))
+        background_tasks.add_task(_score_ingested, batch_id, batch.records)
+    INGEST_RECORDS.labels(outcome="accepted").inc(accepted)
+    return {"batch_id": batch_id, "accepted": accepted, "rejected": batch.rejected, "errors": batch.errors}
+
+
+@router.get("/ingest/{batch_id}")
+def get_ingest_batch(batch_id: str):
+    batch = ingest_batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown or expired batch")
+    return batch
@@ -3,10 +3,13 @@ from sqlalchemy.orm import Session
 from typing import List
 
 from database import get_db
-from models import User, AuditLog
+from profiling import TimedRoute
+from models import User
+from audit import audit_sink
+from response_cache import USERS, response_cache
 from .auth import get_current_user
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 @router.get("/me", response_model=dict)
 async def get_current_user_profile(current_user: User = Depends(get_current_user)):
@@ -29,17 +32,17 @@ async def update_user_profile(
     current_user.full_name = full_name
     current_user.email = email
     
-    # Create audit log
-    audit_log = AuditLog(
+    db.commit()
+    db.refresh(current_user)
+    response_cache.invalidate(USERS)
+    
+    # Audit entries are written in batches outside the request transaction
+    await audit_sink.log(
         user_id=current_user.id,
         action="profile_updated",
         details=f"Profile updated by user"
     )
     
-    db.add(audit_log)
-    db.commit()
-    db.refresh(current_user)
-    
     return {"message": "Profile updated successfully"}
 
 @router.get("/list", response_model=List[dict])
@@ -92,16 +95,15 @@ async def update_user_role(
     # Update role
     user.role = role
     
-    # Create audit log
-    audit_log = AuditLog(
+    db.commit()
+    response_cache.invalidate(USERS)
+    
+    await audit_sink.log(
         user_id=current_user.id,
         action="role_updated",
         details=f"Updated role of user {user.username} to {role}"
     )
     
-    db.add(audit_log)
-    db.commit()
-    
     return {"message": "User role updated successfully"}
 
 @router.put("/{user_id}/status", response_model=dict)
@@ -129,15 +131,14 @@ async def update_user_status(
     # Update status
     user.is_active = is_active
     
-    # Create audit log
+    db.commit()
+    response_cache.invalidate(USERS)
+    
     status_str = "activated" if is_active else "deactivated"
-    audit_log = AuditLog(
+    await audit_sink.log(
         user_id=current_user.id,
         action="status_updated",
         details=f"User {user.username} {status_str}"
     )
     
-    db.add(audit_log)
-    db.commit()
-    
     return {"message": "User status updated successfully"}
\ No newline at end of file
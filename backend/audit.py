@@ -0,0 +1,127 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from database import SessionLocal
+from metrics import AUDIT_ENTRIES_WRITTEN, AUDIT_FLUSH_LATENCY, AUDIT_QUEUE_DEPTH
+from models import AuditLog
+from response_cache import AUDIT, response_cache
+
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "100"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_FLUSH_RETRIES = 3
+
+
+class AuditSink:
+    """Write-behind sink for AuditLog rows.
+
+    Entries are queued in memory and written by a background task in one bulk insert
+    per batch, once batch_size entries are waiting or flush_interval seconds passed
+    since the first of them. When the queue is full, log() waits for room, so a slow
+    database slows down audited requests instead of dropping entries. stop() writes
+    everything still queued. Until start() is called (or after stop()), entries are
+    written immediately.
+    """
+
+    def __init__(self, session_factory=SessionLocal, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL, max_queue: int = AUDIT_QUEUE_SIZE):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    async def start(self):
+        # Created here so they belong to the serving event loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush every queued entry and stop the background task"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def log(self, user_id: Optional[int], action: str, details: str, ip_address: Optional[str] = None):
+        entry = {
+            "user_id": user_id,
+            "action": action,
+            "details": details,
+            "ip_address": ip_address,
+            # Time of the audited action, not of the flush
+            "timestamp": datetime.utcnow()
+        }
+        if self._queue is None or self._stopping.is_set():
+            await asyncio.get_running_loop().run_in_executor(None, self._write, [entry])
+            return
+        await self._queue.put(entry)
+        AUDIT_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if batch:
+                AUDIT_QUEUE_DEPTH.set(self._queue.qsize())
+                # The write is blocking; keep it off the event loop
+                await loop.run_in_executor(None, self._write_with_retry, batch)
+            elif self._stopping.is_set() and self._queue.empty():
+                return
+
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if self._stopping.is_set():
+                # Shutting down: take what is queued without waiting for more
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+            # Wait up to one interval for the first entry so stop() is noticed, then until the batch deadline
+            timeout = self.flush_interval if deadline is None else deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                if batch:
+                    break
+                continue
+            if deadline is None:
+                deadline = loop.time() + self.flush_interval
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        start = time.perf_counter()
+        db = self.session_factory()
+        try:
+            db.bulk_insert_mappings(AuditLog, batch)
+            db.commit()
+        finally:
+            db.close()
+        response_cache.invalidate(AUDIT)
+        AUDIT_FLUSH_LATENCY.observe(time.perf_counter() - start)
+        AUDIT_ENTRIES_WRITTEN.labels(outcome="written").inc(len(batch))
+
+    def _write_with_retry(self, batch: List[Dict[str, Any]]):
+        for attempt in range(1, AUDIT_FLUSH_RETRIES + 1):
+            try:
+                self._write(batch)
+                return
+            except Exception as e:
+                print(f"Error writing {len(batch)} audit entries (attempt {attempt}): {e}")
+                time.sleep(0.5 * attempt)
+        AUDIT_ENTRIES_WRITTEN.labels(outcome="dropped").inc(len(batch))
+
+
+audit_sink = AuditSink()
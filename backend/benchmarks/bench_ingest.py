@@ -0,0 +1,114 @@
+"""Measure bulk ingest throughput in records per second.
+
+Times parsing plus validation alone, then POST /api/traffic-data/ingest through the full
+FastAPI stack with the durable queue enabled (a throwaway SQLite database and queue file),
+for NDJSON and columnar bodies. A few percent of the generated rows are invalid on purpose.
+
+Usage:
+    python benchmarks/bench_ingest.py --records 10000 50000 --output results.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_app(workdir: str):
+    # Backend modules read their configuration at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["TRAFFIC_QUEUE_PATH"] = os.path.join(workdir, "queue.db")
+    sys.path.insert(0, SERVICE_DIR)
+    import main
+    from database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    return main.app
+
+
+def generate(records: int, invalid_fraction: float = 0.02):
+    start = datetime(2025, 1, 1)
+    rows = []
+    for i in range(records):
+        row = {
+            "vehicle_count": random.randint(0, 200),
+            "average_speed": round(random.uniform(5, 90), 2),
+            "congestion_level": round(random.random(), 3),
+            "timestamp": (start + timedelta(seconds=i)).isoformat(),
+            "location": f"Location {i % 50}"
+        }
+        if random.random() < invalid_fraction:
+            row["average_speed"] = -1.0
+        rows.append(row)
+    return rows
+
+
+def ndjson_body(rows) -> bytes:
+    return "\n".join(json.dumps(row) for row in rows).encode()
+
+
+def columnar_body(rows) -> bytes:
+    return json.dumps({field: [row[field] for row in rows] for field in rows[0]}).encode()
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk traffic ingestion")
+    parser.add_argument("--records", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    app = setup_app(tempfile.mkdtemp(prefix="bench-ingest-"))
+
+    from fastapi.testclient import TestClient
+    import fast_json
+    from ingest import parse_and_validate
+
+    client = TestClient(app)
+    formats = (("ndjson", ndjson_body, "application/x-ndjson"), ("columnar", columnar_body, "application/json"))
+
+    results = []
+    print(f"{'format':<10} {'records':>8} {'validate rec/s':>15} {'endpoint rec/s':>15} {'rejected':>9}")
+    for records in args.records:
+        rows = generate(records)
+        for name, encode, content_type in formats:
+            body = encode(rows)
+            validate_s = timed(lambda: parse_and_validate(body, content_type, "bench"), args.repeat)
+            responses = []
+
+            def post():
+                response = client.post("/api/traffic-data/ingest", content=body,
+                                       headers={"Content-Type": content_type})
+                response.raise_for_status()
+                responses.append(response.json())
+
+            endpoint_s = timed(post, args.repeat)
+            rejected = responses[-1]["rejected"]
+            results.append({"format": name, "records": records, "validate_records_per_s": records / validate_s,
+                            "endpoint_records_per_s": records / endpoint_s, "rejected": rejected})
+            print(f"{name:<10} {records:>8} {records / validate_s:>15,.0f} {records / endpoint_s:>15,.0f} "
+                  f"{rejected:>9}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"decoder": "orjson" if fast_json.orjson is not None else "json", "results": results},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Compare the default and fast JSON paths of the large list endpoints.
+
+Seeds a throwaway SQLite database with N anomalies and audit log entries, then times
+GET /api/anomalies/ and GET /api/admin/audit-logs through the full FastAPI stack with
+FAST_JSON_ENABLED off and on. The response cache is disabled so every request queries
+and serializes. Also reports encode-only time for the same rows and the compressed size.
+
+Usage:
+    python benchmarks/bench_serialization.py --rows 1000 10000 100000 --output results.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_app(database_url: str):
+    # Backend modules read DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, SERVICE_DIR)
+    import main
+    from database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    return main.app
+
+
+def seed(rows: int):
+    from api.auth import create_access_token, get_password_hash
+    from database import SessionLocal
+    from models import Anomaly, AuditLog, User
+
+    db = SessionLocal()
+    try:
+        db.query(Anomaly).delete()
+        db.query(AuditLog).delete()
+        admin = db.query(User).filter(User.username == "bench_admin").first()
+        if admin is None:
+            admin = User(username="bench_admin", email="bench@example.com", full_name="Bench Admin",
+                         hashed_password=get_password_hash("bench"), role="admin")
+            db.add(admin)
+            db.commit()
+        start = datetime(2025, 1, 1)
+        db.bulk_insert_mappings(Anomaly, [
+            {
+                "timestamp": start + timedelta(seconds=i),
+                "location": f"Location {i % 50}",
+                "anomaly_type": "high_traffic_volume",
+                "severity": (i % 100) / 100,
+                "description": f"Unusually high traffic volume detected with {150 + i % 100} vehicles",
+                "status": "detected",
+                "assigned_to_id": admin.id if i % 3 == 0 else None,
+                "last_seen_at": start + timedelta(seconds=i + 60),
+                "duration_seconds": 60.0,
+                "record_count": 1 + i % 10
+            }
+            for i in range(rows)
+        ])
+        db.bulk_insert_mappings(AuditLog, [
+            {
+                "user_id": admin.id,
+                "action": "role_updated",
+                "details": f"Updated role of user user{i} to analyst",
+                "timestamp": start + timedelta(seconds=i),
+                "ip_address": "10.0.0.1"
+            }
+            for i in range(rows)
+        ])
+        db.commit()
+        return create_access_token({"sub": admin.username})
+    finally:
+        db.close()
+
+
+def time_requests(client, url: str, headers: dict, repeat: int):
+    samples = []
+    response = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers)
+        samples.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return statistics.median(samples), response
+
+
+def encode_only(rows: int, repeat: int):
+    """Encode time for the anomaly list alone: jsonable_encoder + json vs fast_json over tuples"""
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    import fast_json
+    from api.anomalies import ANOMALY_LIST_FIELDS
+
+    start = datetime(2025, 1, 1)
+    tuples = [
+        (i, start + timedelta(seconds=i), f"Location {i % 50}", "high_traffic_volume", (i % 100) / 100,
+         "Unusually high traffic volume detected", "detected", None, start + timedelta(seconds=i + 60), 60.0, 1)
+        for i in range(rows)
+    ]
+    dicts = [dict(zip(ANOMALY_LIST_FIELDS, row)) for row in tuples]
+
+    def default_path():
+        return JSONResponse(content=jsonable_encoder(dicts)).body
+
+    def fast_path():
+        return fast_json.encode_rows(ANOMALY_LIST_FIELDS, tuples)
+
+    results = {}
+    for name, fn in (("default", default_path), ("fast", fast_path)):
+        samples = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t)
+        results[name] = statistics.median(samples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark default vs fast JSON list responses")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database-url", help="Database to seed (default: temporary SQLite)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-serialization-")
+    app = setup_app(args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+
+    from fastapi.testclient import TestClient
+    import fast_json
+    from response_cache import response_cache
+
+    # Measure query + serialization on every request
+    response_cache.ttl = 0
+    client = TestClient(app)
+
+    results = []
+    print(f"{'endpoint':<14} {'rows':>8} {'default ms':>11} {'fast ms':>9} {'speedup':>8} {'bytes':>11} {'gzip bytes':>11}")
+    for rows in args.rows:
+        token = seed(rows)
+        auth = {"Authorization": f"Bearer {token}"}
+        for name, url in (("anomalies", "/api/anomalies/"), ("audit-logs", "/api/admin/audit-logs")):
+            fast_json.FAST_JSON_ENABLED = False
+            default_s, default_response = time_requests(client, url, auth, args.repeat)
+            fast_json.FAST_JSON_ENABLED = True
+            fast_s, _ = time_requests(client, url, auth, args.repeat)
+            _, compressed = time_requests(client, url, {**auth, "Accept-Encoding": "gzip"}, 1)
+            fast_json.FAST_JSON_ENABLED = False
+            body_bytes = len(default_response.content)
+            compressed_bytes = int(compressed.headers.get("content-length", len(compressed.content)))
+            results.append({
+                "endpoint": name, "rows": rows, "default_ms": default_s * 1000, "fast_ms": fast_s * 1000,
+                "body_bytes": body_bytes, "compressed_bytes": compressed_bytes
+            })
+            print(f"{name:<14} {rows:>8} {default_s * 1000:>11.1f} {fast_s * 1000:>9.1f} "
+                  f"{default_s / fast_s:>7.1f}x {body_bytes:>11} {compressed_bytes:>11}")
+        encode = encode_only(rows, args.repeat)
+        results.append({"endpoint": "encode-only", "rows": rows, "default_ms": encode["default"] * 1000,
+                         "fast_ms": encode["fast"] * 1000})
+        print(f"{'encode-only':<14} {rows:>8} {encode['default'] * 1000:>11.1f} {encode['fast'] * 1000:>9.1f} "
+              f"{encode['default'] / encode['fast']:>7.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"encoder": "orjson" if fast_json.orjson is not None else "json",
+                       "compression": "br" if fast_json.brotli is not None else "gzip",
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
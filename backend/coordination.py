@@ -0,0 +1,335 @@
+"""Coordination between backend workers (uvicorn --workers N, or several replicas).
+
+- Singleton jobs, like the queue persister, run in one worker at a time: the leader
+  holds a PostgreSQL advisory lock, or a file lock on other databases (which only
+  coordinates the workers of one host). When the leader exits, its lock is released
+  and another worker takes over within one interval.
+- Response cache invalidations are counted per tag in a shared table; every worker
+  publishes its own and applies the others' once per interval.
+- Every worker records a heartbeat with its load, listed by GET /ready.
+"""
+import asyncio
+import fcntl
+import hashlib
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import engine
+from episodes import episode_aggregator
+from models import CacheInvalidation, WorkerStatus
+from response_cache import ANOMALIES, response_cache
+
+COORDINATION_INTERVAL = float(os.getenv("COORDINATION_INTERVAL", "1.0"))
+# Directory of the file locks used when the database is not PostgreSQL
+COORDINATION_LOCK_DIR = os.getenv("COORDINATION_LOCK_DIR", tempfile.gettempdir())
+# Workers without a heartbeat for this long are reported as down, and their rows deleted after WORKER_EXPIRY_SECONDS
+WORKER_TIMEOUT_SECONDS = max(5 * COORDINATION_INTERVAL, 5.0)
+WORKER_EXPIRY_SECONDS = 3600
+
+
+class AdvisoryLock:
+    """PostgreSQL session advisory lock, held on a dedicated connection"""
+
+    def __init__(self, name: str, engine=engine):
+        self.name = name
+        self.engine = engine
+        # Advisory locks are keyed by a signed 64-bit integer
+        self.key = int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "big", signed=True)
+        self._connection = None
+
+    def acquire(self) -> bool:
+        connection = self.engine.connect()
+        try:
+            acquired = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar()
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self._connection = connection
+        return True
+
+    def held(self) -> bool:
+        """False once the connection, and with it the lock, is lost"""
+        try:
+            self._connection.execute(text("SELECT 1"))
+            self._connection.commit()
+            return True
+        except Exception:
+            return False
+
+    def release(self):
+        try:
+            self._connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            self._connection.commit()
+        except Exception:
+            pass
+        finally:
+            self._connection.close()
+            self._connection = None
+
+
+class FileLock:
+    """Exclusive flock on a file; the kernel releases it when the process exits"""
+
+    def __init__(self, name: str, directory: str = COORDINATION_LOCK_DIR):
+        self.name = name
+        # Per database, so separate deployments on one host do not share leaders
+        database = hashlib.blake2b(str(engine.url).encode(), digest_size=4).hexdigest()
+        self.path = os.path.join(directory, f"traffic-backend-{database}-{name}.lock")
+        self._file = None
+
+    def acquire(self) -> bool:
+        lock_file = open(self.path, "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        lock_file.truncate(0)
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def held(self) -> bool:
+        """False once the lock file was deleted or replaced, since another worker can then lock the new one"""
+        if self._file is None or self._file.closed:
+            return False
+        try:
+            opened, current = os.fstat(self._file.fileno()), os.stat(self.path)
+            if (opened.st_dev, opened.st_ino) != (current.st_dev, current.st_ino):
+                return False
+            # Succeeds again on a lock this file already holds, fails if it does not hold it
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def release(self):
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def leader_lock(name: str):
+    if engine.dialect.name == "postgresql":
+        return AdvisoryLock(name)
+    return FileLock(name)
+
+
+class _Singleton:
+    def __init__(self, name: str, start: Callable[[], Awaitable[Any]], stop: Callable[[], Awaitable[Any]]):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.lock = leader_lock(name)
+        self.leader = False
+
+
+class Coordinator:
+    """Leader election, cache invalidation broadcast and heartbeats of this worker.
+
+    A background task runs once per interval: it tries to become leader of singleton
+    jobs it does not run yet (and stops those whose lock was lost), then, in one
+    transaction, publishes the tags this worker invalidated, reads everybody's
+    counters and writes its heartbeat. Tags whose counters moved more than this
+    worker's own invalidations account for are invalidated locally; for anomalies
+    that also drops the in-memory index of open episodes, which another worker may
+    have extended.
+    """
+
+    def __init__(self, interval: float = COORDINATION_INTERVAL, engine=engine):
+        self.interval = interval
+        self.engine = engine
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.started_at = datetime.utcnow()
+        self.singletons: List[_Singleton] = []
+        # Load of this worker, updated by track_load
+        self.in_flight = 0
+        self.requests = 0
+        self.loop_lag_ms = 0.0
+        self.workers: List[Dict[str, Any]] = []
+        self.last_sync: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._pending: Dict[str, int] = {}
+        self._pending_lock = threading.Lock()
+        self._seen: Optional[Dict[str, int]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        response_cache.add_listener(self._invalidated)
+
+    def singleton(self, name: str, start: Callable[[], Awaitable[Any]], stop: Callable[[], Awaitable[Any]]):
+        """Run a background job in one worker only; register before start()"""
+        self.singletons.append(_Singleton(name, start, stop))
+
+    def _invalidated(self, tags: Tuple[str, ...]):
+        with self._pending_lock:
+            for tag in tags:
+                self._pending[tag] = self._pending.get(tag, 0) + 1
+
+    async def track_load(self, request, call_next):
+        """Middleware counting requests in flight and served"""
+        self.in_flight += 1
+        try:
+            return await call_next(request)
+        finally:
+            self.in_flight -= 1
+            self.requests += 1
+
+    async def start(self):
+        self._stopping = asyncio.Event()
+        # Elect and sync once right away, so a lone worker starts its jobs without waiting an interval
+        await self._elect()
+        await self._sync(requests_per_second=0.0)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the singleton jobs this worker runs and hand over their locks"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        for job in self.singletons:
+            if job.leader:
+                await self._demote(job)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._remove_worker)
+        except Exception as e:
+            print(f"Error removing worker status of {self.worker_id}: {e}")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        requests = self.requests
+        last = loop.time()
+        while not self._stopping.is_set():
+            asked = loop.time()
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            now = loop.time()
+            # How much later than asked the loop got around to waking us up
+            self.loop_lag_ms = max(0.0, (now - asked - self.interval) * 1000)
+            requests_per_second = (self.requests - requests) / (now - last)
+            requests, last = self.requests, now
+            await self._elect()
+            await self._sync(requests_per_second)
+
+    async def _elect(self):
+        loop = asyncio.get_running_loop()
+        for job in self.singletons:
+            try:
+                if job.leader:
+                    if not await loop.run_in_executor(None, job.lock.held):
+                        print(f"Worker {self.worker_id} lost the lock of {job.name}")
+                        await self._demote(job)
+                elif await loop.run_in_executor(None, job.lock.acquire):
+                    job.leader = True
+                    print(f"Worker {self.worker_id} is now running {job.name}")
+                    await job.start()
+            except Exception as e:
+                print(f"Error electing a leader for {job.name}: {e}")
+
+    async def _demote(self, job: _Singleton):
+        job.leader = False
+        try:
+            await job.stop()
+        finally:
+            await asyncio.get_running_loop().run_in_executor(None, job.lock.release)
+
+    async def _sync(self, requests_per_second: float):
+        with self._pending_lock:
+            published, self._pending = self._pending, {}
+        try:
+            changed = await asyncio.get_running_loop().run_in_executor(
+                None, self._exchange, published, requests_per_second
+            )
+        except Exception as e:
+            # Publish again next time
+            self._invalidated(tuple(tag for tag, count in published.items() for _ in range(count)))
+            self.last_error = str(e)
+            print(f"Error syncing worker {self.worker_id}: {e}")
+            return
+        self.last_sync = time.monotonic()
+        self.last_error = None
+        if changed:
+            response_cache.invalidate(*changed, notify=False)
+            if ANOMALIES in changed:
+                episode_aggregator.reset()
+
+    def _exchange(self, published: Dict[str, int], requests_per_second: float) -> List[str]:
+        """Publish invalidations, write the heartbeat and return tags invalidated by other workers"""
+        now = datetime.utcnow()
+        with self.engine.begin() as connection:
+            for tag, count in published.items():
+                self._bump(connection, tag, count, now)
+            counters = dict(connection.execute(select(CacheInvalidation.tag, CacheInvalidation.generation)).all())
+
+            status = dict(started_at=self.started_at, heartbeat_at=now, in_flight=self.in_flight,
+                          requests_per_second=requests_per_second, loop_lag_ms=self.loop_lag_ms,
+                          leader_of=",".join(job.name for job in self.singletons if job.leader))
+            if not connection.execute(update(WorkerStatus).where(WorkerStatus.worker_id == self.worker_id)
+                                      .values(**status)).rowcount:
+                connection.execute(WorkerStatus.__table__.insert().values(worker_id=self.worker_id, **status))
+            connection.execute(WorkerStatus.__table__.delete().where(
+                WorkerStatus.heartbeat_at < now - timedelta(seconds=WORKER_EXPIRY_SECONDS)
+            ))
+            rows = connection.execute(select(WorkerStatus.__table__).order_by(WorkerStatus.worker_id)).mappings().all()
+
+        self.workers = [
+            dict(row, alive=(now - row["heartbeat_at"]).total_seconds() <= WORKER_TIMEOUT_SECONDS) for row in rows
+        ]
+        seen, self._seen = self._seen, counters
+        if seen is None:
+            # Nothing cached yet when this worker starts
+            return []
+        return [tag for tag, generation in counters.items() if generation > seen.get(tag, 0) + published.get(tag, 0)]
+
+    @staticmethod
+    def _bump(connection, tag: str, count: int, now: datetime):
+        # Upsert, so workers invalidating a tag for the first time at once do not conflict
+        insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+        statement = insert(CacheInvalidation).values(tag=tag, generation=count, updated_at=now)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[CacheInvalidation.tag],
+            set_={"generation": CacheInvalidation.generation + count, "updated_at": now}
+        ))
+
+    def _remove_worker(self):
+        with self.engine.begin() as connection:
+            connection.execute(WorkerStatus.__table__.delete().where(WorkerStatus.worker_id == self.worker_id))
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "started_at": self.started_at,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "loop_lag_ms": round(self.loop_lag_ms, 1),
+            "leader_of": [job.name for job in self.singletons if job.leader]
+        }
+
+    def ready(self) -> bool:
+        """Started, and synced with the database recently"""
+        return self.last_sync is not None and time.monotonic() - self.last_sync <= WORKER_TIMEOUT_SECONDS
+
+
+coordinator = Coordinator()
@@ -0,0 +1,298 @@
+"""Durable local message queue: an append-only SQLite log with committed offsets per consumer.
+
+The ML service and the backend open the same file on a shared volume, each with its
+own copy of this module. Producers append JSON messages to a topic; every consumer
+reads its topic from its last committed offset and commits once a batch is handled,
+so after a crash it resumes (replays) from there. A stage that consumes one topic and
+produces another appends its output and commits its input offset in one transaction,
+so a batch is never handed on twice or lost in between.
+
+Usage:
+    python durable_queue.py status
+    python durable_queue.py seek --consumer persister --topic traffic.scored --offset 0
+    python durable_queue.py seek --consumer scorer --topic traffic.raw --since 2025-01-01T00:00:00
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+TRAFFIC_QUEUE_PATH = os.getenv("TRAFFIC_QUEUE_PATH", "")
+TRAFFIC_QUEUE_BATCH_SIZE = int(os.getenv("TRAFFIC_QUEUE_BATCH_SIZE", "500"))
+TRAFFIC_QUEUE_POLL_INTERVAL = float(os.getenv("TRAFFIC_QUEUE_POLL_INTERVAL", "0.5"))
+# Messages every consumer has passed are deleted once older than this; until then they can be replayed
+TRAFFIC_QUEUE_RETENTION_SECONDS = float(os.getenv("TRAFFIC_QUEUE_RETENTION_SECONDS", "86400"))
+# Failed attempts at a batch before its messages are moved to "<topic>.dead" and skipped
+TRAFFIC_QUEUE_MAX_ATTEMPTS = int(os.getenv("TRAFFIC_QUEUE_MAX_ATTEMPTS", "5"))
+
+# Generated or ingested records, and the same records with their detection result
+RAW_TOPIC = "traffic.raw"
+SCORED_TOPIC = "traffic.scored"
+
+SCHEMA = """
+-- seq is the message offset (OFFSET is an SQL keyword)
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_messages_topic_seq ON messages (topic, seq);
+CREATE TABLE IF NOT EXISTS offsets (
+    consumer TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (consumer, topic)
+);
+"""
+
+
+class Message(NamedTuple):
+    offset: int
+    payload: Dict[str, Any]
+    created_at: float
+
+
+class DurableQueue:
+    """Topics of JSON messages in one SQLite file, safe to share between processes.
+
+    Offsets increase across all topics. A consumer's position is the offset of the
+    last message it committed; it reads everything after it. Each thread uses its
+    own connection.
+    """
+
+    def __init__(self, path: str = TRAFFIC_QUEUE_PATH):
+        if not path:
+            raise ValueError("No queue path configured (TRAFFIC_QUEUE_PATH)")
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Transactions are opened explicitly, so writers take the lock up front
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            # WAL lets consumers read while a producer appends
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=FULL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def append(self, topic: str, payloads: List[Dict[str, Any]],
+               ack: Optional[Tuple[str, str, int]] = None) -> Optional[int]:
+        """Append payloads to topic; returns the offset of the last one.
+
+        With ack=(consumer, topic, offset), that commit happens in the same transaction.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            if ack is not None:
+                self._commit(connection, *ack)
+            if not payloads:
+                return None
+            connection.executemany(
+                "INSERT INTO messages (topic, payload, created_at) VALUES (?, ?, ?)",
+                [(topic, json.dumps(payload, default=str), now) for payload in payloads]
+            )
+            return connection.execute("SELECT MAX(seq) FROM messages WHERE topic = ?", (topic,)).fetchone()[0]
+
+    def read(self, topic: str, consumer: str, limit: int = TRAFFIC_QUEUE_BATCH_SIZE) -> List[Message]:
+        """Up to limit messages after the consumer's committed position"""
+        rows = self._connection().execute(
+            "SELECT seq, payload, created_at FROM messages WHERE topic = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (topic, self.position(consumer, topic), limit)
+        ).fetchall()
+        return [Message(offset, json.loads(payload), created_at) for offset, payload, created_at in rows]
+
+    def tail(self, topic: str, limit: int) -> List[Message]:
+        """The last limit messages of topic, oldest first"""
+        rows = self._connection().execute(
+            "SELECT seq, payload, created_at FROM messages WHERE topic = ? ORDER BY seq DESC LIMIT ?",
+            (topic, limit)
+        ).fetchall()
+        return [Message(offset, json.loads(payload), created_at) for offset, payload, created_at in reversed(rows)]
+
+    @staticmethod
+    def _commit(connection: sqlite3.Connection, consumer: str, topic: str, offset: int):
+        # Positions only move forward on commit; seek() moves them anywhere
+        connection.execute(
+            "INSERT INTO offsets (consumer, topic, position, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (consumer, topic) DO UPDATE SET position = excluded.position, updated_at = excluded.updated_at "
+            "WHERE excluded.position > offsets.position",
+            (consumer, topic, offset, time.time())
+        )
+
+    def commit(self, consumer: str, topic: str, offset: int):
+        with self._transaction() as connection:
+            self._commit(connection, consumer, topic, offset)
+
+    def position(self, consumer: str, topic: str) -> int:
+        row = self._connection().execute(
+            "SELECT position FROM offsets WHERE consumer = ? AND topic = ?", (consumer, topic)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def seek(self, consumer: str, topic: str, offset: Optional[int] = None, since: Optional[float] = None) -> int:
+        """Move a consumer so it next reads the message after offset, or the first one created at or after
+        since (epoch seconds); returns the new position. Used to replay."""
+        with self._transaction() as connection:
+            if since is not None:
+                row = connection.execute(
+                    "SELECT MIN(seq) FROM messages WHERE topic = ? AND created_at >= ?", (topic, since)
+                ).fetchone()
+                first = row[0] if row[0] is not None else self._end_offset(connection, topic) + 1
+                offset = first - 1
+            connection.execute(
+                "INSERT INTO offsets (consumer, topic, position, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (consumer, topic) DO UPDATE SET position = excluded.position, "
+                "updated_at = excluded.updated_at",
+                (consumer, topic, offset, time.time())
+            )
+        return offset
+
+    @staticmethod
+    def _end_offset(connection: sqlite3.Connection, topic: str) -> int:
+        row = connection.execute("SELECT MAX(seq) FROM messages WHERE topic = ?", (topic,)).fetchone()
+        return row[0] or 0
+
+    def lag(self, consumer: str, topic: str) -> int:
+        """Messages of topic the consumer has not committed yet"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM messages WHERE topic = ? AND seq > ?", (topic, self.position(consumer, topic))
+        ).fetchone()[0]
+
+    def status(self) -> Dict[str, Any]:
+        connection = self._connection()
+        topics = {
+            topic: {"messages": count, "first_offset": first, "last_offset": last}
+            for topic, count, first, last in connection.execute(
+                "SELECT topic, COUNT(*), MIN(seq), MAX(seq) FROM messages GROUP BY topic"
+            )
+        }
+        consumers = [
+            {"consumer": consumer, "topic": topic, "position": position, "lag": self.lag(consumer, topic),
+             "updated_at": datetime.utcfromtimestamp(updated_at).isoformat()}
+            for consumer, topic, position, updated_at in connection.execute(
+                "SELECT consumer, topic, position, updated_at FROM offsets ORDER BY topic, consumer"
+            ).fetchall()
+        ]
+        return {"path": self.path, "topics": topics, "consumers": consumers}
+
+    def prune(self, retention_seconds: float = TRAFFIC_QUEUE_RETENTION_SECONDS) -> int:
+        """Delete messages older than retention that every consumer of their topic has committed"""
+        cutoff = time.time() - retention_seconds
+        deleted = 0
+        with self._transaction() as connection:
+            for topic, committed in connection.execute(
+                "SELECT topic, MIN(position) FROM offsets GROUP BY topic"
+            ).fetchall():
+                deleted += connection.execute(
+                    "DELETE FROM messages WHERE topic = ? AND seq <= ? AND created_at < ?",
+                    (topic, committed, cutoff)
+                ).rowcount
+        return deleted
+
+
+async def run_consumer(queue: DurableQueue, topic: str, consumer: str,
+                       handler: Callable[[List[Message]], Optional[List[Dict[str, Any]]]],
+                       stopping: asyncio.Event, output_topic: Optional[str] = None,
+                       batch_size: int = TRAFFIC_QUEUE_BATCH_SIZE,
+                       poll_interval: float = TRAFFIC_QUEUE_POLL_INTERVAL,
+                       retryable: Tuple[type, ...] = ()):
+    """Feed batches of topic to handler until stopping is set.
+
+    handler runs in an executor. Its return value is appended to output_topic together
+    with the commit of the batch; without output_topic the batch is committed once
+    handler returns. After a failure the batch is halved until it succeeds, so a message
+    that keeps failing ends up alone and is moved to "<topic>.dead" after
+    TRAFFIC_QUEUE_MAX_ATTEMPTS attempts; the consumer is not stuck on it. Exceptions of
+    the retryable types (e.g. the database being down) are retried until they pass.
+    """
+    loop = asyncio.get_running_loop()
+    attempts = 0
+    limit = batch_size
+    while not stopping.is_set():
+        messages = await loop.run_in_executor(None, queue.read, topic, consumer, limit)
+        if not messages:
+            try:
+                await asyncio.wait_for(stopping.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        last_offset = messages[-1].offset
+        try:
+            outputs = await loop.run_in_executor(None, handler, messages)
+        except retryable as e:
+            attempts += 1
+            print(f"Error in {consumer} handling {len(messages)} messages of {topic}, retrying: {e}")
+            await asyncio.sleep(min(30.0, poll_interval * 2 ** attempts))
+            continue
+        except Exception as e:
+            print(f"Error in {consumer} handling {len(messages)} messages of {topic}: {e}")
+            if len(messages) > 1:
+                limit = max(1, len(messages) // 2)
+                continue
+            attempts += 1
+            if attempts >= TRAFFIC_QUEUE_MAX_ATTEMPTS:
+                print(f"Moving message {last_offset} of {topic} to {topic}.dead")
+                await loop.run_in_executor(None, lambda: queue.append(
+                    f"{topic}.dead", [dict(messages[0].payload, _offset=last_offset)],
+                    ack=(consumer, topic, last_offset)
+                ))
+                attempts = 0
+            else:
+                await asyncio.sleep(poll_interval * attempts)
+            continue
+        attempts = 0
+        limit = batch_size
+        if output_topic is not None:
+            await loop.run_in_executor(None, lambda: queue.append(
+                output_topic, outputs or [], ack=(consumer, topic, last_offset)
+            ))
+        else:
+            await loop.run_in_executor(None, queue.commit, consumer, topic, last_offset)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect the traffic queue or move a consumer to replay it")
+    parser.add_argument("command", choices=["status", "seek", "prune"])
+    parser.add_argument("--path", default=TRAFFIC_QUEUE_PATH or "traffic_queue.db")
+    parser.add_argument("--consumer")
+    parser.add_argument("--topic")
+    parser.add_argument("--offset", type=int, help="Replay every message after this offset")
+    parser.add_argument("--since", help="Replay messages created at or after this ISO time")
+    args = parser.parse_args()
+
+    queue = DurableQueue(args.path)
+    if args.command == "status":
+        print(json.dumps(queue.status(), indent=2))
+    elif args.command == "prune":
+        print(f"Deleted {queue.prune()} messages")
+    else:
+        if not args.consumer or not args.topic or (args.offset is None) == (args.since is None):
+            parser.error("seek needs --consumer, --topic and one of --offset or --since")
+        since = datetime.fromisoformat(args.since).timestamp() if args.since else None
+        position = queue.seek(args.consumer, args.topic, offset=args.offset, since=since)
+        print(f"{args.consumer} will read {args.topic} after offset {position}")
@@ -0,0 +1,204 @@
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import geo
+from models import Anomaly
+
+# Anomalous records of the same type and location closer together than this form one episode
+EPISODE_GAP_SECONDS = float(os.getenv("EPISODE_GAP_SECONDS", "300"))
+
+
+class _OpenEpisode:
+    """In-memory state of an episode that may still be extended"""
+
+    __slots__ = ("anomaly_id", "started_at", "last_seen_at", "severity", "record_count", "seen", "restored")
+
+    def __init__(self, anomaly_id: int, started_at: datetime, last_seen_at: datetime, severity: float,
+                 record_count: int, seen_size: int):
+        self.anomaly_id = anomaly_id
+        self.started_at = started_at
+        self.last_seen_at = last_seen_at
+        self.severity = severity
+        self.record_count = record_count
+        # Timestamps of records already counted, to drop re-sent records
+        self.seen = deque(maxlen=seen_size)
+        # Loaded from the database without its counted timestamps: records inside the span count as duplicates
+        self.restored = False
+
+    def copy(self) -> "_OpenEpisode":
+        episode = _OpenEpisode(self.anomaly_id, self.started_at, self.last_seen_at, self.severity,
+                               self.record_count, self.seen.maxlen)
+        episode.seen.extend(self.seen)
+        episode.restored = self.restored
+        return episode
+
+
+class EpisodeAggregator:
+    """Merge consecutive anomalous records into one Anomaly row per episode.
+
+    Open episodes are indexed in memory by (location, anomaly_type), so extending one
+    is a single UPDATE by primary key that carries the new severity max, duration and
+    record count. A record extends the open episode when it lies within the gap of it;
+    otherwise it starts a new episode. Records with a timestamp that was already counted
+    for the episode are treated as duplicates. Resolved anomalies are never extended.
+
+    Changes to the index are staged on the session and only applied when it commits,
+    so a rolled back transaction can be retried without its records counting as duplicates.
+    """
+
+    def __init__(self, gap_seconds: float = EPISODE_GAP_SECONDS, seen_size: int = 1024, prune_every: int = 1000):
+        self.gap = timedelta(seconds=gap_seconds)
+        self.seen_size = seen_size
+        self.prune_every = prune_every
+        self._open: Dict[Tuple[str, str], _OpenEpisode] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._since_prune = 0
+
+    def _load(self, db: Session, seen_at: datetime):
+        """Rebuild the index from the latest unresolved episode per key, e.g. after a restart.
+
+        Only episodes that a record seen at seen_at, or now, could still extend are read,
+        through the last_seen_at index, so the cost does not grow with the anomaly history.
+        """
+        since = min(seen_at, datetime.utcnow()) - self.gap
+        rows = db.query(Anomaly.id, Anomaly.location, Anomaly.anomaly_type, Anomaly.timestamp,
+                        Anomaly.last_seen_at, Anomaly.severity, Anomaly.record_count)\
+            .filter(Anomaly.last_seen_at >= since, Anomaly.status != "resolved")\
+            .all()
+        for anomaly_id, location, anomaly_type, started_at, last_seen_at, severity, record_count in rows:
+            key = (location, anomaly_type)
+            current = self._open.get(key)
+            if current is None or last_seen_at > current.last_seen_at:
+                episode = _OpenEpisode(anomaly_id, started_at, last_seen_at, severity, record_count or 1,
+                                       self.seen_size)
+                episode.restored = True
+                self._open[key] = episode
+        self._loaded = True
+
+    def _staged(self, db: Session) -> Dict[Tuple[str, str], _OpenEpisode]:
+        """Episodes changed in the session's current transaction, applied to the index on commit"""
+        key = ("episodes", id(self))
+        staged = db.info.get(key)
+        if staged is None:
+            staged = db.info[key] = {}
+            if ("episode_listeners", id(self)) not in db.info:
+                db.info[("episode_listeners", id(self))] = True
+                event.listen(db, "after_commit", self._after_commit)
+                event.listen(db, "after_transaction_end", self._after_transaction_end)
+        return staged
+
+    def _after_commit(self, db: Session):
+        staged = db.info.pop(("episodes", id(self)), None)
+        if staged:
+            with self._lock:
+                self._open.update(staged)
+
+    def _after_transaction_end(self, db: Session, transaction):
+        # Rolled back or closed without a commit: the staged changes never happened
+        if transaction.parent is None:
+            db.info.pop(("episodes", id(self)), None)
+
+    def _prune(self, now: datetime):
+        for key in [key for key, episode in self._open.items() if now - episode.last_seen_at > self.gap]:
+            del self._open[key]
+
+    def record(self, db: Session, location: str, anomaly_type: str, severity: float, description: str,
+               seen_at: Optional[datetime] = None, latitude: Optional[float] = None,
+               longitude: Optional[float] = None) -> Tuple[Optional[int], str]:
+        """Add one anomalous record; returns (anomaly id, "created" | "merged" | "duplicate").
+
+        The caller commits the session. A new row is flushed to obtain its id.
+        """
+        seen_at = seen_at or datetime.utcnow()
+        key = (location, anomaly_type)
+        staged = self._staged(db)
+        with self._lock:
+            if not self._loaded:
+                self._load(db, seen_at)
+            self._since_prune += 1
+            if self._since_prune >= self.prune_every:
+                self._since_prune = 0
+                self._prune(seen_at)
+
+            episode = staged[key] if key in staged else self._open.get(key)
+            if episode is not None and episode.started_at - self.gap <= seen_at <= episode.last_seen_at + self.gap:
+                if seen_at in episode.seen or \
+                        (episode.restored and episode.started_at <= seen_at <= episode.last_seen_at):
+                    return episode.anomaly_id, "duplicate"
+                extended = episode if key in staged else episode.copy()
+                if self._extend(db, extended, severity, description, seen_at):
+                    staged[key] = extended
+                    return episode.anomaly_id, "merged"
+
+            anomaly = Anomaly(
+                timestamp=seen_at,
+                location=location,
+                anomaly_type=anomaly_type,
+                severity=severity,
+                description=description,
+                status="detected",
+                last_seen_at=seen_at,
+                duration_seconds=0.0,
+                record_count=1,
+                latitude=latitude,
+                longitude=longitude,
+                geohash=geo.encode_optional(latitude, longitude)
+            )
+            db.add(anomaly)
+            db.flush()
+            if episode is None or seen_at >= episode.last_seen_at:
+                episode = staged[key] = _OpenEpisode(anomaly.id, seen_at, seen_at, severity, 1, self.seen_size)
+                episode.seen.append(seen_at)
+            return anomaly.id, "created"
+
+    def _extend(self, db: Session, episode: _OpenEpisode, severity: float, description: str,
+                seen_at: datetime) -> bool:
+        started_at = min(episode.started_at, seen_at)
+        last_seen_at = max(episode.last_seen_at, seen_at)
+        values = {
+            Anomaly.timestamp: started_at,
+            Anomaly.last_seen_at: last_seen_at,
+            Anomaly.duration_seconds: (last_seen_at - started_at).total_seconds(),
+            Anomaly.record_count: episode.record_count + 1
+        }
+        if severity > episode.severity:
+            # The description follows the worst record of the episode
+            values[Anomaly.severity] = severity
+            values[Anomaly.description] = description
+        updated = db.query(Anomaly)\
+            .filter(Anomaly.id == episode.anomaly_id, Anomaly.status != "resolved")\
+            .update(values, synchronize_session=False)
+        if not updated:
+            # Resolved or deleted since it was opened; the record starts a new episode
+            return False
+        episode.started_at = started_at
+        episode.last_seen_at = last_seen_at
+        episode.severity = max(episode.severity, severity)
+        episode.record_count += 1
+        episode.seen.append(seen_at)
+        return True
+
+    def reset(self):
+        """Drop the in-memory index, so it is rebuilt from the database on next use.
+
+        For episodes changed by another process, e.g. another backend worker.
+        """
+        with self._lock:
+            self._open.clear()
+            self._loaded = False
+
+    def forget(self, anomaly_id: int):
+        """Stop extending an anomaly, e.g. once it was resolved"""
+        with self._lock:
+            for key in [key for key, episode in self._open.items() if episode.anomaly_id == anomaly_id]:
+                del self._open[key]
+
+
+episode_aggregator = EpisodeAggregator()
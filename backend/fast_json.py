@@ -0,0 +1,90 @@
+import gzip
+import json
+import os
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import orjson
+except ImportError:  # Falls back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Only gzip is offered without it
+    brotli = None
+
+# Large list endpoints skip per-item validation and encode rows directly when enabled
+FAST_JSON_ENABLED = os.getenv("FAST_JSON_ENABLED", "false").lower() in ("1", "true", "yes")
+# Bodies smaller than this are sent uncompressed
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+def dumps(content: Any) -> bytes:
+    """JSON bytes for content, with datetimes as ISO 8601 like FastAPI's encoder"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def loads(body: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def encode_rows(fields: Sequence[str], rows: Iterable[Sequence[Any]]) -> bytes:
+    """JSON array of objects straight from result tuples, e.g. Query.with_entities(...).all()"""
+    return dumps([dict(zip(fields, row)) for row in rows])
+
+
+def accepted_encoding(request: Request) -> Optional[str]:
+    """Best compression the client accepts: brotli if available, then gzip"""
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def json_response(request: Request, body: bytes, status_code: int = 200, headers: Optional[Dict[str, str]] = None,
+                  compressed: Optional[Dict[str, bytes]] = None) -> Response:
+    """Response for pre-encoded JSON, compressed when large and the client accepts it.
+
+    compressed memoizes bodies per encoding, so cached responses are compressed once.
+    """
+    headers = dict(headers or {})
+    if len(body) >= COMPRESSION_MIN_BYTES:
+        headers["Vary"] = "Accept-Encoding"
+        encoding = accepted_encoding(request)
+        if encoding is not None:
+            if compressed is not None and encoding in compressed:
+                body = compressed[encoding]
+            else:
+                encoded = compress(body, encoding)
+                if compressed is not None:
+                    compressed[encoding] = encoded
+                body = encoded
+            headers["Content-Encoding"] = encoding
+            if headers.get("ETag", "").startswith('"'):
+                # Byte-for-byte different from the identity representation
+                headers["ETag"] = f"W/{headers['ETag']}"
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
@@ -0,0 +1,328 @@
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from sqlalchemy import case, select
+
+import fast_json
+import geo
+from database import SessionLocal
+from models import IngestBatch
+
+# Records accepted per request; larger batches are refused with 413
+INGEST_MAX_RECORDS = int(os.getenv("INGEST_MAX_RECORDS", "100000"))
+# Timestamps further ahead of the server clock than this are rejected
+INGEST_MAX_CLOCK_SKEW_SECONDS = float(os.getenv("INGEST_MAX_CLOCK_SKEW_SECONDS", "300"))
+# Shared secret sensors send as X-API-Key; ingestion is disabled when unset
+INGEST_API_KEY = os.getenv("INGEST_API_KEY")
+# Batch progress is kept this long for GET /ingest/{batch_id}
+INGEST_BATCH_RETENTION_SECONDS = float(os.getenv("INGEST_BATCH_RETENTION_SECONDS", "86400"))
+# Rejected rows listed in a response; the rest are only counted
+INGEST_ERRORS_REPORTED = 100
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+# Numeric fields: (required, integer, low, high), bounds inclusive
+NUMERIC_FIELDS = {
+    "vehicle_count": (True, True, 0, 10000),
+    "average_speed": (True, False, 0.0, 300.0),
+    "congestion_level": (True, False, 0.0, 1.0),
+    # Derived from the timestamp when absent
+    "time_of_day": (False, True, 0, 23),
+    # Optional position of the sensor, both or neither
+    "latitude": (False, False, -90.0, 90.0),
+    "longitude": (False, False, -180.0, 180.0)
+}
+COLUMNS = list(NUMERIC_FIELDS) + ["timestamp", "location"]
+DEFAULT_LOCATION = "System"
+# Python types a numeric field may have, as in the ML service's schema; bool is excluded although it subclasses int
+NUMBER_TYPES = frozenset((int, float))
+MAX_LOCATION_LENGTH = 100
+
+
+class IngestError(ValueError):
+    """A batch that cannot be read at all"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ValidatedBatch(NamedTuple):
+    records: List[Dict[str, Any]]
+    rejected: int
+    errors: List[Dict[str, Any]]
+
+
+def _check_size(rows: int):
+    if rows > INGEST_MAX_RECORDS:
+        raise IngestError(f"Batch has {rows} records, the limit is {INGEST_MAX_RECORDS}", status_code=413)
+
+
+def parse_ndjson(body: bytes) -> Tuple[Dict[str, list], int]:
+    """Columns of a newline-delimited JSON body, one object per line"""
+    lines = [line for line in body.split(b"\n") if line.strip()]
+    _check_size(len(lines))
+    try:
+        # One parse of the whole batch is much faster than one per line
+        rows = fast_json.loads(b"[" + b",".join(lines) + b"]")
+    except ValueError:
+        for number, line in enumerate(lines, 1):
+            try:
+                fast_json.loads(line)
+            except ValueError:
+                raise IngestError(f"Line {number} is not valid JSON")
+        raise IngestError("Body is not valid NDJSON")
+    if not all(isinstance(row, dict) for row in rows):
+        raise IngestError("Every NDJSON line must be a JSON object")
+    return {column: [row.get(column) for row in rows] for column in COLUMNS}, len(rows)
+
+
+def parse_columnar(body: bytes) -> Tuple[Dict[str, list], int]:
+    """Columns of a JSON object mapping each field to a list of values, optionally under "columns".
+
+    location may be a single string for the whole batch.
+    """
+    try:
+        document = fast_json.loads(body)
+    except ValueError:
+        raise IngestError("Body is not valid JSON")
+    if isinstance(document, dict) and isinstance(document.get("columns"), dict):
+        document = document["columns"]
+    if not isinstance(document, dict):
+        raise IngestError("Columnar batches are a JSON object of equal-length arrays")
+    for name in COLUMNS:
+        values = document.get(name)
+        if values is not None and not isinstance(values, list) and not (name == "location" and isinstance(values, str)):
+            raise IngestError(f"Column {name} must be an array")
+    lengths = {name: len(values) for name, values in document.items() if isinstance(values, list)}
+    if not lengths:
+        raise IngestError("Columnar batch has no columns")
+    rows = next(iter(lengths.values()))
+    if any(length != rows for length in lengths.values()):
+        raise IngestError(f"Columns have different lengths: {lengths}")
+    _check_size(rows)
+    columns = {column: document.get(column) for column in COLUMNS}
+    if isinstance(columns["location"], str):
+        columns["location"] = [columns["location"]] * rows
+    return columns, rows
+
+
+def _flat_array(name: str, values: list) -> np.ndarray:
+    """values as a one-dimensional array; nested arrays make the whole batch unreadable"""
+    try:
+        array = np.array(values)
+    except ValueError:
+        raise IngestError(f"Column {name} must be an array of values, not of arrays")
+    if array.ndim != 1:
+        raise IngestError(f"Column {name} must be an array of values, not of arrays")
+    return array
+
+
+def _numeric(name: str, values: list) -> Tuple[np.ndarray, np.ndarray]:
+    """values as float64 with NaN for nulls, and a mask of values that are not numbers"""
+    # Exact types, so booleans, which NumPy would convert, are not let through
+    if NUMBER_TYPES.issuperset(map(type, values)):
+        return _flat_array(name, values).astype(np.float64), np.zeros(len(values), dtype=bool)
+    _flat_array(name, values)
+    # Nulls or non-numbers present: only then look at each value
+    result = np.full(len(values), np.nan)
+    bad = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            result[i] = value
+        else:
+            bad[i] = True
+    return result, bad
+
+
+def _timestamps(values: list) -> Tuple[np.ndarray, np.ndarray]:
+    """values (ISO 8601 strings or epoch seconds) as datetime64[us], and a mask of unparseable ones"""
+    array = _flat_array("timestamp", values)
+    if array.dtype.kind in "iuf" and NUMBER_TYPES.issuperset(map(type, values)):
+        return (array * 1e6).astype(np.int64).astype("datetime64[us]"), np.zeros(len(values), dtype=bool)
+    if array.dtype.kind == "U":
+        try:
+            return array.astype("datetime64[us]"), np.zeros(len(values), dtype=bool)
+        except ValueError:
+            pass
+    result = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[us]")
+    bad = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            if isinstance(value, str):
+                result[i] = np.datetime64(value, "us")
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                result[i] = np.datetime64(int(value * 1e6), "us")
+            else:
+                bad[i] = True
+        except ValueError:
+            bad[i] = True
+    return result, bad
+
+
+def validate(columns: Dict[str, list], rows: int, batch_id: str) -> ValidatedBatch:
+    """Check every column at once; rows failing any check are rejected, the rest become records.
+
+    Records carry the batch id and a naive ISO 8601 timestamp, like the simulator's.
+    """
+    valid = np.ones(rows, dtype=bool)
+    errors: List[Dict[str, Any]] = []
+
+    def reject(mask: np.ndarray, field: str, message: str):
+        nonlocal valid
+        # Each row is reported once, for its first failed check
+        new = mask & valid
+        if new.any():
+            room = INGEST_ERRORS_REPORTED - len(errors)
+            errors.extend({"row": int(row), "field": field, "error": message} for row in np.flatnonzero(new)[:room])
+            valid &= ~mask
+
+    values = {}
+    for name, (required, integer, low, high) in NUMERIC_FIELDS.items():
+        column = columns.get(name)
+        if column is None:
+            if required:
+                reject(np.ones(rows, dtype=bool), name, "missing")
+            values[name] = np.full(rows, np.nan)
+            continue
+        array, bad = _numeric(name, column)
+        reject(bad, name, "not a number")
+        if required:
+            reject(np.isnan(array), name, "missing")
+        # NaN compares false, so nulls in optional fields pass these checks
+        reject((array < low) | (array > high), name, f"outside [{low}, {high}]")
+        if integer:
+            reject(np.floor(array) < array, name, "not an integer")
+        values[name] = array
+
+    reject(np.isnan(values["latitude"]) != np.isnan(values["longitude"]), "longitude",
+           "latitude and longitude must be given together")
+
+    if columns.get("timestamp") is None:
+        reject(np.ones(rows, dtype=bool), "timestamp", "missing")
+        timestamps = np.full(rows, np.datetime64("NaT"), dtype="datetime64[us]")
+    else:
+        timestamps, bad = _timestamps(columns["timestamp"])
+        reject(bad | np.isnat(timestamps), "timestamp", "not an ISO 8601 time or epoch seconds")
+        latest = np.datetime64(int((time.time() + INGEST_MAX_CLOCK_SKEW_SECONDS) * 1e6), "us")
+        reject(timestamps > latest, "timestamp", "in the future")
+
+    locations = columns.get("location")
+    if locations is None:
+        locations = [DEFAULT_LOCATION] * rows
+    else:
+        locations = [DEFAULT_LOCATION if location is None else location for location in locations]
+        reject(np.array([not isinstance(location, str) or len(location) > MAX_LOCATION_LENGTH
+                         for location in locations], dtype=bool),
+               "location", f"not a string of at most {MAX_LOCATION_LENGTH} characters")
+
+    index = np.flatnonzero(valid)
+    timestamps = timestamps[index]
+    time_of_day = values["time_of_day"][index]
+    hours = timestamps.astype("datetime64[h]").astype(np.int64) % 24
+    time_of_day = np.where(np.isnan(time_of_day), hours, time_of_day)
+    latitudes = values["latitude"][index]
+    longitudes = values["longitude"][index]
+    located = ~np.isnan(latitudes)
+    geohashes = np.full(len(index), None, dtype=object)
+    if located.any():
+        geohashes[located] = geo.encode_array(latitudes[located], longitudes[located])
+    latitudes = np.where(located, latitudes, None).tolist()
+    longitudes = np.where(located, longitudes, None).tolist()
+    records = [
+        {
+            "vehicle_count": vehicle_count,
+            "average_speed": average_speed,
+            "congestion_level": congestion_level,
+            "time_of_day": hour,
+            "timestamp": timestamp,
+            "location": locations[row],
+            "latitude": latitude,
+            "longitude": longitude,
+            "geohash": geohash,
+            "batch_id": batch_id
+        }
+        for row, vehicle_count, average_speed, congestion_level, hour, timestamp, latitude, longitude, geohash in zip(
+            index.tolist(),
+            values["vehicle_count"][index].astype(np.int64).tolist(),
+            values["average_speed"][index].tolist(),
+            values["congestion_level"][index].tolist(),
+            time_of_day.astype(np.int64).tolist(),
+            np.datetime_as_string(timestamps, unit="us").tolist(),
+            latitudes,
+            longitudes,
+            geohashes.tolist()
+        )
+    ]
+    return ValidatedBatch(records, rows - len(records), errors)
+
+
+def parse_and_validate(body: bytes, content_type: str, batch_id: str) -> ValidatedBatch:
+    if content_type in NDJSON_CONTENT_TYPES:
+        columns, rows = parse_ndjson(body)
+    elif content_type in ("application/json", ""):
+        columns, rows = parse_columnar(body)
+    else:
+        raise IngestError(f"Unsupported content type {content_type}; send NDJSON or columnar JSON", status_code=415)
+    if rows == 0:
+        raise IngestError("Batch has no records")
+    return validate(columns, rows, batch_id)
+
+
+class IngestBatches:
+    """Progress of ingest batches by id for GET /ingest/{batch_id}.
+
+    Kept in the ingest_batches table, so any worker can answer for a batch accepted by
+    another, and the persister counts records in the transaction that writes them.
+    """
+
+    def __init__(self, session_factory=SessionLocal, retention_seconds: float = INGEST_BATCH_RETENTION_SECONDS):
+        self.session_factory = session_factory
+        self.retention = timedelta(seconds=retention_seconds)
+
+    def add(self, batch_id: str, **info):
+        db = self.session_factory()
+        try:
+            db.query(IngestBatch).filter(IngestBatch.created_at < datetime.utcnow() - self.retention)\
+                .delete(synchronize_session=False)
+            db.add(IngestBatch(batch_id=batch_id, **info))
+            db.commit()
+        finally:
+            db.close()
+
+    def update(self, batch_id: str, **info):
+        db = self.session_factory()
+        try:
+            db.query(IngestBatch).filter(IngestBatch.batch_id == batch_id).update(info, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def add_persisted(self, db, counts: Dict[str, int]):
+        """Count records of batches written in db's transaction; the caller commits"""
+        for batch_id, count in counts.items():
+            persisted = IngestBatch.persisted + count
+            db.query(IngestBatch).filter(IngestBatch.batch_id == batch_id).update({
+                IngestBatch.persisted: persisted,
+                IngestBatch.status: case(
+                    ((persisted >= IngestBatch.accepted) & (IngestBatch.status != "failed"), "persisted"),
+                    else_=IngestBatch.status
+                )
+            }, synchronize_session=False)
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            row = db.execute(select(IngestBatch.__table__).where(IngestBatch.batch_id == batch_id)).mappings().first()
+        finally:
+            db.close()
+        return dict(row) if row is not None else None
+
+
+ingest_batches = IngestBatches()
@@ -1,10 +1,46 @@
+from sqlalchemy import inspect
+
 from database import Base, engine
 from models import User, Anomaly, AnomalyAction, AuditLog
 
+def upgrade_tables(bind=engine):
+    """Add the columns and indexes that tables created by an older version lack.
+
+    create_all only creates missing tables, so columns added to existing ones later
+    (episodes, queue offsets, coordinates) are added here. Safe to run repeatedly.
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+                added.append(f"{table.name}.{column.name}")
+                # ADD COLUMN cannot carry UNIQUE on every database; a unique index does the same
+                if column.unique and not column.index:
+                    connection.exec_driver_sql(
+                        f"CREATE UNIQUE INDEX uq_{table.name}_{column.name} ON {table.name} ({column.name})"
+                    )
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+    return added
+
 def init_database():
     print("Creating database tables...")
     Base.metadata.create_all(bind=engine)
+    added = upgrade_tables()
+    if added:
+        print(f"Added columns: {', '.join(added)}")
     print("Database tables created successfully!")
 
 if __name__ == "__main__":
-    init_database()
\ No newline at end of file
+    init_database()
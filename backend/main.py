@@ -1,11 +1,21 @@
 from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import List, Optional
 import uvicorn
 
+from alerts import alert_dispatcher
+from audit import audit_sink
+from coordination import coordinator
+from database import engine
+from metrics import instrument_engine, mark_worker_exited, metrics_response, record_request_metrics
+from persister import traffic_persister
+from profiling import PROFILING_ENABLED, request_profiler, server_timing_middleware
+
 app = FastAPI(
     title="Traffic Anomaly Detection API",
     description="API for detecting and reporting traffic anomalies using AI/ML",
@@ -21,6 +31,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if PROFILING_ENABLED:
+    # Registered before the metrics middleware so they run inside it and can read its DB stats
+    app.middleware("http")(server_timing_middleware)
+    app.middleware("http")(request_profiler)
+app.middleware("http")(record_request_metrics)
+app.middleware("http")(coordinator.track_load)
+instrument_engine(engine)
+
 # API routes will be included from separate modules
 from api import auth, anomalies, users, admin, traffic_data
 
@@ -31,6 +49,56 @@ app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 app.include_router(traffic_data.router, prefix="/api/traffic-data", tags=["traffic-data"])
 
+@app.on_event("startup")
+async def start_audit_sink():
+    await audit_sink.start()
+
+if traffic_persister is not None:
+    # Scored records arrive through the durable queue shared with the ML service; one worker consumes them
+    coordinator.singleton("traffic-persister", traffic_persister.start, traffic_persister.stop)
+
+# Every worker stages recorded anomalies in the alert outbox; one sends them, so deduplication and rate limits are shared
+coordinator.singleton("alert-dispatcher", alert_dispatcher.start, alert_dispatcher.stop)
+
+@app.on_event("startup")
+async def start_coordinator():
+    # Starts the singleton jobs if this worker becomes their leader
+    await coordinator.start()
+
+@app.on_event("shutdown")
+async def flush_audit_sink():
+    # Write out every queued audit entry before the process exits
+    await audit_sink.stop()
+
+@app.on_event("shutdown")
+async def stop_coordinator():
+    # Stops the singleton jobs this worker runs, so another worker takes them over
+    await coordinator.stop()
+
+@app.on_event("shutdown")
+def remove_worker_metrics():
+    mark_worker_exited()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+@app.get("/health", include_in_schema=False)
+async def health():
+    # Liveness: answering at all means this worker's event loop is running
+    return coordinator.health()
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    # Readiness: this worker synced with the database recently; lists the load of every worker
+    body = {
+        "ready": coordinator.ready(),
+        "worker": coordinator.health(),
+        "error": coordinator.last_error,
+        "workers": coordinator.workers
+    }
+    return JSONResponse(content=jsonable_encoder(body), status_code=200 if body["ready"] else 503)
+
 @app.get("/")
 async def root():
     return {"message": "Traffic Anomaly Detection API"}
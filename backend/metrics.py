@@ -0,0 +1,170 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, \
+    multiprocess
+from starlette.routing import Match
+from sqlalchemy import event
+
+# Each worker process counts in its own registry. With several workers, set this to an empty
+# directory (cleared before they start) where every worker writes its samples, so /metrics sums them
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+REQUEST_LATENCY = Histogram(
+    "backend_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"]
+)
+DB_QUERY_LATENCY = Histogram(
+    "backend_db_query_duration_seconds",
+    "Latency of individual SQL statements",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "backend_db_queries_per_request",
+    "SQL statements executed while serving one request",
+    ["route"],
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "backend_db_time_per_request_seconds",
+    "Total time spent in SQL statements while serving one request",
+    ["route"]
+)
+ML_CALL_LATENCY = Histogram(
+    "backend_ml_service_call_duration_seconds",
+    "Latency of calls to the ML service",
+    ["endpoint"]
+)
+ANOMALIES_RECORDED = Counter(
+    "backend_anomalies_recorded_total",
+    "Anomaly rows written by type",
+    ["anomaly_type"]
+)
+RESPONSE_CACHE_REQUESTS = Counter(
+    "backend_response_cache_requests_total",
+    "Cacheable GET requests by outcome (hit, miss, not_modified)",
+    ["route", "outcome"]
+)
+AUDIT_QUEUE_DEPTH = Gauge("backend_audit_queue_depth", "Audit entries waiting to be written",
+                          multiprocess_mode="livesum")
+AUDIT_ENTRIES_WRITTEN = Counter(
+    "backend_audit_entries_total",
+    "Audit entries flushed to the database",
+    ["outcome"]
+)
+AUDIT_FLUSH_LATENCY = Histogram(
+    "backend_audit_flush_duration_seconds",
+    "Time to write one batch of audit entries"
+)
+QUEUE_LAG = Gauge(
+    "backend_queue_consumer_lag_messages",
+    "Messages of a queue topic not yet committed by a consumer",
+    ["consumer", "topic"],
+    multiprocess_mode="livemax"
+)
+TRAFFIC_RECORDS_PERSISTED = Counter(
+    "backend_traffic_records_persisted_total",
+    "Scored traffic records written from the queue"
+)
+INGEST_RECORDS = Counter(
+    "backend_ingest_records_total",
+    "Records received by the bulk ingest endpoint by outcome (accepted, rejected)",
+    ["outcome"]
+)
+
+ALERT_EVENTS = Counter(
+    "backend_alert_events_total",
+    "Recorded anomalies seen by the alert dispatcher by outcome (matched, duplicate)",
+    ["outcome"]
+)
+ALERTS_SENT = Counter(
+    "backend_alerts_sent_total",
+    "Alerts delivered to at least one sink by rule and kind (single, digest)",
+    ["rule", "kind"]
+)
+ALERT_SINK_ERRORS = Counter(
+    "backend_alert_sink_errors_total",
+    "Failed alert deliveries by sink",
+    ["sink"]
+)
+
+
+class RequestDBStats:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Per-request accumulator, filled in by the engine event hooks
+_request_db_stats: ContextVar[Optional[RequestDBStats]] = ContextVar("request_db_stats", default=None)
+
+
+def current_db_stats() -> Optional[RequestDBStats]:
+    return _request_db_stats.get()
+
+
+def instrument_engine(engine):
+    """Time every SQL statement and attribute it to the request being served"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        DB_QUERY_LATENCY.observe(elapsed)
+        stats = _request_db_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += elapsed
+
+
+def route_template(request: Request) -> str:
+    """Route path template for labels, so /items/1 and /items/2 share a series"""
+    route = request.scope.get("route")
+    if route is None:
+        for candidate in request.app.routes:
+            match, _ = candidate.matches(request.scope)
+            if match == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", "unmatched")
+
+
+async def record_request_metrics(request: Request, call_next):
+    stats = RequestDBStats()
+    token = _request_db_stats.set(stats)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        _request_db_stats.reset(token)
+        route_path = route_template(request)
+        REQUEST_LATENCY.labels(
+            method=request.method,
+            route=route_path,
+            status=str(status_code)
+        ).observe(time.perf_counter() - start)
+        DB_QUERIES_PER_REQUEST.labels(route=route_path).observe(stats.queries)
+        DB_TIME_PER_REQUEST.labels(route=route_path).observe(stats.seconds)
+
+
+def metrics_response() -> Response:
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=PROMETHEUS_MULTIPROC_DIR)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_exited():
+    """Drop this worker's live gauges from the shared metrics"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid(), PROMETHEUS_MULTIPROC_DIR)
@@ -22,15 +22,25 @@ class Anomaly(Base):
     __tablename__ = "anomalies"
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow)  # Start of the episode
     location = Column(String)
     anomaly_type = Column(String)
-    severity = Column(Float)
+    severity = Column(Float)  # Highest severity seen in the episode
     description = Column(Text)
     ai_report = Column(Text)
     status = Column(String)  # detected, investigating, resolved
     assigned_to_id = Column(Integer, ForeignKey("users.id"))
     resolved_at = Column(DateTime, nullable=True)
+    # Consecutive anomalous records merged into this row, see episodes.py
+    last_seen_at = Column(DateTime, nullable=True, index=True)
+    duration_seconds = Column(Float, default=0.0)
+    record_count = Column(Integer, default=1)
+    # Model that produced the anomaly when it was written by a backfill (ml_service/backfill.py)
+    model_version = Column(String, nullable=True, index=True)
+    # Where the episode started, when its records carry coordinates; geohash serves area queries, see geo.py
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String(12), nullable=True, index=True)
 
     assigned_to = relationship("User", back_populates="anomalies")
     actions = relationship("AnomalyAction", back_populates="anomaly")
@@ -55,6 +65,11 @@ class TrafficData(Base):
     congestion_level = Column(Float)
     time_of_day = Column(Integer)
     timestamp = Column(DateTime)
+    # Offset of the scored queue message the row was written from, so replays skip it
+    queue_offset = Column(Integer, unique=True, nullable=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String(12), nullable=True, index=True)
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
@@ -66,4 +81,44 @@ class AuditLog(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     ip_address = Column(String)
 
-    user = relationship("User", back_populates="audit_logs")
\ No newline at end of file
+    user = relationship("User", back_populates="audit_logs")
+
+class CacheInvalidation(Base):
+    __tablename__ = "cache_invalidations"
+
+    # Response cache tag and how often any worker invalidated it
+    tag = Column(String, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class AlertOutbox(Base):
+    __tablename__ = "alert_outbox"
+
+    # Recorded anomalies waiting for the alert dispatcher, written with the anomalies themselves
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event = Column(Text, nullable=False)  # JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class IngestBatch(Base):
+    __tablename__ = "ingest_batches"
+
+    # Progress of a batch posted to /ingest, shared by every worker
+    batch_id = Column(String, primary_key=True)
+    status = Column(String, nullable=False)  # queued, persisted, scored or failed
+    accepted = Column(Integer, nullable=False, default=0)
+    rejected = Column(Integer, nullable=False, default=0)
+    persisted = Column(Integer, nullable=False, default=0)
+    anomalies = Column(Integer)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class WorkerStatus(Base):
+    __tablename__ = "worker_status"
+
+    worker_id = Column(String, primary_key=True)  # host:pid
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime, index=True)
+    in_flight = Column(Integer)
+    requests_per_second = Column(Float)
+    loop_lag_ms = Column(Float)
+    leader_of = Column(String)  # comma-separated singleton jobs this worker runs
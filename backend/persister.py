@@ -0,0 +1,144 @@
+import asyncio
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.exc import OperationalError
+
+import geo
+from alerts import alert_dispatcher
+from database import SessionLocal
+from durable_queue import SCORED_TOPIC, TRAFFIC_QUEUE_PATH, DurableQueue, Message, run_consumer
+from episodes import episode_aggregator
+from ingest import ingest_batches
+from metrics import ANOMALIES_RECORDED, QUEUE_LAG, TRAFFIC_RECORDS_PERSISTED
+from models import TrafficData
+from response_cache import ANOMALIES, response_cache
+
+PERSISTER = "persister"
+
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def traffic_row(record: Dict[str, Any], **extra) -> Dict[str, Any]:
+    """TrafficData column values of a traffic record"""
+    return dict(
+        vehicle_count=record.get("vehicle_count"),
+        average_speed=record.get("average_speed"),
+        congestion_level=record.get("congestion_level"),
+        time_of_day=record.get("time_of_day"),
+        timestamp=_parse_timestamp(record.get("timestamp")),
+        latitude=record.get("latitude"),
+        longitude=record.get("longitude"),
+        # Ingested records arrive with their geohash already computed for the whole batch
+        geohash=record.get("geohash") or geo.encode_optional(record.get("latitude"), record.get("longitude")),
+        **extra
+    )
+
+
+def record_anomalies(db, scored: Iterable[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """Merge (record, analysis) pairs into their episodes.
+
+    Returns an alert event for each pair that was not a duplicate, and stages them for
+    the alert dispatcher in the same transaction, so they alert once it commits.
+    """
+    events = []
+    for record, analysis in scored:
+        analysis = analysis or {}
+        event = dict(
+            location=record.get('location', "System"),
+            anomaly_type=analysis.get('anomaly_type', 'Unknown'),
+            severity=analysis.get('severity', 0.5),
+            description=analysis.get('description', ''),
+            latitude=record.get('latitude'),
+            longitude=record.get('longitude')
+        )
+        anomaly_id, outcome = episode_aggregator.record(
+            db, seen_at=_parse_timestamp(record.get('timestamp')), **event
+        )
+        if outcome != "duplicate":
+            ANOMALIES_RECORDED.labels(anomaly_type=event["anomaly_type"]).inc()
+            event.update(anomaly_id=anomaly_id, outcome=outcome, timestamp=record.get('timestamp'))
+            events.append(event)
+    alert_dispatcher.stage(db, events)
+    return events
+
+
+def scored_anomalies(messages: List[Message]) -> Iterable[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """(record, analysis) of the detector's anomalies and of the regime changes found by the drift monitor"""
+    for message in messages:
+        record = message.payload["record"]
+        if message.payload["is_anomaly"]:
+            yield record, message.payload.get("analysis")
+        for change in message.payload.get("changes", ()):
+            yield record, change
+
+
+class TrafficPersister:
+    """Persister stage: writes batches of the scored topic to the database.
+
+    Every record becomes a TrafficData row and anomalous ones are merged into their
+    episode, all in one transaction per batch; the batch is committed on the queue
+    afterwards. Replayed messages (after a crash in between, or a seek) are skipped:
+    traffic rows remember their queue offset, and episodes drop repeated anomalies.
+    """
+
+    def __init__(self, queue: DurableQueue, session_factory=SessionLocal):
+        self.queue = queue
+        self.session_factory = session_factory
+        self._stopping: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        QUEUE_LAG.labels(consumer=PERSISTER, topic=SCORED_TOPIC).set_function(
+            lambda: queue.lag(PERSISTER, SCORED_TOPIC)
+        )
+
+    async def start(self):
+        self._stopping = asyncio.Event()
+        # An unreachable database is waited out; only records that fail on their own are set aside
+        self._task = asyncio.create_task(run_consumer(self.queue, SCORED_TOPIC, PERSISTER, self.persist,
+                                                      self._stopping, retryable=(OperationalError,)))
+
+    async def stop(self):
+        """Finish the batch being written and stop"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    def persist(self, messages: List[Message]):
+        db = self.session_factory()
+        try:
+            written = {offset for offset, in db.query(TrafficData.queue_offset).filter(
+                TrafficData.queue_offset.between(messages[0].offset, messages[-1].offset)
+            )}
+            messages = [message for message in messages if message.offset not in written]
+            db.bulk_insert_mappings(TrafficData, [
+                traffic_row(message.payload["record"], queue_offset=message.offset) for message in messages
+            ])
+            events = record_anomalies(db, scored_anomalies(messages))
+            # Counted with the rows, so a replayed batch is not counted twice
+            ingest_batches.add_persisted(db, Counter(
+                message.payload["record"]["batch_id"] for message in messages
+                if "batch_id" in message.payload["record"]
+            ))
+            db.commit()
+        except Exception:
+            # Also drops the episode changes staged for this batch, so its retry merges them again
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        TRAFFIC_RECORDS_PERSISTED.inc(len(messages))
+        try:
+            if events:
+                response_cache.invalidate(ANOMALIES)
+        except Exception as e:
+            # The batch is committed; failing it now would only replay it as duplicates
+            print(f"Error announcing persisted batch: {e}")
+
+
+traffic_queue = DurableQueue(TRAFFIC_QUEUE_PATH) if TRAFFIC_QUEUE_PATH else None
+traffic_persister = TrafficPersister(traffic_queue) if traffic_queue is not None else None
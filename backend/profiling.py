@@ -0,0 +1,262 @@
+import asyncio
+import cProfile
+import functools
+import io
+import itertools
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+
+from metrics import current_db_stats, route_template
+
+# Profiling endpoints and Server-Timing headers are off unless explicitly enabled
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+MAX_SAMPLING_SECONDS = 60.0
+
+
+class RequestTimings:
+    def __init__(self):
+        self.spans: Dict[str, float] = {}
+        # perf_counter timestamps of request milestones
+        self.marks: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def add_timing(name: str, seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def mark(name: str):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.marks[name] = time.perf_counter()
+
+
+@contextmanager
+def timing_span(name: str):
+    """Attribute the time spent in the block to a Server-Timing entry of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, time.perf_counter() - start)
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that separates endpoint time from response serialization time.
+
+    Everything between the endpoint returning and the route handler producing the
+    response is validation against response_model plus JSON rendering.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def timed_endpoint(*args, **kw):
+                try:
+                    with timing_span("endpoint"):
+                        return await endpoint(*args, **kw)
+                finally:
+                    mark("endpoint_end")
+        else:
+            @functools.wraps(endpoint)
+            def timed_endpoint(*args, **kw):
+                try:
+                    with timing_span("endpoint"):
+                        return endpoint(*args, **kw)
+                finally:
+                    mark("endpoint_end")
+        super().__init__(path, timed_endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Request):
+            response = await handler(request)
+            mark("handler_end")
+            return response
+
+        return timed_handler
+
+
+class ProfileResult:
+    def __init__(self, profile_id: int, route: str, path: str, duration: float, profiler: cProfile.Profile):
+        self.id = profile_id
+        self.route = route
+        self.path = path
+        self.duration = duration
+        self.created_at = datetime.utcnow()
+        self.profiler = profiler
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "route": self.route,
+            "path": self.path,
+            "duration_ms": self.duration * 1000,
+            "created_at": self.created_at
+        }
+
+    def text(self, limit: int = 50) -> str:
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+    def to_bytes(self) -> bytes:
+        """Binary pstats format, as written by Stats.dump_stats and read by snakeviz or flameprof"""
+        return marshal.dumps(pstats.Stats(self.profiler).stats)
+
+
+class RequestProfiler:
+    """Profile the next N requests to a route with cProfile.
+
+    cProfile hooks the event loop thread, so work done concurrently for other requests
+    while a profiled request is in flight also shows up in its profile.
+    """
+
+    def __init__(self, max_results: int = 50):
+        self._lock = threading.Lock()
+        self._armed: Dict[str, int] = {}
+        self._ids = itertools.count(1)
+        self._active = False
+        self.results = deque(maxlen=max_results)
+
+    def arm(self, route: str, count: int):
+        with self._lock:
+            self._armed[route] = count
+
+    def armed(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._armed)
+
+    def _claim(self, request: Request) -> Optional[str]:
+        with self._lock:
+            # Only one cProfile session can be active per interpreter at a time
+            if self._active or not self._armed:
+                return None
+            for route in (request.url.path, route_template(request)):
+                if self._armed.get(route, 0) > 0:
+                    self._armed[route] -= 1
+                    if self._armed[route] == 0:
+                        del self._armed[route]
+                    self._active = True
+                    return route
+        return None
+
+    async def __call__(self, request: Request, call_next):
+        route = self._claim(request)
+        if route is None:
+            return await call_next(request)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            return await call_next(request)
+        finally:
+            profiler.disable()
+            with self._lock:
+                self._active = False
+                self.results.append(
+                    ProfileResult(next(self._ids), route, request.url.path, time.perf_counter() - start, profiler)
+                )
+
+    def get(self, profile_id: int) -> Optional[ProfileResult]:
+        for result in self.results:
+            if result.id == profile_id:
+                return result
+        return None
+
+
+class SamplingProfiler:
+    """Low-overhead wall-clock profiler that samples the stacks of every thread.
+
+    Output is in the collapsed stack format ("frame;frame;frame count") consumed by
+    flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def run(self, seconds: float, interval: float = 0.005) -> Counter:
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A sampling session is already running")
+        try:
+            own_thread = threading.get_ident()
+            stacks = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    stacks[_collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+                time.sleep(interval)
+            return stacks
+        finally:
+            self._lock.release()
+
+
+def _collapse(thread_name: str, frame) -> str:
+    frames: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+def format_collapsed(stacks: Counter) -> str:
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+
+
+async def server_timing_middleware(request: Request, call_next):
+    """Attach a per-request Server-Timing breakdown (auth, db, ml, endpoint, serialize)"""
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _request_timings.reset(token)
+    end = time.perf_counter()
+
+    spans = dict(timings.spans)
+    db_stats = current_db_stats()
+    if db_stats is not None:
+        spans["db"] = db_stats.seconds
+    if "endpoint_end" in timings.marks and "handler_end" in timings.marks:
+        # Between the endpoint returning and the handler finishing, FastAPI validates and renders the response
+        spans["serialize"] = timings.marks["handler_end"] - timings.marks["endpoint_end"]
+    spans["total"] = end - start
+    response.headers["Server-Timing"] = ", ".join(
+        f"{name};dur={seconds * 1000:.2f}" for name, seconds in spans.items()
+    )
+    return response
+
+
+request_profiler = RequestProfiler()
+sampling_profiler = SamplingProfiler()
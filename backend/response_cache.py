@@ -0,0 +1,195 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import fast_json
+from metrics import RESPONSE_CACHE_REQUESTS, route_template
+
+# Seconds a cached response may be served; bounds staleness for changes that are not invalidated explicitly
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+# Invalidation tags: what a cached response was built from
+ANOMALIES = "anomalies"
+USERS = "users"
+AUDIT = "audit"
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "last_modified", "generations", "expires_at", "compressed")
+
+    def __init__(self, body: bytes, etag: str, last_modified: float, generations: Tuple[int, ...], expires_at: float):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.generations = generations
+        self.expires_at = expires_at
+        # Compressed bodies by content encoding, filled on first use
+        self.compressed: Dict[str, bytes] = {}
+
+
+class CacheLookup:
+    """Result of ResponseCache.lookup: either a response to return or a slot to store one in"""
+
+    def __init__(self, cache: "ResponseCache", request: Request, key: tuple, tags: Tuple[str, ...],
+                 generations: Tuple[int, ...], last_modified: float, response: Optional[Response]):
+        self.cache = cache
+        self.request = request
+        self.key = key
+        self.tags = tags
+        self.generations = generations
+        self.last_modified = last_modified
+        self.response = response
+
+    def store(self, payload: Any) -> Response:
+        """Render the payload once, cache the bytes and return them (or a 304 if the client has them)"""
+        if fast_json.FAST_JSON_ENABLED:
+            return self.store_body(fast_json.dumps(payload))
+        return self.store_body(JSONResponse(content=jsonable_encoder(payload)).body)
+
+    def store_body(self, body: bytes) -> Response:
+        """Like store, for a body that is already encoded JSON"""
+        entry = CachedResponse(
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+            last_modified=self.last_modified,
+            generations=self.generations,
+            expires_at=time.monotonic() + self.cache.ttl
+        )
+        self.cache._put(self.key, self.tags, entry)
+        if _not_modified(self.request, entry):
+            RESPONSE_CACHE_REQUESTS.labels(route=route_template(self.request), outcome="not_modified").inc()
+            return _not_modified_response(self.request, entry)
+        return _full_response(self.request, entry)
+
+
+class ResponseCache:
+    """In-process cache of rendered JSON responses for read-heavy GET endpoints.
+
+    Entries are keyed by path, query string and caller role, and record which data
+    they were built from as tags. Writers call invalidate(tag) after committing, which
+    bumps the tag's generation so every response built from it is recomputed on its
+    next request. Responses carry an ETag (hash of the body) and Last-Modified (time
+    of the last invalidation of their tags), and requests with a matching
+    If-None-Match or If-Modified-Since get a 304 without a body.
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._modified: Dict[str, float] = {}
+        self._started = time.time()
+        self._lock = threading.Lock()
+        # Called with the tags of every local invalidation, e.g. to pass them on to other workers
+        self._listeners = []
+
+    def lookup(self, request: Request, tags: Iterable[str], role: Optional[str] = None) -> CacheLookup:
+        tags = tuple(tags)
+        key = (request.url.path, tuple(sorted(request.query_params.multi_items())), role)
+        with self._lock:
+            # Snapshot before the caller queries, so a write racing with the query invalidates the result
+            generations = tuple(self._generations.get(tag, 0) for tag in tags)
+            last_modified = max([self._modified.get(tag, self._started) for tag in tags] or [self._started])
+            entry = self._entries.get(key)
+            if entry is not None and (entry.generations != generations or entry.expires_at < time.monotonic()):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        route = route_template(request)
+        response = None
+        if entry is not None:
+            if _not_modified(request, entry):
+                RESPONSE_CACHE_REQUESTS.labels(route=route, outcome="not_modified").inc()
+                response = _not_modified_response(request, entry)
+            else:
+                RESPONSE_CACHE_REQUESTS.labels(route=route, outcome="hit").inc()
+                response = _full_response(request, entry)
+        else:
+            RESPONSE_CACHE_REQUESTS.labels(route=route, outcome="miss").inc()
+        return CacheLookup(self, request, key, tags, generations, last_modified, response)
+
+    def _put(self, key: tuple, tags: Tuple[str, ...], entry: CachedResponse):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            current = tuple(self._generations.get(tag, 0) for tag in tags)
+            if current != entry.generations:
+                # Invalidated while the response was being built
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *tags: str, notify: bool = True):
+        """Recompute responses built from tags; notify=False for invalidations received from elsewhere"""
+        now = time.time()
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                self._modified[tag] = now
+        if notify:
+            for listener in self._listeners:
+                listener(tags)
+
+    def add_listener(self, listener: Callable[[Tuple[str, ...]], None]):
+        self._listeners.append(listener)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _not_modified(request: Request, entry: CachedResponse) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison: a W/ prefix added by a proxy still matches
+        return "*" in tags or entry.etag in tags or f"W/{entry.etag}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return int(entry.last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _cache_headers(entry: CachedResponse) -> Dict[str, str]:
+    return {
+        "ETag": entry.etag,
+        "Last-Modified": formatdate(entry.last_modified, usegmt=True),
+        # Per-role content: clients may keep it but must revalidate before reuse
+        "Cache-Control": "private, no-cache"
+    }
+
+
+def _full_response(request: Request, entry: CachedResponse) -> Response:
+    if fast_json.FAST_JSON_ENABLED:
+        return fast_json.json_response(request, entry.body, headers=_cache_headers(entry), compressed=entry.compressed)
+    return Response(content=entry.body, media_type="application/json", headers=_cache_headers(entry))
+
+
+def _not_modified_response(request: Request, entry: CachedResponse) -> Response:
+    headers = _cache_headers(entry)
+    if fast_json.FAST_JSON_ENABLED and len(entry.body) >= fast_json.COMPRESSION_MIN_BYTES \
+            and fast_json.accepted_encoding(request) is not None:
+        # Compressed representations carry the weak form of the ETag
+        headers["ETag"] = f"W/{entry.etag}"
+        headers["Vary"] = "Accept-Encoding"
+    return Response(status_code=304, headers=headers)
+
+
+response_cache = ResponseCache()
@@ -42,6 +42,9 @@ class Anomaly(AnomalyBase):
     status: str
     assigned_to_id: Optional[int]
     resolved_at: Optional[datetime]
+    last_seen_at: Optional[datetime]
+    duration_seconds: Optional[float]
+    record_count: Optional[int]
 
     class Config:
         orm_mode = True
@@ -0,0 +1,26 @@
+import os
+import sys
+import tempfile
+
+# Modules read their configuration at import time: point them at a scratch SQLite database
+_DATABASE_DIR = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DATABASE_DIR, 'test.db')}"
+os.environ.pop("TRAFFIC_QUEUE_PATH", None)
+os.environ["COORDINATION_LOCK_DIR"] = _DATABASE_DIR
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import models  # noqa: F401  registers every table on Base
+from database import Base, SessionLocal, engine
+
+
+@pytest.fixture
+def db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,104 @@
+import asyncio
+
+from alerts import NOTIFICATION_SENT, AlertDispatcher, AlertRule
+from database import SessionLocal
+from models import AlertOutbox, AnomalyAction
+
+
+class CollectingSink:
+    def __init__(self):
+        self.alerts = []
+
+    def send(self, alert):
+        self.alerts.append(alert)
+
+
+def event(anomaly_id: int, severity: float = 0.9):
+    return {"anomaly_id": anomaly_id, "anomaly_type": "traffic_congestion", "location": "Main St",
+            "severity": severity, "description": "congestion", "latitude": None, "longitude": None,
+            "outcome": "created", "timestamp": None}
+
+
+def dispatcher(sink, max_per_minute: float = 10.0):
+    rule = AlertRule(name="severe", sinks=["collect"], min_severity=0.8, max_per_minute=max_per_minute)
+    return AlertDispatcher(rules=[rule], sinks={"collect": sink}, poll_interval=0.01)
+
+
+def stage_from_worker(events):
+    db = SessionLocal()
+    try:
+        dispatcher(CollectingSink()).stage(db, events)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run_once(alerts: AlertDispatcher):
+    await alerts.start()
+    await asyncio.sleep(0.1)
+    await alerts.stop()
+
+
+def test_episode_staged_by_several_workers_alerts_once(db):
+    sink = CollectingSink()
+    # Two workers merged records into the same episode
+    stage_from_worker([event(1)])
+    stage_from_worker([event(1), event(2, severity=0.1)])
+
+    asyncio.run(run_once(dispatcher(sink)))
+
+    assert [alert["kind"] for alert in sink.alerts] == ["single"]
+    assert db.query(AlertOutbox).count() == 0
+    assert db.query(AnomalyAction).filter(AnomalyAction.action_type == NOTIFICATION_SENT).count() == 1
+
+
+def test_rate_limit_covers_every_worker(db):
+    sink = CollectingSink()
+    for worker in range(3):
+        stage_from_worker([event(worker * 2 + 1), event(worker * 2 + 2)])
+
+    asyncio.run(run_once(dispatcher(sink, max_per_minute=2)))
+
+    assert [alert["kind"] for alert in sink.alerts] == ["single", "single", "digest"]
+    assert sink.alerts[-1]["count"] == 4
+
+
+def test_new_leader_does_not_alert_again(db):
+    first, second = CollectingSink(), CollectingSink()
+    stage_from_worker([event(1)])
+    asyncio.run(run_once(dispatcher(first)))
+
+    # The episode merges again after another worker took over dispatching
+    stage_from_worker([event(1)])
+    asyncio.run(run_once(dispatcher(second)))
+
+    assert len(first.alerts) == 1
+    assert second.alerts == []
+
+
+def test_nothing_is_staged_without_rules(db):
+    AlertDispatcher(rules=[], sinks={}).stage(db, [event(1)])
+    db.commit()
+
+    assert db.query(AlertOutbox).count() == 0
+
+
+def test_pending_digest_survives_a_dispatcher_that_dies(db):
+    first, second = CollectingSink(), CollectingSink()
+    stage_from_worker([event(1), event(2), event(3)])
+
+    async def die_with_pending_digest():
+        alerts = dispatcher(first, max_per_minute=1)
+        await alerts.start()
+        await asyncio.sleep(0.1)
+        # The worker exits without flushing, e.g. killed
+        alerts._task.cancel()
+
+    asyncio.run(die_with_pending_digest())
+    assert [alert["kind"] for alert in first.alerts] == ["single"]
+    assert db.query(AlertOutbox).count() == 2
+
+    asyncio.run(run_once(dispatcher(second)))
+
+    assert [alert["kind"] for alert in second.alerts] == ["single", "single"]
+    assert db.query(AlertOutbox).count() == 0
@@ -0,0 +1,55 @@
+import asyncio
+
+from audit import AuditSink
+from database import SessionLocal
+from models import AuditLog
+
+
+def counting_sink(**options):
+    sessions = []
+
+    def session_factory():
+        sessions.append(1)
+        return SessionLocal()
+
+    return AuditSink(session_factory=session_factory, **options), sessions
+
+
+def test_entries_are_written_at_once_before_start(db):
+    sink, sessions = counting_sink()
+
+    asyncio.run(sink.log(1, "login", "user logged in", "10.0.0.1"))
+
+    assert len(sessions) == 1
+    entry = db.query(AuditLog).one()
+    assert (entry.action, entry.ip_address) == ("login", "10.0.0.1")
+
+
+def test_queued_entries_are_written_in_batches(db):
+    sink, sessions = counting_sink(batch_size=2, flush_interval=0.05)
+
+    async def log_five():
+        await sink.start()
+        for i in range(5):
+            await sink.log(1, "update", f"change {i}")
+        await asyncio.sleep(0.2)
+        assert db.query(AuditLog).count() == 5
+        await sink.stop()
+
+    asyncio.run(log_five())
+    assert len(sessions) == 3
+    assert [entry.details for entry in db.query(AuditLog).order_by(AuditLog.id)] == \
+        [f"change {i}" for i in range(5)]
+
+
+def test_stop_writes_every_queued_entry(db):
+    sink, _ = counting_sink(batch_size=100, flush_interval=60)
+
+    async def log_and_stop():
+        await sink.start()
+        for i in range(3):
+            await sink.log(None, "delete", f"entry {i}")
+        await sink.stop()
+
+    asyncio.run(log_and_stop())
+    assert db.query(AuditLog).count() == 3
@@ -0,0 +1,35 @@
+import os
+
+from coordination import FileLock
+
+
+def test_file_lock_is_exclusive(tmp_path):
+    first, second = FileLock("job", str(tmp_path)), FileLock("job", str(tmp_path))
+    assert first.acquire()
+    assert first.held()
+    assert not second.acquire()
+    first.release()
+    assert not first.held()
+    assert second.acquire()
+    second.release()
+
+
+def test_file_lock_is_lost_when_its_file_is_deleted(tmp_path):
+    first, second = FileLock("job", str(tmp_path)), FileLock("job", str(tmp_path))
+    assert first.acquire()
+    os.remove(first.path)
+    assert not first.held()
+    # Another worker locks the new file, so the first must stand down
+    assert second.acquire()
+    assert second.held()
+    assert not first.held()
+    first.release()
+    second.release()
+
+
+def test_file_lock_is_lost_when_its_file_is_closed(tmp_path):
+    lock = FileLock("job", str(tmp_path))
+    assert lock.acquire()
+    lock._file.close()
+    assert not lock.held()
+    lock.release()
@@ -0,0 +1,80 @@
+import asyncio
+
+from durable_queue import DurableQueue, run_consumer
+
+
+def test_uncommitted_messages_are_delivered_again(tmp_path):
+    queue = DurableQueue(str(tmp_path / "queue.db"))
+    queue.append("raw", [{"n": n} for n in range(5)])
+
+    first = queue.read("raw", "scorer", limit=3)
+    assert [message.payload["n"] for message in first] == [0, 1, 2]
+    assert queue.read("raw", "scorer", limit=3) == first
+
+    queue.commit("scorer", "raw", first[-1].offset)
+    assert [message.payload["n"] for message in queue.read("raw", "scorer")] == [3, 4]
+    assert queue.lag("scorer", "raw") == 2
+    # Other consumers keep their own position
+    assert len(queue.read("raw", "auditor")) == 5
+
+
+def test_commits_only_move_forward_and_seek_replays(tmp_path):
+    queue = DurableQueue(str(tmp_path / "queue.db"))
+    last = queue.append("raw", [{"n": n} for n in range(4)])
+    queue.commit("scorer", "raw", last)
+    queue.commit("scorer", "raw", last - 2)
+    assert queue.position("scorer", "raw") == last
+
+    queue.seek("scorer", "raw", offset=last - 2)
+    assert [message.payload["n"] for message in queue.read("raw", "scorer")] == [2, 3]
+    queue.seek("scorer", "raw", since=0)
+    assert len(queue.read("raw", "scorer")) == 4
+
+
+def test_append_commits_the_acknowledged_batch_with_its_output(tmp_path):
+    queue = DurableQueue(str(tmp_path / "queue.db"))
+    last = queue.append("raw", [{"n": 1}, {"n": 2}])
+
+    queue.append("scored", [{"n": 1, "score": 0.5}], ack=("scorer", "raw", last))
+
+    assert queue.position("scorer", "raw") == last
+    assert [message.payload for message in queue.read("scored", "persister")] == [{"n": 1, "score": 0.5}]
+
+
+def test_prune_keeps_what_a_consumer_still_needs(tmp_path):
+    queue = DurableQueue(str(tmp_path / "queue.db"))
+    first = queue.append("raw", [{"n": 1}])
+    queue.append("raw", [{"n": 2}])
+    queue.commit("scorer", "raw", first + 1)
+    queue.commit("auditor", "raw", first)
+
+    assert queue.prune(retention_seconds=3600) == 0
+    assert queue.prune(retention_seconds=-1) == 1
+    assert [message.payload["n"] for message in queue.read("raw", "scorer", limit=10)] == []
+    assert [message.payload["n"] for message in queue.read("raw", "auditor", limit=10)] == [2]
+
+
+def test_failing_message_is_moved_aside_and_the_rest_are_handled(tmp_path):
+    queue = DurableQueue(str(tmp_path / "queue.db"))
+    queue.append("raw", [{"n": n} for n in range(6)])
+    handled = []
+
+    def handler(messages):
+        if any(message.payload["n"] == 3 for message in messages):
+            raise ValueError("bad record")
+        handled.extend(message.payload["n"] for message in messages)
+        return [message.payload for message in messages]
+
+    async def consume():
+        stopping = asyncio.Event()
+        task = asyncio.create_task(run_consumer(queue, "raw", "scorer", handler, stopping, output_topic="scored",
+                                                poll_interval=0.01))
+        while queue.lag("scorer", "raw"):
+            await asyncio.sleep(0.01)
+        stopping.set()
+        await task
+
+    asyncio.run(asyncio.wait_for(consume(), 10))
+    assert sorted(handled) == [0, 1, 2, 4, 5]
+    assert [message.payload["n"] for message in queue.read("scored", "persister", limit=10)] == [0, 1, 2, 4, 5]
+    assert [message.payload["n"] for message in queue.read("raw.dead", "operator")] == [3]
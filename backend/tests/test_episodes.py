@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+from episodes import EpisodeAggregator
+from models import Anomaly
+
+T0 = datetime(2025, 1, 1, 8, 0, 0)
+
+
+def record(aggregator, db, seen_at, severity=0.5):
+    return aggregator.record(db, "Main St", "traffic_congestion", severity, "congestion", seen_at=seen_at)
+
+
+def test_records_within_the_gap_merge_into_one_episode(db):
+    aggregator = EpisodeAggregator(gap_seconds=300)
+    first, outcome = record(aggregator, db, T0)
+    assert outcome == "created"
+    assert record(aggregator, db, T0 + timedelta(seconds=60), severity=0.9) == (first, "merged")
+    assert record(aggregator, db, T0 + timedelta(seconds=60)) == (first, "duplicate")
+    assert record(aggregator, db, T0 + timedelta(seconds=1000))[1] == "created"
+    db.commit()
+
+    anomaly = db.get(Anomaly, first)
+    assert anomaly.record_count == 2
+    assert anomaly.severity == 0.9
+    assert anomaly.duration_seconds == 60
+
+
+def test_rolled_back_merge_is_counted_on_retry(db):
+    aggregator = EpisodeAggregator(gap_seconds=300)
+    anomaly_id, _ = record(aggregator, db, T0)
+    db.commit()
+
+    assert record(aggregator, db, T0 + timedelta(seconds=30), severity=0.8) == (anomaly_id, "merged")
+    db.rollback()
+    assert record(aggregator, db, T0 + timedelta(seconds=30), severity=0.8) == (anomaly_id, "merged")
+    db.commit()
+
+    anomaly = db.get(Anomaly, anomaly_id)
+    assert anomaly.record_count == 2
+    assert anomaly.severity == 0.8
+
+
+def test_rolled_back_episode_is_not_extended(db):
+    aggregator = EpisodeAggregator(gap_seconds=300)
+    record(aggregator, db, T0)
+    db.rollback()
+    anomaly_id, outcome = record(aggregator, db, T0 + timedelta(seconds=30))
+    assert outcome == "created"
+    db.commit()
+    assert db.query(Anomaly).count() == 1
+    assert db.get(Anomaly, anomaly_id).record_count == 1
+
+
+def test_closing_without_commit_discards_staged_changes(db):
+    from database import SessionLocal
+    aggregator = EpisodeAggregator(gap_seconds=300)
+    anomaly_id, _ = record(aggregator, db, T0)
+    db.commit()
+
+    other = SessionLocal()
+    record(aggregator, other, T0 + timedelta(seconds=30))
+    other.close()
+    assert record(aggregator, db, T0 + timedelta(seconds=30)) == (anomaly_id, "merged")
+    db.commit()
+    assert db.get(Anomaly, anomaly_id).record_count == 2
+
+
+def test_reload_reads_only_episodes_that_can_still_be_extended(db):
+    aggregator = EpisodeAggregator(gap_seconds=300)
+    for hours in range(1, 6):
+        old = T0 - timedelta(hours=hours)
+        db.add(Anomaly(timestamp=old, last_seen_at=old, location=f"Road {hours}", anomaly_type="traffic_congestion",
+                       severity=0.5, description="old", status="active", record_count=1))
+    db.commit()
+    recent_id, _ = record(aggregator, db, T0)
+    db.commit()
+
+    # Another worker changed the anomalies
+    aggregator.reset()
+    assert record(aggregator, db, T0 + timedelta(seconds=120)) == (recent_id, "merged")
+    db.commit()
+    assert list(aggregator._open) == [("Main St", "traffic_congestion")]
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import geo
+from models import Anomaly
+
+
+def test_encode_matches_the_reference_geohash():
+    assert geo.encode(57.64911, 10.40744) == "u4pruydqq"
+    assert geo.encode(57.64911, 10.40744, precision=5) == "u4pru"
+
+
+def test_encode_array_matches_encode():
+    rng = np.random.default_rng(0)
+    latitudes, longitudes = rng.uniform(-90, 90, 200), rng.uniform(-180, 180, 200)
+
+    assert geo.encode_array(latitudes, longitudes) == \
+        [geo.encode(lat, lon) for lat, lon in zip(latitudes, longitudes)]
+
+
+def test_cover_contains_every_point_of_the_box():
+    box = (40.70, -74.02, 40.80, -73.93)
+    ranges = geo.cover(*box)
+    assert len(ranges) <= geo.MAX_COVER_CELLS
+
+    rng = np.random.default_rng(1)
+    for lat, lon in zip(rng.uniform(box[0], box[2], 500), rng.uniform(box[1], box[3], 500)):
+        code = geo.encode(lat, lon)
+        assert any(start <= code and (end is None or code < end) for start, end in ranges)
+
+
+def test_parse_bbox_rejects_invalid_boxes():
+    assert geo.parse_bbox("-74.02,40.70,-73.93,40.80") == (40.70, -74.02, 40.80, -73.93)
+    for value in ("1,2,3", "a,b,c,d", "10,0,-10,5", "0,-91,1,1"):
+        with pytest.raises(ValueError):
+            geo.parse_bbox(value)
+
+
+def test_area_conditions_select_the_rows_inside(db):
+    points = {"inside": (40.75, -73.98), "nearby": (40.81, -73.98), "far": (51.5, -0.12)}
+    for name, (lat, lon) in points.items():
+        db.add(Anomaly(location=name, latitude=lat, longitude=lon, geohash=geo.encode(lat, lon)))
+    db.add(Anomaly(location="unplaced"))
+    db.commit()
+
+    in_box = db.query(Anomaly.location).filter(geo.bbox_condition(Anomaly, 40.70, -74.02, 40.80, -73.93))
+    assert [location for location, in in_box] == ["inside"]
+    near = db.query(Anomaly.location).filter(geo.radius_condition(Anomaly, 40.76, -73.98, 2.0))
+    assert [location for location, in near] == ["inside"]
+    wide = db.query(Anomaly.location).filter(geo.radius_condition(Anomaly, 40.76, -73.98, 10.0))
+    assert sorted(location for location, in wide) == ["inside", "nearby"]
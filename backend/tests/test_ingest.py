@@ -0,0 +1,97 @@
+import json
+from collections import Counter
+
+import pytest
+
+from ingest import IngestBatches, IngestError, parse_and_validate
+
+
+def test_batch_status_is_shared_between_workers(db):
+    accepting, other = IngestBatches(), IngestBatches()
+    accepting.add("b1", status="queued", accepted=3, rejected=1)
+    assert other.get("b1")["status"] == "queued"
+    assert other.get("missing") is None
+
+    other.add_persisted(db, Counter({"b1": 2}))
+    db.commit()
+    assert accepting.get("b1")["persisted"] == 2
+    assert accepting.get("b1")["status"] == "queued"
+
+    other.add_persisted(db, Counter({"b1": 1}))
+    db.commit()
+    batch = accepting.get("b1")
+    assert (batch["persisted"], batch["status"]) == (3, "persisted")
+
+
+def test_rolled_back_records_are_not_counted(db):
+    batches = IngestBatches()
+    batches.add("b1", status="queued", accepted=2, rejected=0)
+    batches.add_persisted(db, Counter({"b1": 2}))
+    db.rollback()
+    assert batches.get("b1")["persisted"] == 0
+
+
+def test_failed_batch_stays_failed(db):
+    batches = IngestBatches()
+    batches.add("b1", status="queued", accepted=1, rejected=0)
+    batches.update("b1", status="failed", error="scoring failed")
+    batches.add_persisted(db, Counter({"b1": 1}))
+    db.commit()
+    assert batches.get("b1")["status"] == "failed"
+
+
+def columnar(**columns):
+    body = {"vehicle_count": [5, 6], "average_speed": [40.0, 50.0], "congestion_level": [0.5, 0.6],
+            "timestamp": ["2025-01-01T08:00:00", "2025-01-01T08:00:01"], "location": "Main St"}
+    body.update(columns)
+    return json.dumps(body).encode()
+
+
+@pytest.mark.parametrize("column", [5, "5", {"a": 1}])
+def test_scalar_columns_are_unreadable(column):
+    with pytest.raises(IngestError, match="vehicle_count must be an array"):
+        parse_and_validate(columnar(vehicle_count=column), "application/json", "b1")
+
+
+@pytest.mark.parametrize("column", [[[1, 2], [3]], [[1], [2]], [5, [6]]])
+def test_nested_columns_are_unreadable(column):
+    with pytest.raises(IngestError, match="not of arrays"):
+        parse_and_validate(columnar(vehicle_count=column), "application/json", "b1")
+
+
+def test_nested_values_in_ndjson_are_unreadable():
+    body = b'{"vehicle_count": 5, "average_speed": 40.0, "congestion_level": 0.5, "timestamp": [1, 2]}\n' \
+           b'{"vehicle_count": 5, "average_speed": 40.0, "congestion_level": 0.5, "timestamp": [1]}'
+    with pytest.raises(IngestError):
+        parse_and_validate(body, "application/x-ndjson", "b1")
+
+
+def test_booleans_are_not_numbers():
+    batch = parse_and_validate(columnar(vehicle_count=[True, 5], congestion_level=[0.5, False]),
+                               "application/json", "b1")
+    assert [record["vehicle_count"] for record in batch.records] == []
+    assert [(error["row"], error["field"], error["error"]) for error in batch.errors] == [
+        (0, "vehicle_count", "not a number"), (1, "congestion_level", "not a number")
+    ]
+
+    batch = parse_and_validate(columnar(timestamp=[True, 1735718400]), "application/json", "b1")
+    assert [(error["row"], error["field"]) for error in batch.errors] == [(0, "timestamp")]
+    assert len(batch.records) == 1
+
+
+def test_ingest_needs_the_api_key(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from api import traffic_data
+
+    app = FastAPI()
+    app.include_router(traffic_data.router, prefix="/api/traffic-data")
+    client = TestClient(app)
+    body = json.dumps({"vehicle_count": [10]})
+
+    monkeypatch.setattr(traffic_data, "INGEST_API_KEY", None)
+    assert client.post("/api/traffic-data/ingest", content=body, headers={"X-API-Key": ""}).status_code == 404
+    monkeypatch.setattr(traffic_data, "INGEST_API_KEY", "key")
+    assert client.post("/api/traffic-data/ingest", content=body).status_code == 401
+    assert client.post("/api/traffic-data/ingest", content=body, headers={"X-API-Key": "wrong"}).status_code == 401
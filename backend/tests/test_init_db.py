@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from database import Base, SessionLocal, engine
+from init_db import init_database, upgrade_tables
+from models import Anomaly, TrafficData
+
+
+def create_first_release_tables():
+    Base.metadata.drop_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE anomalies (id INTEGER PRIMARY KEY, timestamp DATETIME, location VARCHAR, "
+            "anomaly_type VARCHAR, severity FLOAT, description TEXT, ai_report TEXT, status VARCHAR, "
+            "assigned_to_id INTEGER, resolved_at DATETIME)"
+        ))
+        connection.execute(text(
+            "CREATE TABLE traffic_data (id INTEGER PRIMARY KEY, vehicle_count INTEGER, average_speed FLOAT, "
+            "congestion_level FLOAT, time_of_day INTEGER, timestamp DATETIME)"
+        ))
+        connection.execute(text(
+            "INSERT INTO anomalies (location, anomaly_type, severity, status) VALUES ('Main St', 'congestion', 0.5, 'detected')"
+        ))
+
+
+def test_tables_of_an_older_release_are_upgraded():
+    create_first_release_tables()
+    init_database()
+
+    columns = {column["name"] for column in inspect(engine).get_columns("anomalies")}
+    assert {"last_seen_at", "duration_seconds", "record_count", "latitude", "longitude", "geohash"} <= columns
+    indexes = {index["name"] for index in inspect(engine).get_indexes("traffic_data")}
+    assert {"ix_traffic_data_geohash", "uq_traffic_data_queue_offset"} <= indexes
+
+    db = SessionLocal()
+    try:
+        assert db.query(Anomaly).one().location == "Main St"
+        db.add_all([TrafficData(queue_offset=1), TrafficData(queue_offset=1)])
+        with pytest.raises(IntegrityError):
+            db.commit()
+    finally:
+        db.close()
+    # Nothing left to add
+    assert upgrade_tables() == []
@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_worker(code: str, multiproc_dir) -> str:
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(multiproc_dir))
+    return subprocess.run([sys.executable, "-c", "import metrics\n" + code], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True, check=True).stdout
+
+
+def test_metrics_sum_every_worker(tmp_path):
+    for _ in range(2):
+        run_worker("metrics.INGEST_RECORDS.labels(outcome='accepted').inc(3)", tmp_path)
+
+    body = run_worker("print(metrics.metrics_response().body.decode())", tmp_path)
+
+    assert 'backend_ingest_records_total{outcome="accepted"} 6.0' in body
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import SessionLocal
+from durable_queue import SCORED_TOPIC, DurableQueue, run_consumer
+from episodes import episode_aggregator
+from models import Anomaly, TrafficData
+from persister import TrafficPersister
+
+T0 = datetime(2025, 1, 1, 8, 0, 0)
+
+
+def scored(seconds: float, severity: float = 0.5):
+    record = {"vehicle_count": 20, "average_speed": 10.0, "congestion_level": 0.9, "time_of_day": 8,
+              "location": "Main St", "timestamp": (T0 + timedelta(seconds=seconds)).isoformat()}
+    analysis = {"anomaly_type": "traffic_congestion", "severity": severity, "description": "congestion"}
+    return {"record": record, "is_anomaly": True, "analysis": analysis}
+
+
+@pytest.fixture
+def queue(tmp_path, db):
+    episode_aggregator.reset()
+    return DurableQueue(str(tmp_path / "queue.db"))
+
+
+def failing_commit():
+    session = SessionLocal()
+
+    def commit():
+        raise RuntimeError("commit failed")
+
+    session.commit = commit
+    return session
+
+
+def test_retried_batch_merges_into_its_episode(queue, db):
+    queue.append(SCORED_TOPIC, [scored(0), scored(30, severity=0.8)])
+    first, second = queue.read(SCORED_TOPIC, "persister")
+    TrafficPersister(queue).persist([first])
+
+    with pytest.raises(RuntimeError):
+        TrafficPersister(queue, session_factory=failing_commit).persist([second])
+    TrafficPersister(queue).persist([second])
+
+    (anomaly,) = db.query(Anomaly).all()
+    assert anomaly.record_count == 2
+    assert anomaly.severity == 0.8
+    assert db.query(TrafficData).count() == 2
+
+
+def test_consumer_halves_failing_batches_and_dead_letters_the_culprit(tmp_path, monkeypatch):
+    import durable_queue
+    monkeypatch.setattr(durable_queue, "TRAFFIC_QUEUE_MAX_ATTEMPTS", 2)
+    queue = DurableQueue(str(tmp_path / "queue.db"))
+    queue.append("topic", [{"n": n} for n in range(8)])
+    handled = []
+
+    def handler(messages):
+        if any(message.payload["n"] == 5 for message in messages):
+            raise ValueError("bad message")
+        handled.extend(message.payload["n"] for message in messages)
+
+    async def consume():
+        stopping = asyncio.Event()
+        task = asyncio.create_task(run_consumer(queue, "topic", "test", handler, stopping,
+                                                batch_size=8, poll_interval=0.001))
+        while queue.lag("test", "topic"):
+            await asyncio.sleep(0.01)
+        stopping.set()
+        await task
+
+    asyncio.run(asyncio.wait_for(consume(), 10))
+    assert sorted(handled) == [0, 1, 2, 3, 4, 6, 7]
+    (dead,) = queue.tail("topic.dead", 10)
+    assert dead.payload["n"] == 5
+
+
+def regime_change(seconds: float):
+    timestamp = (T0 + timedelta(seconds=seconds)).isoformat()
+    return {"anomaly_type": "regime_change", "location": "Main St", "feature": "vehicle_count",
+            "direction": "increase", "severity": 0.7, "timestamp": timestamp,
+            "description": "Sustained increase in vehicle_count at Main St"}
+
+
+def test_regime_changes_are_recorded_as_anomalies(queue, db):
+    message = scored(0)
+    message.update(is_anomaly=False, analysis=None, changes=[regime_change(0)])
+    queue.append(SCORED_TOPIC, [message])
+    TrafficPersister(queue).persist(queue.read(SCORED_TOPIC, "persister"))
+
+    (anomaly,) = db.query(Anomaly).all()
+    assert anomaly.anomaly_type == "regime_change"
+    assert anomaly.severity == 0.7
+
+
+def test_only_new_change_points_are_taken_from_the_ml_service(db, monkeypatch):
+    from api import traffic_data
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"change_points": [regime_change(0), regime_change(600)]}
+
+    monkeypatch.setattr(traffic_data.requests, "get", lambda *args, **kwargs: Response())
+    episode_aggregator.reset()
+    changes = traffic_data._new_regime_changes(db)
+    assert [change["timestamp"] for _, change in changes] == [regime_change(0)["timestamp"],
+                                                            regime_change(600)["timestamp"]]
+    traffic_data.record_anomalies(db, changes[:1])
+    db.commit()
+    assert [change["timestamp"] for _, change in traffic_data._new_regime_changes(db)] == \
+        [regime_change(600)["timestamp"]]
@@ -0,0 +1,67 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from response_cache import ANOMALIES, ResponseCache
+
+
+def cached_app(cache: ResponseCache, build):
+    app = FastAPI()
+
+    @app.get("/items")
+    def items(request: Request):
+        lookup = cache.lookup(request, [ANOMALIES])
+        if lookup.response is not None:
+            return lookup.response
+        return lookup.store(build())
+
+    return TestClient(app)
+
+
+def test_responses_are_reused_until_invalidated():
+    cache, builds = ResponseCache(ttl=60), []
+    client = cached_app(cache, lambda: builds.append(1) or {"count": len(builds)})
+
+    first = client.get("/items")
+    second = client.get("/items")
+    assert first.json() == second.json() == {"count": 1}
+    assert first.headers["ETag"] == second.headers["ETag"]
+
+    cache.invalidate(ANOMALIES)
+    assert client.get("/items").json() == {"count": 2}
+    assert client.get("/items?page=2").json() == {"count": 3}
+
+
+def test_matching_etag_gets_a_304():
+    client = cached_app(ResponseCache(ttl=60), lambda: {"count": 1})
+    etag = client.get("/items").headers["ETag"]
+
+    response = client.get("/items", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert client.get("/items", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_response_invalidated_while_built_is_not_cached():
+    cache, builds = ResponseCache(ttl=60), []
+
+    def build():
+        builds.append(1)
+        if len(builds) == 1:
+            # A write commits while the first response is being built
+            cache.invalidate(ANOMALIES)
+        return {"count": len(builds)}
+
+    client = cached_app(cache, build)
+    assert client.get("/items").json() == {"count": 1}
+    assert client.get("/items").json() == {"count": 2}
+    assert client.get("/items").json() == {"count": 2}
+
+
+def test_invalidations_reach_listeners_unless_received_from_elsewhere():
+    cache, received = ResponseCache(), []
+    cache.add_listener(received.append)
+
+    cache.invalidate(ANOMALIES)
+    cache.invalidate(ANOMALIES, notify=False)
+
+    assert received == [(ANOMALIES,)]
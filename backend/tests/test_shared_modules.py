@@ -0,0 +1,18 @@
+import os
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ML_SERVICE_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "ml_service")
+
+# Modules both services use; each image is built from its own directory, so each keeps a copy
+SHARED_MODULES = ["durable_queue.py", "geo.py"]
+
+
+@pytest.mark.parametrize("module", SHARED_MODULES)
+def test_copies_in_both_services_match(module):
+    with open(os.path.join(BACKEND_DIR, module)) as f:
+        backend_copy = f.read()
+    with open(os.path.join(ML_SERVICE_DIR, module)) as f:
+        ml_service_copy = f.read()
+    assert backend_copy == ml_service_copy, f"backend/{module} and ml_service/{module} differ; change both"
@@ -0,0 +1,247 @@
+"""End-to-end load generator for the backend and the ML service.
+
+By default both services are started in this process on local ports: the backend
+against a throwaway SQLite database (or --database-url, e.g. a local Postgres) and
+the ML service with its simulator, wired together through ML_SERVICE_URL. Pass
+--backend-url/--ml-url to drive an existing deployment instead.
+
+Each target is driven open-loop at a fixed request rate, so a slow server shows
+up as latency and errors rather than as a silently lower offered load.
+
+Usage:
+    python loadtest/run_load_test.py --duration 30 --rate traffic=5 anomalies=50 detect=20 analyze=50
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, "backend")
+ML_SERVICE_DIR = os.path.join(ROOT, "ml_service")
+sys.path.insert(0, ML_SERVICE_DIR)
+
+from generate_synthetic_data import generate_dataset, generate_anomaly, generate_normal_traffic
+
+DEFAULT_RATES = {"traffic": 2.0, "anomalies": 20.0, "detect": 10.0, "analyze": 20.0}
+
+
+def load_app(service_dir: str, module_name: str):
+    """Import a service's main.py under a unique name.
+
+    Both services use flat top-level modules (main, metrics, ...), so after loading one
+    service its modules are dropped from sys.modules and returned instead; the app
+    keeps its own references to them.
+    """
+    sys.path.insert(0, service_dir)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(service_dir, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    sys.path.remove(service_dir)
+    service_modules = {}
+    for name, loaded in list(sys.modules.items()):
+        if name != module_name and (getattr(loaded, "__file__", None) or "").startswith(service_dir + os.sep):
+            service_modules[name] = sys.modules.pop(name)
+    return module, service_modules
+
+
+def serve_in_thread(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Server on port {port} failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def start_local_services(workdir: str, database_url: str, backend_port: int, ml_port: int, dataset_size: int):
+    # The ML service writes its model and simulator output into the working directory
+    os.chdir(workdir)
+    ml_url = f"http://127.0.0.1:{ml_port}"
+    traffic_file = os.path.join(workdir, "synthetic_traffic_data.json")
+    with open(traffic_file, "w") as f:
+        json.dump(generate_dataset(num_normal=int(dataset_size * 0.8), num_anomalies=dataset_size - int(dataset_size * 0.8)), f)
+
+    # Environment must be set before the backend modules read it at import time
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["ML_SERVICE_URL"] = ml_url
+    os.environ["TRAFFIC_DATA_FILE"] = traffic_file
+
+    ml_main, _ = load_app(ML_SERVICE_DIR, "ml_service_main")
+    backend_main, backend_modules = load_app(BACKEND_DIR, "backend_main")
+
+    # Importing the backend registered every model on Base
+    database = backend_modules["database"]
+    database.Base.metadata.create_all(bind=database.engine)
+
+    servers = [serve_in_thread(ml_main.app, ml_port), serve_in_thread(backend_main.app, backend_port)]
+    return f"http://127.0.0.1:{backend_port}", ml_url, servers
+
+
+def make_requests(backend_url: str, ml_url: str, batch_size: int):
+    """One request factory per target, returning (method, url, json body)"""
+    def traffic():
+        return "GET", f"{backend_url}/api/traffic-data/", None
+
+    def anomalies():
+        return "GET", f"{backend_url}/api/anomalies/", None
+
+    def detect():
+        return "POST", f"{ml_url}/detect", {"data": generate_dataset(num_normal=batch_size - batch_size // 5,
+                                                                       num_anomalies=batch_size // 5)}
+
+    def analyze():
+        record = generate_anomaly() if random.random() < 0.5 else generate_normal_traffic()
+        return "POST", f"{ml_url}/analyze", record
+
+    return {"traffic": traffic, "anomalies": anomalies, "detect": detect, "analyze": analyze}
+
+
+def percentile(sorted_values, q: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def drive(client: httpx.AsyncClient, name: str, factory, rate: float, duration: float,
+                semaphore: asyncio.Semaphore, results: dict):
+    stats = results[name] = {"latencies": [], "errors": 0, "status_codes": {}, "dropped": 0}
+    tasks = []
+
+    async def one_request():
+        method, url, body = factory()
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, json=body)
+            code = str(response.status_code)
+            if response.status_code >= 400:
+                stats["errors"] += 1
+        except httpx.HTTPError as e:
+            code = type(e).__name__
+            stats["errors"] += 1
+        finally:
+            semaphore.release()
+        stats["latencies"].append(time.perf_counter() - start)
+        stats["status_codes"][code] = stats["status_codes"].get(code, 0) + 1
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    total = int(rate * duration)
+    for i in range(total):
+        # Schedule against absolute deadlines so the offered rate does not drift
+        delay = start + i / rate - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if semaphore.locked():
+            # Every in-flight slot is taken: count the request as dropped instead of queueing it
+            stats["dropped"] += 1
+            continue
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(one_request()))
+    await asyncio.gather(*tasks)
+    stats["elapsed"] = loop.time() - start
+
+
+def summarize(results: dict, duration: float):
+    summary = {}
+    for name, stats in results.items():
+        latencies = sorted(stats["latencies"])
+        completed = len(latencies)
+        attempted = completed + stats["dropped"]
+        summary[name] = {
+            "requests": completed,
+            "dropped": stats["dropped"],
+            "throughput_rps": completed / max(stats.get("elapsed", duration), 1e-9),
+            "error_rate": (stats["errors"] + stats["dropped"]) / attempted if attempted else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+            "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+            "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+            "status_codes": stats["status_codes"]
+        }
+    return summary
+
+
+async def run(args, backend_url: str, ml_url: str):
+    rates = dict(DEFAULT_RATES)
+    for item in args.rate or []:
+        name, value = item.split("=")
+        if name not in rates:
+            raise SystemExit(f"Unknown target '{name}', expected one of {list(rates)}")
+        rates[name] = float(value)
+    factories = make_requests(backend_url, ml_url, args.batch_size)
+
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        await asyncio.gather(*(
+            drive(client, name, factories[name], rate, args.duration,
+                  asyncio.Semaphore(args.concurrency), results)
+            for name, rate in rates.items() if rate > 0
+        ))
+    return rates, summarize(results, args.duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend and ML service")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to drive each target")
+    parser.add_argument("--rate", nargs="+", metavar="TARGET=RPS",
+                        help=f"Requests per second per target, targets: {', '.join(DEFAULT_RATES)}")
+    parser.add_argument("--batch-size", type=int, default=100, help="Records per /detect request")
+    parser.add_argument("--concurrency", type=int, default=64, help="Max in-flight requests per target")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--backend-url", help="Drive an existing backend instead of starting one")
+    parser.add_argument("--ml-url", help="Drive an existing ML service instead of starting one")
+    parser.add_argument("--database-url", help="Database for the in-process backend (default: temporary SQLite)")
+    parser.add_argument("--dataset-size", type=int, default=60,
+                        help="Records in the traffic file served by /api/traffic-data/")
+    parser.add_argument("--backend-port", type=int, default=18000)
+    parser.add_argument("--ml-port", type=int, default=18001)
+    parser.add_argument("--output", help="Write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    if args.backend_url and args.ml_url:
+        backend_url, ml_url = args.backend_url.rstrip("/"), args.ml_url.rstrip("/")
+        servers = []
+    else:
+        workdir = tempfile.mkdtemp(prefix="loadtest-")
+        database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}"
+        backend_url, ml_url, servers = start_local_services(
+            workdir, database_url, args.backend_port, args.ml_port, args.dataset_size
+        )
+
+    try:
+        rates, summary = asyncio.run(run(args, backend_url, ml_url))
+    finally:
+        for server, thread in servers:
+            server.should_exit = True
+            thread.join(timeout=5)
+
+    print(f"{'target':<10} {'offered':>8} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    for name, s in summary.items():
+        def ms(value):
+            return f"{value:9.1f}" if value is not None else f"{'-':>9}"
+        print(f"{name:<10} {rates[name]:>8.1f} {s['throughput_rps']:>8.1f} {ms(s['p50_ms'])} {ms(s['p95_ms'])} "
+              f"{ms(s['p99_ms'])} {s['error_rate']:>7.1%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"rates": rates, "duration": args.duration, "batch_size": args.batch_size,
+                       "summary": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Measure how IsolationForest training and scoring scale with n_jobs and the parallel backend.
+
+Usage: python benchmarks/bench_parallel.py --rows 1000000 --jobs 1 2 4 8 16
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model import AnomalyDetector, FEATURE_COLUMNS
+
+
+def make_features(rows: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(50, 150, rows),
+        rng.uniform(40, 70, rows),
+        rng.uniform(0.3, 0.7, rows),
+        rng.integers(0, 24, rows)
+    ]).astype(np.float64)
+
+
+def run(rows: int, jobs, backends, n_estimators: int, chunk_size: int, repeat: int):
+    X = make_features(rows)
+    model_path = os.path.join(tempfile.mkdtemp(), "bench.joblib")
+    results = []
+    for backend in backends:
+        for n_jobs in jobs:
+            detector = AnomalyDetector(model_path, n_jobs=n_jobs, parallel_backend=backend, score_chunk_size=chunk_size)
+            detector.model.set_params(n_estimators=n_estimators)
+            detector.scaler.fit(X)
+
+            fit_times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                detector.fit_features(X)
+                fit_times.append(time.perf_counter() - start)
+
+            score_times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                detector.score_batch(X)
+                score_times.append(time.perf_counter() - start)
+
+            results.append({
+                "backend": backend,
+                "n_jobs": n_jobs,
+                "fit_seconds": min(fit_times),
+                "score_seconds": min(score_times),
+                "score_rows_per_second": rows / min(score_times)
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument("--backends", nargs="+", default=["threads", "processes"])
+    parser.add_argument("--n-estimators", type=int, default=500)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    jobs = sorted(set(args.jobs))
+    results = run(args.rows, jobs, args.backends, args.n_estimators, args.chunk_size, args.repeat)
+
+    print(f"{args.rows} rows x {len(FEATURE_COLUMNS)} features, n_estimators={args.n_estimators}, {os.cpu_count()} cores")
+    print(f"{'backend':<10} {'n_jobs':>6} {'fit (s)':>9} {'score (s)':>10} {'speedup':>8}")
+    baseline = {}
+    for r in results:
+        baseline.setdefault(r["backend"], r["score_seconds"])
+        speedup = baseline[r["backend"]] / r["score_seconds"]
+        print(f"{r['backend']:<10} {r['n_jobs']:>6} {r['fit_seconds']:>9.3f} {r['score_seconds']:>10.3f} {speedup:>7.2f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"rows": args.rows, "n_estimators": args.n_estimators, "cpu_count": os.cpu_count(),
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Compare keeping recent traffic as a list of dicts with the columnar TrafficStore.
+
+Reports memory per record (traced allocations), build throughput (generating the dicts,
+or appending them to the store in batches of 1000) and the latency of a "last 15 minutes
+of one location" window query for both.
+
+Usage:
+    python benchmarks/bench_traffic_store.py --records 100000 1000000 --locations 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+from traffic_store import TrafficStore
+
+WINDOW_SECONDS = 900
+
+
+def make_records(n: int, locations: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 1, 1)
+    return [
+        {
+            "vehicle_count": vehicle_count,
+            "average_speed": average_speed,
+            "congestion_level": congestion_level,
+            "time_of_day": (i // locations // 3600) % 24,
+            # One record per location and second, with microseconds like datetime.now().isoformat()
+            "timestamp": (start + timedelta(seconds=i // locations, microseconds=i % locations)).isoformat(),
+            "location": f"Location {i % locations}"
+        }
+        for i, (vehicle_count, average_speed, congestion_level) in enumerate(zip(
+            rng.integers(50, 151, n).tolist(), rng.uniform(40, 70, n).tolist(), rng.uniform(0.3, 0.7, n).tolist()
+        ))
+    ]
+
+
+def traced(build):
+    """(result, bytes still allocated by build, seconds)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, allocated, elapsed
+
+
+def timed(fn, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the columnar traffic store")
+    parser.add_argument("--records", type=int, nargs="+", default=[100000])
+    parser.add_argument("--locations", type=int, default=50)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'records':>9} {'store':<8} {'bytes/rec':>10} {'build rec/s':>13} {'window ms':>10}")
+    for n in args.records:
+        # Traced while generated, so every string and float object of the records is counted
+        records, dict_bytes, dict_seconds = traced(lambda: make_records(n, args.locations))
+        latest = datetime.fromisoformat(records[-1]["timestamp"]) - timedelta(seconds=WINDOW_SECONDS)
+
+        def dict_window():
+            return [record for record in records if record["location"] == "Location 0"
+                    and datetime.fromisoformat(record["timestamp"]) >= latest]
+
+        def build_store():
+            store = TrafficStore(retention_seconds=365 * 86400)
+            for i in range(0, n, 1000):
+                store.extend(records[i:i + 1000])
+            return store
+
+        store, store_bytes, store_seconds = traced(build_store)
+        rows = [
+            ("dicts", dict_bytes, dict_seconds, timed(dict_window, repeat=3)),
+            ("columnar", store_bytes, store_seconds, timed(lambda: store.window("Location 0", WINDOW_SECONDS)))
+        ]
+        for name, allocated, build_seconds, window_seconds in rows:
+            results.append({"records": n, "store": name, "bytes_per_record": allocated / n,
+                            "build_records_per_s": n / build_seconds, "window_ms": window_seconds * 1000})
+            print(f"{n:>9} {name:<8} {allocated / n:>10.0f} {n / build_seconds:>13,.0f} {window_seconds * 1000:>10.3f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Compare two benchmark result files and fail on regressions.
+
+Usage: python benchmarks/compare.py baseline.json current.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report, {
+        (r["name"], tuple(sorted(r["params"].items()))): r for r in report["results"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown of the median that counts as a regression")
+    args = parser.parse_args()
+
+    baseline_report, baseline = load(args.baseline)
+    current_report, current = load(args.current)
+    print(f"baseline {baseline_report.get('commit')} vs current {current_report.get('commit')}")
+
+    regressions = 0
+    for key in sorted(baseline.keys() & current.keys()):
+        name, params = key
+        before = baseline[key]["median_seconds"]
+        after = current[key]["median_seconds"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        elif change < -args.threshold:
+            flag = "improved"
+        params_str = " ".join(f"{k}={v}" for k, v in params)
+        print(f"{name:<18} {params_str:<36} {before * 1000:>10.3f} -> {after * 1000:>10.3f} ms {change:>+8.1%} {flag}")
+
+    for key in sorted(baseline.keys() - current.keys()):
+        print(f"missing from current: {key[0]} {dict(key[1])}")
+
+    if regressions:
+        print(f"{regressions} benchmark(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
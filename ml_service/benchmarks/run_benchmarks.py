@@ -0,0 +1,182 @@
+"""Reproducible benchmarks for the ML service hot paths.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --quick --output results.json
+    python benchmarks/compare.py baseline.json results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import sklearn
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+from model import AnomalyDetector
+
+DEFAULT_BATCH_SIZES = [1, 100, 10000, 1000000]
+DEFAULT_N_ESTIMATORS = [100, 500]
+QUICK_BATCH_SIZES = [1, 100, 10000]
+QUICK_N_ESTIMATORS = [100]
+
+# A record that classifies as high_traffic_volume, so analyze_anomaly always has a description
+ANALYZE_RECORD = {"vehicle_count": 220, "average_speed": 25.0, "congestion_level": 0.85, "time_of_day": 17}
+
+
+def make_records(n: int, seed: int = 0):
+    """Synthetic records with the same ranges as generate_synthetic_data, built in bulk"""
+    rng = np.random.default_rng(seed)
+    columns = zip(
+        rng.integers(50, 151, n).tolist(),
+        rng.uniform(40, 70, n).tolist(),
+        rng.uniform(0.3, 0.7, n).tolist(),
+        rng.integers(0, 24, n).tolist()
+    )
+    return [
+        {"vehicle_count": c, "average_speed": s, "congestion_level": l, "time_of_day": t}
+        for c, s, l, t in columns
+    ]
+
+
+def measure(fn, repeat: int, min_time: float = 0.2):
+    """Time fn, looping each sample until it runs for at least min_time to reduce timer noise"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1000:
+            break
+        loops *= 10
+    samples = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops)
+    return {
+        "min_seconds": min(samples),
+        "median_seconds": statistics.median(samples),
+        "loops": loops,
+        "repeat": repeat
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=SERVICE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def bench_detector(batch_sizes, n_estimators_values, repeat, workdir):
+    results = []
+    largest = max(batch_sizes)
+    records = make_records(largest)
+    training = make_records(10000, seed=1)
+
+    for n_estimators in n_estimators_values:
+        detector = AnomalyDetector(os.path.join(workdir, "bench.joblib"))
+        detector.model.set_params(n_estimators=n_estimators)
+        params = {"n_estimators": n_estimators, "batch_size": len(training)}
+        timing = measure(lambda: detector.train(training), repeat)
+        results.append({"name": "train", "params": params, **timing})
+
+        for batch_size in batch_sizes:
+            batch = records[:batch_size]
+            params = {"n_estimators": n_estimators, "batch_size": batch_size}
+            timing = measure(lambda: detector.preprocess_data(batch), repeat)
+            results.append({"name": "preprocess_data", "params": params, **timing})
+            timing = measure(lambda: detector.detect_anomalies(batch), repeat)
+            results.append({"name": "detect_anomalies", "params": params, **timing})
+
+        params = {"n_estimators": n_estimators, "batch_size": 1}
+        timing = measure(lambda: detector.get_anomaly_score(ANALYZE_RECORD), repeat)
+        results.append({"name": "get_anomaly_score", "params": params, **timing})
+        timing = measure(lambda: detector.analyze_anomaly(ANALYZE_RECORD), repeat)
+        results.append({"name": "analyze_anomaly", "params": params, **timing})
+    return results
+
+
+def bench_http(batch_sizes, repeat, workdir):
+    """Latency of POST /detect through the full FastAPI stack, without a network hop"""
+    from fastapi.testclient import TestClient
+
+    # main.py builds its detector and simulator at import time and writes into the working directory
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import main
+    finally:
+        os.chdir(cwd)
+    # Not used as a context manager, so the startup hook (and the simulator) never runs
+    client = TestClient(main.app)
+
+    results = []
+    for batch_size in batch_sizes:
+        payload = {"data": make_records(batch_size)}
+
+        def request():
+            response = client.post("/detect", json=payload)
+            response.raise_for_status()
+
+        timing = measure(request, repeat)
+        params = {"n_estimators": main.detector.model.n_estimators, "batch_size": batch_size}
+        results.append({"name": "http_detect", "params": params, **timing})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ML service hot paths")
+    parser.add_argument("--batch-sizes", type=int, nargs="+")
+    parser.add_argument("--n-estimators", type=int, nargs="+")
+    parser.add_argument("--http-batch-sizes", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="Smaller batch sizes for a fast smoke run")
+    parser.add_argument("--skip-http", action="store_true")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    batch_sizes = args.batch_sizes or (QUICK_BATCH_SIZES if args.quick else DEFAULT_BATCH_SIZES)
+    n_estimators_values = args.n_estimators or (QUICK_N_ESTIMATORS if args.quick else DEFAULT_N_ESTIMATORS)
+
+    workdir = tempfile.mkdtemp(prefix="ml-bench-")
+    results = bench_detector(batch_sizes, n_estimators_values, args.repeat, workdir)
+    if not args.skip_http:
+        results += bench_http(args.http_batch_sizes, args.repeat, workdir)
+
+    for r in results:
+        params = " ".join(f"{k}={v}" for k, v in r["params"].items())
+        print(f"{r['name']:<18} {params:<36} {r['median_seconds'] * 1000:>12.3f} ms")
+
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scikit-learn": sklearn.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+from typing import List, Optional, Protocol
+
+import numpy as np
+from sklearn.base import BaseEstimator
+from sklearn.ensemble import IsolationForest
+
+# Rows kept for partial_fit by detectors whose statistics cannot be updated in place
+DEFAULT_REFIT_WINDOW = 100000
+
+
+class Detector(Protocol):
+    """Batch anomaly scorer used by AnomalyDetector.
+
+    score_batch returns one score per row, higher meaning more anomalous; rows scoring
+    above threshold_ are anomalies. severity maps scores onto 0-1 for analysis.
+    Detectors with scaled_input receive standardized features, the others raw ones.
+    """
+
+    name: str
+    scaled_input: bool
+    threshold_: float
+
+    def fit(self, X: np.ndarray) -> "Detector": ...
+
+    def partial_fit(self, X: np.ndarray) -> "Detector": ...
+
+    def score_batch(self, X: np.ndarray) -> np.ndarray: ...
+
+    def severity(self, scores: np.ndarray) -> np.ndarray: ...
+
+
+class _RefitOnWindow:
+    """partial_fit by refitting on the most recent window rows"""
+
+    def partial_fit(self, X: np.ndarray):
+        recent = getattr(self, "_recent", None)
+        if recent is not None:
+            X = np.concatenate([recent, X])
+        return self.fit(X[-self.window:])
+
+    def _remember(self, X: np.ndarray):
+        # A copy, so a large training matrix is not kept alive through a view of its tail.
+        # It is kept through copies and in saved models, so partial_fit after a swap or a
+        # load_version still refits on the whole window rather than on the new rows alone
+        self._recent = X[-self.window:].copy()
+
+
+class IsolationForestDetector(_RefitOnWindow, BaseEstimator):
+    name = "isolation_forest"
+    scaled_input = True
+
+    def __init__(self, contamination=0.4, n_estimators=500, max_samples="auto", random_state=42, n_jobs=None,
+                 window=DEFAULT_REFIT_WINDOW):
+        self.contamination = contamination
+        self.n_estimators = n_estimators
+        self.max_samples = max_samples
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.window = window
+
+    def fit(self, X: np.ndarray):
+        self.forest_ = IsolationForest(
+            contamination=self.contamination,
+            n_estimators=self.n_estimators,
+            max_samples=self.max_samples,
+            random_state=self.random_state,
+            n_jobs=self.n_jobs
+        ).fit(X)
+        # IsolationForest flags score_samples below offset_; scores here are negated
+        self.threshold_ = -float(self.forest_.offset_)
+        self._remember(X)
+        return self
+
+    @classmethod
+    def from_forest(cls, forest: IsolationForest) -> "IsolationForestDetector":
+        """Wrap a fitted IsolationForest, as stored by model versions from before detectors"""
+        params = forest.get_params()
+        detector = cls(**{name: params[name] for name in cls._get_param_names() if name in params})
+        detector.forest_ = forest
+        detector.threshold_ = -float(forest.offset_)
+        return detector
+
+    def set_params(self, **params):
+        super().set_params(**params)
+        # Parallelism also applies to an already fitted forest, e.g. one loaded from the registry
+        if "n_jobs" in params and hasattr(self, "forest_"):
+            self.forest_.set_params(n_jobs=params["n_jobs"])
+        return self
+
+    def score_batch(self, X: np.ndarray) -> np.ndarray:
+        return -self.forest_.score_samples(X)
+
+    def severity(self, scores: np.ndarray) -> np.ndarray:
+        return np.minimum(1.0, scores / 2)
+
+
+class RobustZScoreDetector(_RefitOnWindow, BaseEstimator):
+    """Largest per-feature robust z-score, |x - median| / (1.4826 * MAD).
+
+    Scores are in standard deviations of a normal distribution, so the default
+    threshold of 3.5 is the usual outlier cut-off. With contamination, the threshold
+    is instead the score quantile that flags that share of the training rows.
+    """
+
+    name = "robust_zscore"
+    scaled_input = False
+
+    def __init__(self, threshold=3.5, contamination=None, columns=None, window=DEFAULT_REFIT_WINDOW):
+        self.threshold = threshold
+        self.contamination = contamination
+        self.columns = columns
+        self.window = window
+
+    def _values(self, X: np.ndarray) -> np.ndarray:
+        return X if self.columns is None else X[:, self.columns]
+
+    def fit(self, X: np.ndarray):
+        values = self._values(X)
+        self.median_ = np.median(values, axis=0)
+        mad = np.median(np.abs(values - self.median_), axis=0) * 1.4826
+        # Constant features would divide by zero; fall back to the standard deviation, then 1
+        fallback = values.std(axis=0)
+        self.scale_ = np.where(mad > 0, mad, np.where(fallback > 0, fallback, 1.0))
+        if self.contamination is not None:
+            self.threshold_ = float(np.quantile(self._score(values), 1 - self.contamination))
+        else:
+            self.threshold_ = float(self.threshold)
+        self._remember(X)
+        return self
+
+    def _score(self, values: np.ndarray) -> np.ndarray:
+        return np.max(np.abs(values - self.median_) / self.scale_, axis=1)
+
+    def score_batch(self, X: np.ndarray) -> np.ndarray:
+        return self._score(self._values(X))
+
+    def severity(self, scores: np.ndarray) -> np.ndarray:
+        return np.minimum(1.0, scores / (2 * self.threshold_))
+
+
+class HistogramDetector(BaseEstimator):
+    """Per-hour histogram density of each feature, with a training-score quantile threshold.
+
+    For every hour of the day and feature, fixed-bin counts give how common a value is
+    at that hour. A row scores the sum over features of -log(bin probability), so rows
+    whose values are rare for their hour score high. The threshold is the
+    1 - contamination quantile of the training scores. partial_fit only adds counts,
+    so the detector keeps learning in O(rows). Hours with fewer than min_hour_count
+    rows use the histogram of all hours.
+    """
+
+    name = "histogram"
+    scaled_input = False
+
+    def __init__(self, bins=32, contamination=0.1, columns=None, hour_column=None, hour_encoding="hour",
+                 min_hour_count=50, margin=0.5):
+        self.bins = bins
+        self.contamination = contamination
+        self.columns = columns
+        self.hour_column = hour_column
+        self.hour_encoding = hour_encoding
+        self.min_hour_count = min_hour_count
+        self.margin = margin
+
+    def _values(self, X: np.ndarray) -> np.ndarray:
+        return X if self.columns is None else X[:, self.columns]
+
+    def _hours(self, X: np.ndarray) -> np.ndarray:
+        if self.hour_column is None:
+            return np.zeros(len(X), dtype=np.int64)
+        if self.hour_encoding == "sincos":
+            # hour_sin and hour_cos are adjacent columns
+            angle = np.arctan2(X[:, self.hour_column], X[:, self.hour_column + 1])
+            return np.round(angle * 24 / (2 * np.pi)).astype(np.int64) % 24
+        return np.floor(X[:, self.hour_column]).astype(np.int64) % 24
+
+    def _bins(self, values: np.ndarray) -> np.ndarray:
+        # Values beyond the edges fall into the outermost bins
+        return np.column_stack([
+            np.clip(np.searchsorted(self.edges_[j], values[:, j], side="right") - 1, 0, self.bins - 1)
+            for j in range(values.shape[1])
+        ])
+
+    def fit(self, X: np.ndarray):
+        values = self._values(X)
+        low = values.min(axis=0)
+        high = values.max(axis=0)
+        # Leave room for values beyond the training range, so they get bins of their own
+        span = np.where(high > low, high - low, 1.0)
+        self.edges_ = np.linspace(low - self.margin * span, high + self.margin * span, self.bins + 1, axis=1)
+        self.counts_ = np.zeros((24, values.shape[1], self.bins), dtype=np.int64)
+        self._add(X)
+        self.threshold_ = float(np.quantile(self.score_batch(X), 1 - self.contamination))
+        return self
+
+    def partial_fit(self, X: np.ndarray):
+        if not hasattr(self, "counts_"):
+            return self.fit(X)
+        self._add(X)
+        return self
+
+    def _add(self, X: np.ndarray):
+        bins = self._bins(self._values(X))
+        hours = self._hours(X)
+        counts = self.counts_.copy()
+        for j in range(bins.shape[1]):
+            np.add.at(counts[:, j, :], (hours, bins[:, j]), 1)
+        self.counts_ = counts
+        self._update_surprise()
+
+    def _update_surprise(self):
+        # Every feature sees the same rows, so the first one gives the rows per hour
+        hour_totals = self.counts_[:, 0, :].sum(axis=-1)
+        overall = self.counts_.sum(axis=0)
+        # Add-one smoothing keeps empty bins at a finite, maximal score
+        surprise = -np.log((self.counts_ + 1) / (hour_totals[:, np.newaxis, np.newaxis] + self.bins))
+        overall_surprise = -np.log((overall + 1) / (hour_totals.sum() + self.bins))
+        surprise[hour_totals < self.min_hour_count] = overall_surprise
+        self.surprise_ = surprise
+
+    def score_batch(self, X: np.ndarray) -> np.ndarray:
+        bins = self._bins(self._values(X))
+        hours = self._hours(X)
+        features = np.arange(bins.shape[1])
+        return self.surprise_[hours[:, np.newaxis], features, bins].sum(axis=1)
+
+    def severity(self, scores: np.ndarray) -> np.ndarray:
+        return np.clip(scores / (2 * self.threshold_), 0.0, 1.0)
+
+
+DETECTORS = {
+    IsolationForestDetector.name: IsolationForestDetector,
+    RobustZScoreDetector.name: RobustZScoreDetector,
+    HistogramDetector.name: HistogramDetector
+}
+
+
+def make_detector(name: str, feature_names: List[str], n_jobs: Optional[int] = None, **params) -> Detector:
+    """Detector by name, configured for the columns of feature_names"""
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector '{name}', expected one of {list(DETECTORS)}")
+    if name == IsolationForestDetector.name:
+        return IsolationForestDetector(n_jobs=n_jobs, **params)
+
+    # Hour of day groups the histograms and is not a value to score
+    if "time_of_day" in feature_names:
+        hour_columns = [feature_names.index("time_of_day")]
+        hour = {"hour_column": hour_columns[0], "hour_encoding": "hour"}
+    elif "hour_sin" in feature_names:
+        hour_columns = [feature_names.index("hour_sin"), feature_names.index("hour_cos")]
+        hour = {"hour_column": hour_columns[0], "hour_encoding": "sincos"}
+    else:
+        hour_columns, hour = [], {}
+    columns = [i for i in range(len(feature_names)) if i not in hour_columns]
+    if name == HistogramDetector.name:
+        return HistogramDetector(columns=columns, **hour, **params)
+    return RobustZScoreDetector(columns=columns, **params)
+
+
+def parse_location_detectors(value: str) -> dict:
+    """"corridor_a=robust_zscore,corridor_b=histogram" -> {"corridor_a": "robust_zscore", ...}"""
+    mapping = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        location, _, name = item.partition("=")
+        if name not in DETECTORS:
+            raise ValueError(f"Unknown detector '{name}' for location '{location}'")
+        mapping[location.strip()] = name
+    return mapping
@@ -0,0 +1,185 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+from features import DEFAULT_LOCATION, TEMPORAL_MAX_LOCATIONS
+
+# Measurements monitored for sustained shifts
+DRIFT_FEATURES = ["vehicle_count", "average_speed", "congestion_level"]
+
+
+class PageHinkley:
+    """Two-sided Page-Hinkley test on one stream, in constant memory.
+
+    Values are standardized with a running mean/std of the current regime, so delta
+    (tolerated drift per sample) and threshold (alarm level) are in standard deviations
+    and the same settings work for counts, speeds and ratios.
+    """
+
+    __slots__ = ("delta", "threshold", "min_samples", "n", "mean", "m2",
+                 "cum_up", "min_up", "cum_down", "min_down")
+
+    def __init__(self, delta: float = 0.25, threshold: float = 25.0, min_samples: int = 30):
+        self.delta = delta
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.cum_up = 0.0
+        self.min_up = 0.0
+        self.cum_down = 0.0
+        self.min_down = 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def update(self, x: float) -> Optional[str]:
+        """Feed one value; returns "increase" or "decrease" when a change point is detected"""
+        if self.n >= self.min_samples:
+            std = self.std or 1.0
+            z = (x - self.mean) / std
+            self.cum_up += z - self.delta
+            self.min_up = min(self.min_up, self.cum_up)
+            self.cum_down += -z - self.delta
+            self.min_down = min(self.min_down, self.cum_down)
+            if self.cum_up - self.min_up > self.threshold:
+                return "increase"
+            if self.cum_down - self.min_down > self.threshold:
+                return "decrease"
+        # Welford update of the regime baseline
+        self.n += 1
+        change = x - self.mean
+        self.mean += change / self.n
+        self.m2 += change * (x - self.mean)
+        return None
+
+
+class DriftMonitor:
+    """Change-point detection per location and feature, alongside the point detector.
+
+    A change point is reported as a "regime_change" anomaly. When change points across
+    all streams reach retrain_threshold within retrain_window seconds, the input
+    distribution is considered to have drifted and on_drift is called, at most once per
+    cooldown period. Like the feature extractor's windows, at most max_locations
+    locations are tracked, dropping the one updated longest ago. Updates may come from
+    several threads.
+    """
+
+    def __init__(self,
+                 features: List[str] = None,
+                 delta: float = 0.25,
+                 threshold: float = 25.0,
+                 min_samples: int = 30,
+                 retrain_threshold: int = 3,
+                 retrain_window: float = 600.0,
+                 retrain_cooldown: float = 1800.0,
+                 on_drift: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 max_locations: int = TEMPORAL_MAX_LOCATIONS):
+        self.features = features or DRIFT_FEATURES
+        self.delta = delta
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.retrain_threshold = retrain_threshold
+        self.retrain_window = retrain_window
+        self.retrain_cooldown = retrain_cooldown
+        self.on_drift = on_drift
+        self.max_locations = max_locations
+        # Streams by location, least recently updated location first
+        self._streams: "OrderedDict[str, Dict[str, PageHinkley]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._recent_changes = deque()
+        self._last_drift_signal: Optional[float] = None
+        self.change_points = deque(maxlen=100)
+
+    def _location_streams(self, location: str) -> Dict[str, PageHinkley]:
+        streams = self._streams.get(location)
+        if streams is None:
+            streams = self._streams[location] = {
+                feature: PageHinkley(self.delta, self.threshold, self.min_samples) for feature in self.features
+            }
+            if len(self._streams) > self.max_locations:
+                self._streams.popitem(last=False)
+        else:
+            self._streams.move_to_end(location)
+        return streams
+
+    def update(self, record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Feed one record; returns a regime_change anomaly for each stream that shifted"""
+        with self._lock:
+            anomalies = self._update(record)
+        # Outside the lock: on_drift may take a while, and other records keep being fed meanwhile
+        if anomalies:
+            self._record_changes(len(anomalies))
+        return anomalies
+
+    def _update(self, record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        location = record.get("location", DEFAULT_LOCATION)
+        streams = self._location_streams(location)
+        anomalies = []
+        for feature in self.features:
+            stream = streams[feature]
+            baseline = stream.mean
+            direction = stream.update(float(record[feature]))
+            if direction is None:
+                continue
+            magnitude = abs(record[feature] - baseline) / (stream.std or 1.0)
+            anomaly = {
+                "anomaly_type": "regime_change",
+                "location": location,
+                "feature": feature,
+                "direction": direction,
+                "baseline": baseline,
+                "value": record[feature],
+                "severity": min(1.0, magnitude / 4),
+                "timestamp": record.get("timestamp"),
+                "description": f"Sustained {direction} in {feature} at {location}: "
+                               f"baseline {baseline:.2f}, now {record[feature]:.2f}"
+            }
+            # Start learning the new regime from scratch
+            stream.reset()
+            anomalies.append(anomaly)
+            self.change_points.append(anomaly)
+        return anomalies
+
+    def _prune(self, now: float):
+        while self._recent_changes and now - self._recent_changes[0] > self.retrain_window:
+            self._recent_changes.popleft()
+
+    def _record_changes(self, count: int):
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(count):
+                self._recent_changes.append(now)
+            self._prune(now)
+            if len(self._recent_changes) < self.retrain_threshold:
+                return
+            if self._last_drift_signal is not None and now - self._last_drift_signal < self.retrain_cooldown:
+                return
+            self._last_drift_signal = now
+            change_points = len(self._recent_changes)
+        if self.on_drift is not None:
+            try:
+                self.on_drift({
+                    "change_points": change_points,
+                    "window_seconds": self.retrain_window
+                })
+            except Exception as e:
+                # The records that showed the drift were scored all the same; do not fail them
+                print(f"Error handling input drift: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            self._prune(time.monotonic())
+            return {
+                "streams": len(self._streams) * len(self.features),
+                "recent_change_points": len(self._recent_changes),
+                "retrain_threshold": self.retrain_threshold,
+                "change_points": list(self.change_points)
+            }
@@ -0,0 +1,288 @@
+import math
+import os
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_LOCATION = "default"
+# Locations whose history is kept; the one updated longest ago is dropped beyond this
+TEMPORAL_MAX_LOCATIONS = int(os.getenv("ML_TEMPORAL_MAX_LOCATIONS", "10000"))
+
+# Raw measurements tracked over the rolling window, in input order
+WINDOW_COLUMNS = ["vehicle_count", "average_speed", "congestion_level"]
+
+TEMPORAL_FEATURE_NAMES = [
+    "vehicle_count",
+    "average_speed",
+    "congestion_level",
+    # time_of_day on the unit circle, so 23h and 0h are neighbours
+    "hour_sin",
+    "hour_cos",
+    # Difference from the rolling mean of the previous K records at the same location
+    "vehicle_count_delta",
+    "average_speed_delta",
+    # Same difference in rolling standard deviations
+    "vehicle_count_zscore",
+    "average_speed_zscore",
+    "congestion_level_zscore",
+    # Change per second since the previous record at the same location
+    "vehicle_count_rate",
+    "average_speed_rate"
+]
+
+
+def _parse_timestamp(value) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+class _LocationWindow:
+    """Last K measurements of one location with running sums for O(1) mean/variance"""
+
+    __slots__ = ("values", "sums", "sq_sums", "last_timestamp")
+
+    def __init__(self, size: int):
+        self.values = deque(maxlen=size)
+        self.sums = [0.0] * len(WINDOW_COLUMNS)
+        self.sq_sums = [0.0] * len(WINDOW_COLUMNS)
+        self.last_timestamp: Optional[float] = None
+
+    def push(self, x, timestamp: Optional[float]):
+        if len(self.values) == self.values.maxlen:
+            old = self.values[0]
+            for j in range(len(WINDOW_COLUMNS)):
+                self.sums[j] -= old[j]
+                self.sq_sums[j] -= old[j] * old[j]
+        self.values.append(x)
+        for j in range(len(WINDOW_COLUMNS)):
+            self.sums[j] += x[j]
+            self.sq_sums[j] += x[j] * x[j]
+        if timestamp is not None:
+            self.last_timestamp = timestamp
+
+    def reset_sums(self):
+        """Recompute the running sums from the window, e.g. after a bulk update"""
+        values = np.array(self.values, dtype=np.float64).reshape(-1, len(WINDOW_COLUMNS))
+        self.sums = values.sum(axis=0).tolist()
+        self.sq_sums = (values * values).sum(axis=0).tolist()
+
+
+class StreamingFeatureExtractor:
+    """Windowed temporal features maintained incrementally per location.
+
+    Each record is described relative to the K records that preceded it at the same
+    location. Scoring a record also appends it to its location's history, unless it is
+    not newer than what was already seen there: replays and out-of-order records are
+    scored against the current window without modifying it. Features of recently
+    processed records are cached by (location, timestamp), so analysing a record that
+    was just scored reuses the features it was scored with. At most max_locations
+    histories are kept: a sensor that went quiet is forgotten first, and starts again
+    from an empty window if it comes back.
+    """
+
+    feature_names = TEMPORAL_FEATURE_NAMES
+
+    def __init__(self, window: int = 20, cache_size: int = 4096, max_locations: int = TEMPORAL_MAX_LOCATIONS):
+        self.window = window
+        self.cache_size = cache_size
+        self.max_locations = max_locations
+        # Least recently updated first
+        self._windows: "OrderedDict[str, _LocationWindow]" = OrderedDict()
+        self._cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def spawn(self) -> "StreamingFeatureExtractor":
+        """Empty extractor with the same settings, e.g. to featurize training history"""
+        return StreamingFeatureExtractor(self.window, self.cache_size, self.max_locations)
+
+    def transform_record(self, record: Dict[str, Any], update: bool = True) -> np.ndarray:
+        with self._lock:
+            return self._transform_record(record, update)
+
+    def transform_batch(self, records: List[Dict[str, Any]], update: bool = True) -> np.ndarray:
+        """Features for a batch in arrival order, vectorized over the rolling windows of each location"""
+        if len(records) == 1:
+            return self.transform_record(records[0], update)[np.newaxis, :]
+        with self._lock:
+            return self._transform_batch(records, update)
+
+    def _cache_key(self, record: Dict[str, Any]) -> Optional[tuple]:
+        timestamp = record.get("timestamp")
+        if timestamp is None:
+            return None
+        return record.get("location", DEFAULT_LOCATION), str(timestamp)
+
+    def _remember(self, key: Optional[tuple], features: np.ndarray):
+        if key is None:
+            return
+        self._cache[key] = features
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _updated_window(self, location: str, window: Optional[_LocationWindow]) -> _LocationWindow:
+        """window, or a new one for location, marked as the most recently updated"""
+        if window is None:
+            window = self._windows[location] = _LocationWindow(self.window)
+            if len(self._windows) > self.max_locations:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(location)
+        return window
+
+    def _transform_record(self, record: Dict[str, Any], update: bool) -> np.ndarray:
+        key = self._cache_key(record)
+        if key is not None and key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        location = record.get("location", DEFAULT_LOCATION)
+        window = self._windows.get(location)
+        timestamp = _parse_timestamp(record.get("timestamp"))
+        x = [float(record[column]) for column in WINDOW_COLUMNS]
+        hour = float(record["time_of_day"])
+
+        features = np.empty(len(TEMPORAL_FEATURE_NAMES), dtype=np.float64)
+        features[0:3] = x
+        features[3] = math.sin(2 * math.pi * hour / 24)
+        features[4] = math.cos(2 * math.pi * hour / 24)
+        n = len(window.values) if window is not None else 0
+        deltas = [0.0] * len(WINDOW_COLUMNS)
+        zscores = [0.0] * len(WINDOW_COLUMNS)
+        for j in range(len(WINDOW_COLUMNS)):
+            if n:
+                mean = window.sums[j] / n
+                std = math.sqrt(max(window.sq_sums[j] / n - mean * mean, 0.0))
+                deltas[j] = x[j] - mean
+                zscores[j] = deltas[j] / std if std > 1e-9 else 0.0
+        features[5:7] = deltas[0:2]
+        features[7:10] = zscores
+        if n:
+            previous = window.values[-1]
+            dt = 1.0
+            if timestamp is not None and window.last_timestamp is not None and timestamp > window.last_timestamp:
+                dt = timestamp - window.last_timestamp
+            features[10] = (x[0] - previous[0]) / dt
+            features[11] = (x[1] - previous[1]) / dt
+        else:
+            features[10:12] = 0.0
+
+        if update:
+            is_newer = timestamp is None or window is None or window.last_timestamp is None \
+                or timestamp > window.last_timestamp
+            if is_newer:
+                window = self._updated_window(location, window)
+                window.push(x, timestamp)
+                self._remember(key, features)
+        return features
+
+    def _transform_batch(self, records: List[Dict[str, Any]], update: bool) -> np.ndarray:
+        out = np.empty((len(records), len(TEMPORAL_FEATURE_NAMES)), dtype=np.float64)
+        # Records are grouped per location; cached and stale records take the per-record path
+        groups: Dict[str, List[int]] = {}
+        for i, record in enumerate(records):
+            key = self._cache_key(record)
+            if key is not None and key in self._cache:
+                out[i] = self._cache[key]
+                continue
+            groups.setdefault(record.get("location", DEFAULT_LOCATION), []).append(i)
+
+        for location, indices in groups.items():
+            window = self._windows.get(location)
+            last_seen = window.last_timestamp if window is not None else None
+            timestamps = np.array(
+                [_parse_timestamp(records[i].get("timestamp")) for i in indices], dtype=np.float64
+            )
+            fresh = np.ones(len(indices), dtype=bool)
+            if last_seen is not None:
+                fresh = ~(timestamps <= last_seen)
+            # Within the batch each fresh record must also be newer than the previous fresh one
+            running = np.fmax.accumulate(np.where(np.isnan(timestamps), -np.inf, timestamps))
+            fresh[1:] &= ~(timestamps[1:] <= running[:-1])
+
+            fresh_indices = [indices[k] for k in np.flatnonzero(fresh)]
+            if fresh_indices:
+                out[fresh_indices] = self._window_features(
+                    location, [records[i] for i in fresh_indices], timestamps[fresh], update
+                )
+            for k in np.flatnonzero(~fresh):
+                out[indices[k]] = self._transform_record(records[indices[k]], update=False)
+        return out
+
+    def transform_columns(self, location: str, raw: np.ndarray, timestamps: np.ndarray) -> np.ndarray:
+        """Features of records of one location, given as rows of WINDOW_COLUMNS + time_of_day in time
+        order with epoch second timestamps (e.g. a TrafficStore window), without building dicts.
+        The location's history is read but not updated."""
+        with self._lock:
+            return self._column_features(location, raw, timestamps, update=False)
+
+    def _window_features(self, location: str, records: List[Dict[str, Any]], timestamps: np.ndarray,
+                         update: bool) -> np.ndarray:
+        raw = np.array([[r[column] for column in WINDOW_COLUMNS] + [r["time_of_day"]] for r in records],
+                       dtype=np.float64)
+        features = self._column_features(location, raw, timestamps, update)
+        if update:
+            for record, row in zip(records, features):
+                self._remember(self._cache_key(record), row)
+        return features
+
+    def _column_features(self, location: str, raw: np.ndarray, timestamps: np.ndarray,
+                         update: bool) -> np.ndarray:
+        n_columns = len(WINDOW_COLUMNS)
+        x = raw[:, :n_columns]
+        window = self._windows.get(location)
+        history = np.array(window.values, dtype=np.float64).reshape(-1, n_columns) if window else \
+            np.empty((0, n_columns))
+        m = len(history)
+        seq = np.vstack([history, x])
+        zeros = np.zeros((1, n_columns))
+        cumsum = np.vstack([zeros, np.cumsum(seq, axis=0)])
+        cumsum_sq = np.vstack([zeros, np.cumsum(seq * seq, axis=0)])
+
+        # Record k of the batch sits at position p in seq and sees seq[lo:p] as its window
+        positions = m + np.arange(len(raw))
+        lo = np.maximum(0, positions - self.window)
+        counts = (positions - lo)[:, np.newaxis]
+        safe_counts = np.maximum(counts, 1)
+        means = (cumsum[positions] - cumsum[lo]) / safe_counts
+        variances = np.maximum((cumsum_sq[positions] - cumsum_sq[lo]) / safe_counts - means * means, 0.0)
+        stds = np.sqrt(variances)
+        deltas = np.where(counts > 0, x - means, 0.0)
+        zscores = np.divide(deltas, stds, out=np.zeros_like(deltas), where=stds > 1e-9)
+
+        # Previous record and its timestamp for the rate of change
+        previous_timestamp = window.last_timestamp if window is not None and window.last_timestamp is not None \
+            else np.nan
+        prev_ts = np.concatenate([[previous_timestamp], timestamps[:-1]])
+        dt = timestamps - prev_ts
+        dt = np.where(np.isnan(dt) | (dt <= 0), 1.0, dt)
+        has_previous = positions > 0
+        previous = seq[np.maximum(positions - 1, 0)]
+        rates = np.where(has_previous[:, np.newaxis], (x - previous) / dt[:, np.newaxis], 0.0)
+
+        hours = raw[:, n_columns]
+        features = np.column_stack([
+            x,
+            np.sin(2 * np.pi * hours / 24),
+            np.cos(2 * np.pi * hours / 24),
+            deltas[:, 0:2],
+            zscores,
+            rates[:, 0:2]
+        ])
+
+        if update:
+            window = self._updated_window(location, window)
+            window.values.clear()
+            window.values.extend(map(tuple, seq[-self.window:].tolist()))
+            window.reset_sums()
+            valid = timestamps[~np.isnan(timestamps)]
+            if len(valid):
+                window.last_timestamp = float(valid.max())
+        return features
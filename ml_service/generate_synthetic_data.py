@@ -2,65 +2,116 @@ import random
 from datetime import datetime, timedelta
 import json
 
-def generate_normal_traffic():
+import numpy as np
+
+# Value ranges per ground-truth label: (low, high) inclusive for counts and hours, [low, high) for floats
+NORMAL_PROFILE = {
+    'vehicle_count': (50, 150),
+    'average_speed': (40, 70),
+    'congestion_level': (0.3, 0.7)
+}
+ANOMALY_PROFILES = {
+    'high_traffic_volume': {
+        'vehicle_count': (151, 250),
+        'average_speed': (20, 35),
+        'congestion_level': (0.7, 0.9)
+    },
+    'traffic_congestion': {
+        'vehicle_count': (80, 150),
+        'average_speed': (5, 19),
+        'congestion_level': (0.8, 1.0)
+    },
+    'speeding_violation': {
+        'vehicle_count': (20, 50),
+        'average_speed': (81, 120),
+        'congestion_level': (0.1, 0.3)
+    }
+}
+NORMAL_LABEL = 'normal'
+LABELS = [NORMAL_LABEL] + list(ANOMALY_PROFILES)
+
+def _record(profile):
     return {
-        'vehicle_count': random.randint(50, 150),
-        'average_speed': random.uniform(40, 70),
-        'congestion_level': random.uniform(0.3, 0.7),
+        'vehicle_count': random.randint(*profile['vehicle_count']),
+        'average_speed': random.uniform(*profile['average_speed']),
+        'congestion_level': random.uniform(*profile['congestion_level']),
         'time_of_day': random.randint(0, 23),
         'timestamp': datetime.now().isoformat()
     }
 
-def generate_anomaly():
-    anomaly_types = [
-        # High traffic volume anomaly
-        lambda: {
-            'vehicle_count': random.randint(151, 250),
-            'average_speed': random.uniform(20, 35),
-            'congestion_level': random.uniform(0.7, 0.9),
-            'time_of_day': random.randint(0, 23),
-            'timestamp': datetime.now().isoformat()
-        },
-        # Traffic congestion anomaly
-        lambda: {
-            'vehicle_count': random.randint(80, 150),
-            'average_speed': random.uniform(5, 19),
-            'congestion_level': random.uniform(0.8, 1.0),
-            'time_of_day': random.randint(0, 23),
-            'timestamp': datetime.now().isoformat()
-        },
-        # Speeding violation anomaly
-        lambda: {
-            'vehicle_count': random.randint(20, 50),
-            'average_speed': random.uniform(81, 120),
-            'congestion_level': random.uniform(0.1, 0.3),
-            'time_of_day': random.randint(0, 23),
-            'timestamp': datetime.now().isoformat()
-        }
-    ]
-    return random.choice(anomaly_types)()
-
-def generate_dataset(num_normal=50, num_anomalies=10):
+def generate_normal_traffic(with_label=False):
+    record = _record(NORMAL_PROFILE)
+    if with_label:
+        record['label'] = NORMAL_LABEL
+    return record
+
+def generate_anomaly(with_label=False):
+    label = random.choice(list(ANOMALY_PROFILES))
+    record = _record(ANOMALY_PROFILES[label])
+    if with_label:
+        record['label'] = label
+    return record
+
+def generate_dataset(num_normal=50, num_anomalies=10, with_label=False):
     data = []
-    
+
     # Generate normal traffic data
     for _ in range(num_normal):
-        data.append(generate_normal_traffic())
-    
+        data.append(generate_normal_traffic(with_label))
+
     # Generate anomalies
     for _ in range(num_anomalies):
-        data.append(generate_anomaly())
-    
+        data.append(generate_anomaly(with_label))
+
     # Shuffle the data to mix normal and anomalous patterns
     random.shuffle(data)
     return data
 
+def generate_labeled_arrays(num_normal, num_anomalies, seed=None):
+    """Labeled dataset as NumPy columns, built without per-record Python work.
+
+    Returns a dict with vehicle_count, average_speed, congestion_level and
+    time_of_day arrays plus 'label', an array of indices into LABELS.
+    Anomalies are spread evenly over the anomaly types, like generate_anomaly.
+    """
+    rng = np.random.default_rng(seed)
+    n = num_normal + num_anomalies
+    labels = np.zeros(n, dtype=np.int8)
+    labels[num_normal:] = rng.integers(1, len(LABELS), num_anomalies)
+    rng.shuffle(labels)
+
+    columns = {
+        'vehicle_count': np.empty(n, dtype=np.int64),
+        'average_speed': np.empty(n, dtype=np.float64),
+        'congestion_level': np.empty(n, dtype=np.float64)
+    }
+    for index, label in enumerate(LABELS):
+        mask = labels == index
+        count = int(mask.sum())
+        profile = NORMAL_PROFILE if label == NORMAL_LABEL else ANOMALY_PROFILES[label]
+        low, high = profile['vehicle_count']
+        columns['vehicle_count'][mask] = rng.integers(low, high + 1, count)
+        columns['average_speed'][mask] = rng.uniform(*profile['average_speed'], count)
+        columns['congestion_level'][mask] = rng.uniform(*profile['congestion_level'], count)
+    columns['time_of_day'] = rng.integers(0, 24, n)
+    columns['label'] = labels
+    return columns
+
 def save_to_file(data, filename='synthetic_traffic_data.json'):
     with open(filename, 'w') as f:
         json.dump(data, f, indent=2)
 
 if __name__ == '__main__':
-    # Generate synthetic dataset with 50 normal records and 10 anomalies
-    dataset = generate_dataset()
-    save_to_file(dataset)
-    print(f'Generated {len(dataset)} traffic records with anomalies')
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate synthetic traffic records")
+    parser.add_argument('--normal', type=int, default=50)
+    parser.add_argument('--anomalies', type=int, default=10)
+    parser.add_argument('--labels', action='store_true', help="Keep the ground-truth type of each record as 'label'")
+    parser.add_argument('--output', default='synthetic_traffic_data.json')
+    args = parser.parse_args()
+
+    # Generate synthetic dataset with 50 normal records and 10 anomalies by default
+    dataset = generate_dataset(args.normal, args.anomalies, with_label=args.labels)
+    save_to_file(dataset, args.output)
+    print(f'Generated {len(dataset)} traffic records with anomalies')
@@ -0,0 +1,157 @@
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, or_
+
+# Geohashes are stored at this precision (cells of about 5 m); queries use prefixes of them
+GEOHASH_PRECISION = 9
+# Bounding boxes are covered by at most this many geohash cells, each one index range scan
+MAX_COVER_CELLS = 32
+KM_PER_DEGREE = 111.32
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Geohash of a point: nearby points share long prefixes, so a prefix is a rectangular cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def encode_array(latitudes: np.ndarray, longitudes: np.ndarray, precision: int = GEOHASH_PRECISION) -> List[str]:
+    """encode() over arrays of points: quantize each coordinate, then interleave the bits"""
+    bits = 5 * precision
+    lon_bits, lat_bits = bits - bits // 2, bits // 2
+    lon_cells = np.clip(np.floor((np.asarray(longitudes) + 180) / 360 * 2 ** lon_bits), 0, 2 ** lon_bits - 1)
+    lat_cells = np.clip(np.floor((np.asarray(latitudes) + 90) / 180 * 2 ** lat_bits), 0, 2 ** lat_bits - 1)
+    lon_cells, lat_cells = lon_cells.astype(np.uint64), lat_cells.astype(np.uint64)
+    interleaved = np.zeros(len(lon_cells), dtype=np.uint64)
+    # Geohash bits alternate longitude, latitude, ..., most significant first
+    for bit in range(bits):
+        cells, position = (lon_cells, lon_bits - 1 - bit // 2) if bit % 2 == 0 else (lat_cells, lat_bits - 1 - bit // 2)
+        interleaved = (interleaved << np.uint64(1)) | ((cells >> np.uint64(position)) & np.uint64(1))
+    shifts = np.arange(precision - 1, -1, -1, dtype=np.uint64) * np.uint64(5)
+    codes = (interleaved[:, np.newaxis] >> shifts) & np.uint64(31)
+    characters = np.frombuffer(_BASE32.encode(), dtype=np.uint8)[codes]
+    return np.ascontiguousarray(characters).view(f"S{precision}").ravel().astype(str).tolist()
+
+
+def encode_optional(latitude: Optional[float], longitude: Optional[float]) -> Optional[str]:
+    if latitude is None or longitude is None:
+        return None
+    return encode(latitude, longitude)
+
+
+def _cell_size(precision: int) -> Tuple[float, float]:
+    """(height, width) in degrees of a geohash cell"""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** (bits - bits // 2)
+
+
+def _successor(prefix: str) -> Optional[str]:
+    """Smallest geohash prefix sorting after every geohash starting with prefix"""
+    while prefix:
+        position = _BASE32.index(prefix[-1])
+        if position < len(_BASE32) - 1:
+            return prefix[:-1] + _BASE32[position + 1]
+        prefix = prefix[:-1]
+    return None
+
+
+def cover(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[Tuple[str, Optional[str]]]:
+    """[start, end) geohash ranges of the cells covering a bounding box, adjacent cells merged"""
+    precision = GEOHASH_PRECISION
+    while precision > 1:
+        height, width = _cell_size(precision)
+        rows = math.floor((max_lat + 90) / height) - math.floor((min_lat + 90) / height) + 1
+        columns = math.floor((max_lon + 180) / width) - math.floor((min_lon + 180) / width) + 1
+        if rows * columns <= MAX_COVER_CELLS:
+            break
+        precision -= 1
+    height, width = _cell_size(precision)
+    cells = set()
+    for row in range(math.floor((min_lat + 90) / height), math.floor((max_lat + 90) / height) + 1):
+        for column in range(math.floor((min_lon + 180) / width), math.floor((max_lon + 180) / width) + 1):
+            # Encoding the cell's centre yields the cell's own geohash
+            latitude = min(-90 + (row + 0.5) * height, 90.0)
+            longitude = min(-180 + (column + 0.5) * width, 180.0)
+            cells.add(encode(latitude, longitude, precision))
+    ranges: List[Tuple[str, Optional[str]]] = []
+    for cell in sorted(cells):
+        end = _successor(cell)
+        if ranges and ranges[-1][1] == cell:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((cell, end))
+    return ranges
+
+
+def parse_bbox(value: str) -> Tuple[float, float, float, float]:
+    """"min_lon,min_lat,max_lon,max_lat" (GeoJSON order) as (min_lat, min_lon, max_lat, max_lon)"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(","))
+    except ValueError:
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180):
+        raise ValueError("bbox must lie within [-180, 180] x [-90, 90] with min <= max "
+                         "(boxes across the antimeridian are not supported)")
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def radius_bbox(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """Bounding box of a circle, clamped to the valid coordinate range"""
+    lat_delta = radius_km / KM_PER_DEGREE
+    lon_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+    return (max(latitude - lat_delta, -90.0), max(longitude - lon_delta, -180.0),
+            min(latitude + lat_delta, 90.0), min(longitude + lon_delta, 180.0))
+
+
+def bbox_condition(model, min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+    """Filter for rows of model (with latitude, longitude and geohash columns) inside the box.
+
+    The geohash ranges narrow the search through the geohash index; the coordinate
+    comparisons then drop what the covering cells include beyond the box.
+    """
+    ranges = [
+        and_(model.geohash >= start, model.geohash < end) if end is not None else model.geohash >= start
+        for start, end in cover(min_lat, min_lon, max_lat, max_lon)
+    ]
+    return and_(
+        or_(*ranges),
+        model.latitude.between(min_lat, max_lat),
+        model.longitude.between(min_lon, max_lon)
+    )
+
+
+def radius_condition(model, latitude: float, longitude: float, radius_km: float):
+    """Filter for rows of model within radius_km of a point.
+
+    Distance uses the equirectangular approximation, plain arithmetic that every
+    database evaluates; it is within 0.5% of the great-circle distance below ~100 km.
+    """
+    lon_scale = KM_PER_DEGREE * math.cos(math.radians(latitude))
+    dy = (model.latitude - latitude) * KM_PER_DEGREE
+    dx = (model.longitude - longitude) * lon_scale
+    return and_(bbox_condition(model, *radius_bbox(latitude, longitude, radius_km)),
+                dx * dx + dy * dy <= radius_km * radius_km)
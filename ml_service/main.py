@@ -1,10 +1,35 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from typing import List, Dict, Any
+# First, so the config file is applied before other modules read their variables at import time
+from settings import settings
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Header, Query, Request
+from fastapi.responses import PlainTextResponse, Response
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional
 from model import AnomalyDetector
 from realtime_traffic import RealtimeTrafficSimulator
+from streaming import StreamingTrainer, iter_ndjson_chunks, iter_parquet_chunks, iter_db_chunks, train_streaming
+from detectors import parse_location_detectors
+from drift import DriftMonitor
+from durable_queue import DurableQueue
+from pipeline import ScoringPipeline, TrafficProducer
+from process_lock import ProcessLock
+from registry import ModelRegistry
+from schema import SchemaError, describe as describe_schema, validate
+from metrics import DRIFT_RETRAINS, instrument_detector, metrics_response, record_request_metrics
+from profiling import (
+    MAX_SAMPLING_SECONDS, TimedRoute, format_collapsed,
+    request_profiler, require_profiling_access, sampling_profiler, server_timing_middleware, timing_span
+)
+import hmac
+import json
+import os
 import uvicorn
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# Largest chunk and reservoir a training request may ask for; the reservoir is allocated up front,
+# at 8 bytes per feature per row
+MAX_TRAINING_CHUNK_SIZE = 100000
+MAX_TRAINING_RESERVOIR_SIZE = 1000000
 
 app = FastAPI(
     title="Traffic Anomaly Detection ML Service",
@@ -12,71 +37,390 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Routes declared below separate endpoint time from serialization time for Server-Timing
+app.router.route_class = TimedRoute
+
+if settings.profiling_enabled:
+    app.middleware("http")(server_timing_middleware)
+    app.middleware("http")(request_profiler)
+app.middleware("http")(record_request_metrics)
+
 # Initialize components
-detector = AnomalyDetector()
+# Time every detector call, including the simulator's own instance
+instrument_detector(AnomalyDetector)
+detector = AnomalyDetector(
+    n_jobs=settings.n_jobs,
+    parallel_backend=settings.parallel_backend,
+    score_chunk_size=settings.score_chunk_size,
+    temporal_window=settings.temporal_window,
+    # Versioned models shared by every worker
+    registry=ModelRegistry(settings.model_registry) if settings.model_registry else None,
+    detector=settings.detector,
+    # Per-location overrides
+    location_detectors=parse_location_detectors(settings.location_detectors),
+    detector_params=settings.detector_params()
+)
+
+# One thread, so a retrain requested while another runs waits for it instead of overlapping
+retrain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="drift-retrain")
+
+def retrain_on_drift(signal: Dict[str, Any]):
+    """Refit the shared detector on the simulator's recent history once the input has drifted"""
+    print(f"Input drift detected ({signal['change_points']} change points), retraining model")
+
+    def retrain():
+        try:
+            detector.train(simulator.recent())
+            DRIFT_RETRAINS.labels(outcome="success").inc()
+        except Exception as e:
+            DRIFT_RETRAINS.labels(outcome="error").inc()
+            print(f"Error retraining after drift: {e}")
+
+    # Called from the simulator's or the scorer's worker thread, which has no event loop.
+    # Training is CPU bound; it runs on its own thread, off the event loop that serves /detect
+    retrain_executor.submit(retrain)
+
+drift_monitor = DriftMonitor(
+    threshold=settings.drift_threshold,
+    retrain_threshold=settings.drift_retrain_threshold,
+    on_drift=retrain_on_drift
+)
+# With a queue path, simulated records flow through the durable queue: the simulator produces,
+# the scoring pipeline scores, and the backend persists; otherwise they are scored inline
+# and shared through the data file
+traffic_queue = DurableQueue(settings.traffic_queue_path) if settings.traffic_queue_path else None
+producer = TrafficProducer(traffic_queue) if traffic_queue is not None else None
+scoring_pipeline = ScoringPipeline(traffic_queue, detector, drift_monitor) if traffic_queue is not None else None
 simulator = RealtimeTrafficSimulator(
-    data_interval=1.0,  # Generate data every second
-    anomaly_probability=0.2,  # 20% chance of anomaly
-    save_interval=5.0  # Save to file every 5 seconds
+    data_interval=settings.simulator_interval,
+    anomaly_probability=settings.anomaly_probability,
+    save_interval=settings.simulator_save_interval,
+    data_file=settings.traffic_data_file,
+    detector=detector,  # Share the model and per-location history with the API
+    drift_monitor=drift_monitor,
+    producer=producer
 )
 
+# The simulator, producer and scoring pipeline write shared state (the data file, the queue and its
+# consumer offsets), so with several worker processes only one runs them; the lock sits next to that state
+background_lock = ProcessLock((settings.traffic_queue_path or settings.traffic_data_file) + ".lock")
+
 # Background task to run the simulator
 async def run_simulator():
     await simulator.start_simulation()
 
-# Start the simulator when the application starts
-@app.on_event("startup")
-async def startup_event():
+async def start_background_jobs():
     try:
+        if traffic_queue is not None:
+            await producer.start()
+            await scoring_pipeline.start()
+            print(f"Started the scoring pipeline on {traffic_queue.path}")
         # Create a background task for the simulator
         asyncio.create_task(run_simulator())
         print("Started real-time traffic simulator")
     except Exception as e:
         print(f"Error starting simulator: {e}")
 
+async def elect_background_worker():
+    """Start the background jobs once this worker holds the lock, e.g. after the worker running them exited"""
+    loop = asyncio.get_running_loop()
+    while not await loop.run_in_executor(None, background_lock.acquire):
+        await asyncio.sleep(settings.background_election_seconds)
+    print(f"Worker {os.getpid()} runs the simulator")
+    await start_background_jobs()
+
+async def follow_active_model():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(settings.registry_poll_seconds)
+        try:
+            if await loop.run_in_executor(None, detector.sync_with_registry):
+                print(f"Switched to model {detector.model_version}")
+        except Exception as e:
+            print(f"Error loading the active model: {e}")
+
+# Start the simulator when the application starts
+@app.on_event("startup")
+async def startup_event():
+    asyncio.create_task(elect_background_worker())
+    if detector.registry is not None:
+        asyncio.create_task(follow_active_model())
+
 # Cleanup when the application shuts down
 @app.on_event("shutdown")
 async def shutdown_event():
     simulator.stop_simulation()
+    retrain_executor.shutdown(wait=False)
+    if traffic_queue is not None and background_lock.held:
+        # Queue what was generated and finish scoring the current batch
+        await producer.stop()
+        await scoring_pipeline.stop()
+    # Hand the background jobs over to another worker
+    background_lock.release()
 
 class TrafficData(BaseModel):
     data: List[Dict[str, Any]]
 
+class TrainingSource(BaseModel):
+    source: str  # ndjson, parquet, database
+    path: Optional[str] = None
+    start: Optional[str] = None
+    end: Optional[str] = None
+    chunk_size: int = Field(10000, ge=1, le=MAX_TRAINING_CHUNK_SIZE)
+    reservoir_size: int = Field(100000, ge=1, le=MAX_TRAINING_RESERVOIR_SIZE)
+
+def validate_records(records: List[Dict[str, Any]]):
+    """422 listing the records that do not match the feature schema"""
+    try:
+        validate(records)
+    except SchemaError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+
+def require_api_key(x_api_key: Optional[str] = Header(None)):
+    """Bulk training (/train/stream, /train/source) needs the ML_API_KEY shared secret as X-API-Key"""
+    if not settings.api_key:
+        raise HTTPException(status_code=404, detail="Set ML_API_KEY to enable bulk training")
+    if not hmac.compare_digest(x_api_key or "", settings.api_key):
+        raise HTTPException(status_code=403, detail="Invalid API key")
+
+def training_file(path: Optional[str]) -> str:
+    """path resolved inside the training data directory; 400 for anything outside it"""
+    directory = os.path.realpath(settings.training_data_dir)
+    resolved = os.path.realpath(os.path.join(directory, path or ""))
+    if not path or os.path.commonpath([directory, resolved]) != directory or resolved == directory:
+        raise HTTPException(status_code=400, detail=f"path must name a file in {settings.training_data_dir}")
+    return resolved
+
 @app.post("/detect")
 async def detect_anomalies(data: TrafficData):
+    validate_records(data.data)
     try:
-        anomalies = detector.detect_anomalies(data.data)
+        with timing_span("model"):
+            anomalies = detector.detect_anomalies(data.data)
         return {"anomalies": anomalies}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/analyze")
 async def analyze_anomaly(data: Dict[str, Any]):
+    validate_records([data])
     try:
-        analysis = detector.analyze_anomaly(data)
+        with timing_span("model"):
+            analysis = detector.analyze_anomaly(data)
         return analysis
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analyze/batch")
+async def analyze_batch(data: TrafficData):
+    validate_records(data.data)
+    try:
+        with timing_span("model"):
+            analyses = detector.analyze_batch(data.data)
+        return {"analyses": analyses}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/models")
+async def list_models():
+    if detector.registry is None:
+        raise HTTPException(status_code=404, detail="Model registry is disabled")
+    registry = detector.registry
+    return {
+        "serving": detector.model_version,
+        "active": registry.active_version(),
+        "history": registry.history(),
+        "versions": [registry.metadata(version) for version in registry.versions()]
+    }
+
+@app.post("/models/{version}/activate")
+async def activate_model(version: str):
+    if detector.registry is None:
+        raise HTTPException(status_code=404, detail="Model registry is disabled")
+    try:
+        # Validate by loading before other workers are pointed at it
+        await asyncio.get_running_loop().run_in_executor(None, detector.load_version, version)
+        detector.registry.activate(version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"message": f"Model {version} activated", "version": version}
+
+@app.post("/models/rollback")
+async def rollback_model():
+    if detector.registry is None:
+        raise HTTPException(status_code=404, detail="Model registry is disabled")
+    try:
+        version = detector.registry.rollback_target()
+        # Like activation, load first, so a version that fails to load leaves every worker on the current one
+        await asyncio.get_running_loop().run_in_executor(None, detector.load_version, version)
+        detector.registry.rollback(expected=version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"message": f"Rolled back to model {version}", "version": version}
+
+@app.get("/pipeline")
+async def pipeline_status():
+    if traffic_queue is None:
+        raise HTTPException(status_code=404, detail="Traffic queue is disabled")
+    return await asyncio.get_running_loop().run_in_executor(None, traffic_queue.status)
+
+@app.get("/drift")
+async def drift_status():
+    return drift_monitor.status()
+
+@app.get("/traffic/window")
+async def traffic_window(location: Optional[str] = None, minutes: float = 15.0, score: bool = False):
+    """Simulated records of a location (the simulator's own have none) in the last minutes of its history,
+    optionally scored straight from the in-memory store"""
+    def query():
+        rows = simulator.store.window(location, seconds=minutes * 60)
+        records = simulator.store.to_records(rows, location)
+        if score and len(rows):
+            flags, severities = detector.score_columns(rows["values"], rows["timestamp"] / 1e6, location)
+            for record, is_anomaly, severity in zip(records, flags.tolist(), severities.tolist()):
+                record["is_anomaly"] = is_anomaly
+                record["severity"] = severity
+        return records
+
+    records = await asyncio.get_running_loop().run_in_executor(None, query)
+    return {"location": location, "minutes": minutes, "count": len(records), "records": records}
+
+@app.get("/schema")
+async def feature_schema():
+    return {"features": describe_schema()}
+
+@app.get("/settings")
+async def runtime_settings():
+    return settings.describe()
+
+@app.get("/metrics")
+async def metrics():
+    return metrics_response()
+
+@app.post("/profiling/requests", dependencies=[Depends(require_profiling_access)])
+async def profile_next_requests(route: str, count: int = 1):
+    if count < 1 or count > 100:
+        raise HTTPException(status_code=400, detail="count must be between 1 and 100")
+    request_profiler.arm(route, count)
+    return {"message": f"Profiling the next {count} request(s) to {route}"}
+
+@app.get("/profiling/requests", dependencies=[Depends(require_profiling_access)])
+async def list_request_profiles():
+    return {
+        "armed": request_profiler.armed(),
+        "profiles": [result.summary() for result in request_profiler.results]
+    }
+
+@app.get("/profiling/requests/{profile_id}", dependencies=[Depends(require_profiling_access)])
+async def get_request_profile(profile_id: int, format: str = "text", limit: int = 50):
+    result = request_profiler.get(profile_id)
+    if not result:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "pstats":
+        return Response(
+            result.to_bytes(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f"attachment; filename=request-{profile_id}.prof"}
+        )
+    return PlainTextResponse(result.text(limit))
+
+@app.post("/profiling/sample", dependencies=[Depends(require_profiling_access)])
+async def sample_profile(seconds: float = 10.0, interval_ms: float = 5.0):
+    if seconds <= 0 or seconds > MAX_SAMPLING_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {MAX_SAMPLING_SECONDS}")
+    if sampling_profiler.busy:
+        raise HTTPException(status_code=409, detail="A sampling session is already running")
+    # Sample from a worker thread so the event loop keeps serving the traffic being profiled
+    stacks = await asyncio.get_running_loop().run_in_executor(
+        None, sampling_profiler.run, seconds, interval_ms / 1000
+    )
+    return PlainTextResponse(format_collapsed(stacks))
+
 @app.get("/")
 async def root():
     return {
         "service": "Traffic Anomaly Detection ML Service",
         "status": "running",
-        "simulator_running": simulator.is_running
+        "simulator_running": simulator.is_running,
+        "simulator": simulator.stats(),
+        "model_version": detector.model_version,
+        "detector": detector.model.name,
+        "location_detectors": {location: model.name for location, model in detector.location_models.items()}
     }
 
-if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8001)
-
 @app.post("/train")
 async def train_model(data: TrafficData):
+    validate_records(data.data)
     try:
-        traffic_data = [d.dict() for d in data.data]
-        detector.train(traffic_data)
+        # Fitting takes seconds to minutes; keep the event loop serving other requests meanwhile
+        await asyncio.get_running_loop().run_in_executor(None, detector.train, data.data)
         return {"message": "Model trained successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/train/stream", dependencies=[Depends(require_api_key)])
+async def train_model_stream(request: Request,
+                             chunk_size: int = Query(10000, ge=1, le=MAX_TRAINING_CHUNK_SIZE),
+                             reservoir_size: int = Query(100000, ge=1, le=MAX_TRAINING_RESERVOIR_SIZE)):
+    """Train from an NDJSON request body, consumed incrementally instead of parsed as one JSON document.
+
+    Each chunk is checked against the feature schema like /train's records; the first invalid
+    one ends the request with a 422 and leaves the serving model as it was.
+    """
+    trainer = StreamingTrainer(detector, reservoir_size)
+    loop = asyncio.get_running_loop()
+    buffer = b""
+    chunk = []
+    first = 0
+
+    def update(records: List[Dict[str, Any]], first: int):
+        validate(records, first)
+        trainer.update(records)
+
+    try:
+        async for body_part in request.stream():
+            buffer += body_part
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    chunk.append(json.loads(line))
+            if len(chunk) >= chunk_size:
+                # Validation, feature extraction and the final fit run in a thread, like /train
+                await loop.run_in_executor(None, update, chunk, first)
+                first += len(chunk)
+                chunk = []
+        if buffer.strip():
+            chunk.append(json.loads(buffer))
+        await loop.run_in_executor(None, update, chunk, first)
+        stats = await loop.run_in_executor(None, trainer.finish)
+        return {"message": "Model trained successfully", **stats}
+    except SchemaError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/train/source", dependencies=[Depends(require_api_key)])
+def train_model_from_source(source: TrainingSource):
+    """Train from a file in the training data directory or the traffic_data table on the server side, in chunks"""
+    if source.source == "ndjson":
+        chunks = iter_ndjson_chunks(training_file(source.path), source.chunk_size)
+    elif source.source == "parquet":
+        chunks = iter_parquet_chunks(training_file(source.path), source.chunk_size)
+    elif source.source == "database":
+        chunks = iter_db_chunks(chunk_size=source.chunk_size, start=source.start, end=source.end)
+    else:
+        raise HTTPException(status_code=400, detail=f"Unknown training source: {source.source}")
+    try:
+        stats = train_streaming(detector, chunks, reservoir_size=source.reservoir_size)
+        return {"message": "Model trained successfully", **stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8002, reload=True)
\ No newline at end of file
+    # Last, so every route above is registered; an import string lets uvicorn reload and fork workers
+    uvicorn.run("main:app", host=settings.host, port=settings.port, reload=settings.reload,
+                workers=None if settings.reload else settings.workers)
\ No newline at end of file
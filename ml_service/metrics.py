@@ -0,0 +1,110 @@
+import functools
+import time
+
+from fastapi import Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.routing import Match
+
+REQUEST_LATENCY = Histogram(
+    "ml_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"]
+)
+INFERENCE_LATENCY = Histogram(
+    "ml_detector_call_duration_seconds",
+    "Time spent inside AnomalyDetector methods",
+    ["method"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+BATCH_SIZE = Histogram(
+    "ml_detect_batch_size",
+    "Records per detect_anomalies call",
+    buckets=(1, 10, 100, 1000, 10000, 100000, 1000000)
+)
+ROWS_SCORED = Counter("ml_rows_scored_total", "Records scored by the detector")
+ANOMALIES_DETECTED = Counter("ml_anomalies_detected_total", "Anomalies detected by type", ["anomaly_type"])
+DRIFT_RETRAINS = Counter("ml_drift_retrains_total", "Model retrainings triggered by input drift", ["outcome"])
+SIMULATOR_TICK_LAG = Histogram(
+    "ml_simulator_tick_lag_seconds",
+    "How late each simulator tick started relative to its schedule",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+SIMULATOR_TICKS_DROPPED = Counter(
+    "ml_simulator_ticks_dropped_total",
+    "Simulator ticks skipped because the previous tick overran its slot"
+)
+QUEUE_LAG = Gauge(
+    "ml_queue_consumer_lag_messages",
+    "Messages of a queue topic not yet committed by a consumer",
+    ["consumer", "topic"]
+)
+
+# AnomalyDetector methods wrapped with timing hooks
+INSTRUMENTED_METHODS = ["preprocess_data", "detect_anomalies", "get_anomaly_score", "analyze_anomaly", "analyze_batch",
+                        "detect_and_analyze", "train", "fit_features"]
+
+
+def _timed(name, method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            INFERENCE_LATENCY.labels(method=name).observe(time.perf_counter() - start)
+        if name in ("detect_anomalies", "detect_and_analyze"):
+            rows = len(args[0]) if args else len(kwargs.get("data", []))
+            BATCH_SIZE.observe(rows)
+            ROWS_SCORED.inc(rows)
+        if name == "detect_and_analyze":
+            for _, analysis in result:
+                ANOMALIES_DETECTED.labels(anomaly_type=analysis["anomaly_type"]).inc()
+        elif name == "analyze_anomaly":
+            ANOMALIES_DETECTED.labels(anomaly_type=result["anomaly_type"]).inc()
+        elif name == "analyze_batch":
+            for analysis in result:
+                ANOMALIES_DETECTED.labels(anomaly_type=analysis["anomaly_type"]).inc()
+        return result
+    wrapper.__wrapped_by_metrics__ = True
+    return wrapper
+
+
+def instrument_detector(detector_cls):
+    """Wrap the hot AnomalyDetector methods so every instance reports timings"""
+    for name in INSTRUMENTED_METHODS:
+        method = getattr(detector_cls, name, None)
+        if method is None or getattr(method, "__wrapped_by_metrics__", False):
+            continue
+        setattr(detector_cls, name, _timed(name, method))
+    return detector_cls
+
+
+def route_template(request: Request) -> str:
+    """Route path template for labels, so /items/1 and /items/2 share a series"""
+    route = request.scope.get("route")
+    if route is None:
+        for candidate in request.app.routes:
+            match, _ = candidate.matches(request.scope)
+            if match == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", "unmatched")
+
+
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        REQUEST_LATENCY.labels(
+            method=request.method,
+            route=route_template(request),
+            status=str(status_code)
+        ).observe(time.perf_counter() - start)
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
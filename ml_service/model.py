@@ -1,20 +1,117 @@
 import numpy as np
+from sklearn.base import clone
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+import copy
 import joblib
 import os
+import time
+
+from detectors import Detector, IsolationForestDetector, make_detector
+from features import DEFAULT_LOCATION, StreamingFeatureExtractor
+from registry import ModelRegistry, scaler_stats, timestamp_window
+from schema import FEATURE_COLUMNS, to_matrix
+
+DEFAULT_ANOMALY_TYPE = "unusual_pattern"
+# Anomaly type by the measurement that contributes most to a record's deviation, and its direction
+ATTRIBUTED_TYPES = {
+    ("vehicle_count", 1): "high_traffic_volume",
+    ("average_speed", -1): "traffic_congestion",
+    ("average_speed", 1): "speeding_violation",
+    ("congestion_level", 1): "severe_congestion"
+}
+DESCRIPTION_TEMPLATES = {
+    "high_traffic_volume": "Unusually {level} traffic volume detected with {vehicle_count} vehicles",
+    "traffic_congestion": "{Level} congestion detected with average speed of {average_speed}km/h",
+    "speeding_violation": "{Level} speed violation detected with average speed of {average_speed}km/h",
+    "severe_congestion": "{Level} congestion detected with congestion level {congestion_level}",
+    "unusual_pattern": "{Level} anomaly detected in traffic pattern"
+}
+
+
+def feature_measurements(feature_names: List[str]) -> List[str]:
+    """The measurement (a FEATURE_COLUMNS entry) each feature describes: temporal deltas, z-scores and
+    rates count for their measurement, the hour encoding for time_of_day"""
+    return [
+        "time_of_day" if name.startswith("hour_") else next(column for column in FEATURE_COLUMNS
+                                                              if name.startswith(column))
+        for name in feature_names
+    ]
+
+
+def attribute(standardized: np.ndarray, feature_names: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """(contributions, anomaly types) of rows of features standardized with the training scaler.
+
+    A row's deviation is its squared distance from the training mean in standard deviations.
+    Column j of contributions is the share of it coming from the features of FEATURE_COLUMNS[j].
+    The type follows from the measurement with the largest share and the sign of its deviation.
+    """
+    measurements = feature_measurements(feature_names)
+    membership = np.array([[measurement == column for column in FEATURE_COLUMNS] for measurement in measurements],
+                          dtype=np.float64)
+    squared = (standardized * standardized) @ membership
+    total = squared.sum(axis=1, keepdims=True)
+    contributions = np.divide(squared, total, out=np.zeros_like(squared), where=total > 0)
+    top = contributions.argmax(axis=1)
+    direction = np.sign((standardized @ membership)[np.arange(len(top)), top]).astype(np.int64)
+    table = np.full((len(FEATURE_COLUMNS), 3), DEFAULT_ANOMALY_TYPE, dtype=object)
+    for (column, sign), name in ATTRIBUTED_TYPES.items():
+        table[FEATURE_COLUMNS.index(column), sign + 1] = name
+    return contributions, table[top, direction + 1]
+
+# Locations with a detector of their own need this many training rows to fit on them alone;
+# with fewer, their detector is fitted on every location's rows
+LOCATION_MIN_ROWS = 200
+
+# Training rows scored after each fit to summarize the new model in its registry metadata
+EVALUATION_SAMPLE_SIZE = 10000
+
+# Map the user facing parallel backend names onto joblib backends
+PARALLEL_BACKENDS = {
+    "threads": "threading",
+    "processes": "loky"
+}
 
 class AnomalyDetector:
-    def __init__(self, model_path: str = "isolation_forest.joblib"):
+    def __init__(self,
+                 model_path: str = "isolation_forest.joblib",
+                 n_jobs: Optional[int] = None,
+                 parallel_backend: str = "threads",
+                 score_chunk_size: int = 50000,
+                 temporal_window: Optional[int] = None,
+                 registry: Optional[ModelRegistry] = None,
+                 detector: str = IsolationForestDetector.name,
+                 location_detectors: Optional[Dict[str, str]] = None,
+                 detector_params: Optional[Dict[str, Dict[str, Any]]] = None):
+        if parallel_backend not in PARALLEL_BACKENDS:
+            raise ValueError(f"parallel_backend must be one of {list(PARALLEL_BACKENDS)}")
         self.model_path = model_path
-        self.model = IsolationForest(
-            contamination=0.4,  # Increased to detect more anomalies
-            random_state=42,
-            n_estimators=500,  # Increased for better detection
-            max_samples='auto'
-        )
+        # n_jobs follows the joblib convention: None/1 is serial, -1 uses every core
+        self.n_jobs = n_jobs
+        self.parallel_backend = parallel_backend
+        # Batches larger than this are split into row chunks and scored in parallel
+        self.score_chunk_size = score_chunk_size
+        # With a window size, records are described relative to recent history at their location
+        self.feature_extractor = StreamingFeatureExtractor(temporal_window) if temporal_window else None
+        # Detector for every location without one of its own in location_detectors
+        self.detector = detector
+        self.location_detectors = dict(location_detectors or {})
+        # Constructor parameters by detector name, e.g. {"isolation_forest": {"n_estimators": 200}}
+        self.detector_params = dict(detector_params or {})
+        self.model: Detector = self._make_model(detector)
+        self.location_models: Dict[str, Detector] = {}
         self.scaler = StandardScaler()
+        # With a registry, every fit is published as a new version and startup loads the active one
+        self.registry = registry
+        self.model_version: Optional[str] = None
+        self.model_metadata: Optional[Dict[str, Any]] = None
+        if registry is not None and registry.active_version() is not None:
+            try:
+                self.load_version()
+                return
+            except (KeyError, ValueError) as e:
+                print(f"Not using the active registry model: {e}")
         # Initialize with more diverse default data
         default_data = [
             {"vehicle_count": 100, "average_speed": 60.0, "congestion_level": 0.5, "time_of_day": 8.0},
@@ -23,86 +120,321 @@ class AnomalyDetector:
             {"vehicle_count": 300, "average_speed": 25.0, "congestion_level": 0.9, "time_of_day": 17.0},
             {"vehicle_count": 80, "average_speed": 65.0, "congestion_level": 0.3, "time_of_day": 22.0}
         ]
-        # Train the model with default data
-        X = self.preprocess_data(default_data)
-        self.model.fit(X)
-        joblib.dump(self.model, self.model_path)
+        # Train the model with default data; this bootstrap model is not published
+        self.train(default_data, publish=False)
     
-    def load_or_train_model(self):
-        if os.path.exists(self.model_path):
-            self.model = joblib.load(self.model_path)
+    @property
+    def feature_names(self) -> List[str]:
+        if self.feature_extractor is not None:
+            return self.feature_extractor.feature_names
+        return FEATURE_COLUMNS
+
+    def training_extractor(self) -> Optional[StreamingFeatureExtractor]:
+        """Fresh extractor for featurizing training history without touching the live windows"""
+        return self.feature_extractor.spawn() if self.feature_extractor is not None else None
+
+    def extract_features(self,
+                         data: List[Dict[str, Any]],
+                         extractor: Optional[StreamingFeatureExtractor] = None,
+                         update: bool = True) -> np.ndarray:
+        extractor = extractor or self.feature_extractor
+        if extractor is not None:
+            return extractor.transform_batch(data, update=update)
+        return to_matrix(data)
+
+    def preprocess_data(self, data: List[Dict[str, Any]], fit: bool = False, update: bool = True) -> np.ndarray:
+        if fit:
+            features = self.extract_features(data, extractor=self.training_extractor())
         else:
-            self.model = IsolationForest(
-                contamination=0.1,
-                random_state=42
-            )
-            # Train with some default data if model doesn't exist
-            default_data = [
-                {"vehicle_count": 100, "average_speed": 60.0, "congestion_level": 0.5, "time_of_day": 12.0},
-                {"vehicle_count": 150, "average_speed": 55.0, "congestion_level": 0.6, "time_of_day": 13.0},
-                {"vehicle_count": 200, "average_speed": 50.0, "congestion_level": 0.7, "time_of_day": 14.0}
-            ]
-            self.train(default_data)
-    
-    def preprocess_data(self, data: List[Dict[str, Any]]) -> np.ndarray:
-        features = np.array([
-            [
-                d['vehicle_count'],
-                d['average_speed'],
-                d['congestion_level'],
-                d['time_of_day']
-            ] for d in data
-        ])
-        return self.scaler.fit_transform(features)
+            features = self.extract_features(data, update=update)
+        # The scaler is only fitted on training data; scoring reuses its statistics
+        # so a single record is not standardized against itself
+        if fit:
+            return self.scaler.fit_transform(features)
+        return self.scaler.transform(features)
     
     def detect_anomalies(self, data: List[Dict[str, Any]]) -> List[bool]:
         if not data:
             return []
-        
-        X = self.preprocess_data(data)
-        predictions = self.model.predict(X)
+
+        features = self.extract_features(data)
+        predictions = np.empty(len(data), dtype=bool)
+        # Each location is judged by its own detector and threshold
+        for model, rows in self._groups(data):
+            predictions[rows] = self.score_batch(features[rows], model) > model.threshold_
         # Convert predictions to Python native boolean values
-        return [bool(pred == -1) for pred in predictions]
-    
-    def train(self, training_data: List[Dict[str, Any]]):
-        X = self.preprocess_data(training_data)
-        self.model.fit(X)
-        joblib.dump(self.model, self.model_path)
+        return predictions.tolist()
+
+    def _groups(self, data: List[Dict[str, Any]]):
+        """(detector, row selector) pairs covering every record of data"""
+        location_models = self.location_models
+        if not location_models:
+            yield self.model, slice(None)
+            return
+        locations = np.array([d.get("location", DEFAULT_LOCATION) for d in data], dtype=object)
+        default_rows = np.ones(len(data), dtype=bool)
+        for location, model in location_models.items():
+            rows = locations == location
+            if rows.any():
+                yield model, rows
+                default_rows &= ~rows
+        if default_rows.any():
+            yield self.model, default_rows
+
+    def model_for(self, location: Optional[str]) -> Detector:
+        return self.location_models.get(location or DEFAULT_LOCATION, self.model)
+
+    def score_batch(self, features: np.ndarray, model: Optional[Detector] = None) -> np.ndarray:
+        """Anomaly scores of raw feature rows (higher is more anomalous) from model, the default detector
+        by default. Large batches are split into row chunks scored in parallel."""
+        model = model or self.model
+        X = self.scaler.transform(features) if model.scaled_input else features
+        if self.n_jobs in (None, 1) or len(X) <= self.score_chunk_size:
+            return model.score_batch(X)
+        chunks = [X[i:i + self.score_chunk_size] for i in range(0, len(X), self.score_chunk_size)]
+        scores = joblib.Parallel(n_jobs=self.n_jobs, backend=PARALLEL_BACKENDS[self.parallel_backend])(
+            joblib.delayed(model.score_batch)(chunk) for chunk in chunks
+        )
+        return np.concatenate(scores)
+
+    def _new_model(self, name: str, current: Optional[Detector]) -> Detector:
+        # Keep parameters set on the current detector (e.g. by benchmarks) when it is of the configured kind
+        if getattr(current, "name", None) == name:
+            return clone(current)
+        return self._make_model(name)
+
+    def _make_model(self, name: str) -> Detector:
+        return make_detector(name, self.feature_names, n_jobs=self.n_jobs, **self.detector_params.get(name, {}))
+
+    def _fit(self, features: np.ndarray, scaler: StandardScaler, data_window: Optional[Dict[str, Any]] = None,
+             publish: bool = True, locations: Optional[np.ndarray] = None):
+        X_scaled = scaler.transform(features)
+        start = time.perf_counter()
+        model = self._new_model(self.detector, self.model)
+        # Tree construction is distributed by the forest itself; the context picks the backend
+        with joblib.parallel_backend(PARALLEL_BACKENDS[self.parallel_backend], n_jobs=self.n_jobs):
+            model.fit(X_scaled if model.scaled_input else features)
+            location_models = {}
+            location_rows = {}
+            for location, name in self.location_detectors.items():
+                location_model = self._new_model(name, self.location_models.get(location))
+                rows = locations == location if locations is not None else None
+                if rows is None or rows.sum() < LOCATION_MIN_ROWS:
+                    rows = slice(None)
+                location_model.fit(X_scaled[rows] if location_model.scaled_input else features[rows])
+                location_models[location] = location_model
+                location_rows[location] = len(features[rows])
+        fit_seconds = time.perf_counter() - start
+        version = None
+        metadata = None
+        if self.registry is not None and publish:
+            metadata = self._metadata(model, location_models, location_rows, scaler, features, data_window,
+                                      fit_seconds)
+            version = self.registry.publish({"model": model, "scaler": scaler, "location_models": location_models},
+                                            metadata)
+            metadata = self.registry.metadata(version)
+        elif self.registry is None:
+            joblib.dump(model, self.model_path)
+        # Swap in the new model only once fitting finished, so concurrent scoring keeps working
+        self.model = model
+        self.location_models = location_models
+        self.scaler = scaler
+        self.model_version = version
+        self.model_metadata = metadata
+
+    def _metadata(self, model: Detector, location_models: Dict[str, Detector], location_rows: Dict[str, int],
+                  scaler: StandardScaler, features: np.ndarray, data_window: Optional[Dict[str, Any]],
+                  fit_seconds: float) -> Dict[str, Any]:
+        sample = features[np.random.default_rng(0).choice(len(features), EVALUATION_SAMPLE_SIZE, replace=False)] \
+            if len(features) > EVALUATION_SAMPLE_SIZE else features
+        X = scaler.transform(sample) if model.scaled_input else sample
+        scores = model.score_batch(X)
+        return {
+            "feature_names": list(self.feature_names),
+            "temporal_window": self.feature_extractor.window if self.feature_extractor is not None else None,
+            "data_window": data_window or {"rows": len(features)},
+            "scaler": scaler_stats(scaler),
+            "detector": model.name,
+            "params": {name: value for name, value in model.get_params().items() if name != "n_jobs"},
+            "threshold": model.threshold_,
+            "location_detectors": {
+                location: {
+                    "detector": location_model.name,
+                    "threshold": location_model.threshold_,
+                    "training_rows": location_rows[location]
+                }
+                for location, location_model in location_models.items()
+            },
+            "fit_seconds": fit_seconds,
+            "metrics": {
+                "evaluated_rows": len(sample),
+                "training_anomaly_rate": float(np.mean(scores > model.threshold_)),
+                "score_quantiles": {str(q): float(np.quantile(scores, q)) for q in (0.01, 0.1, 0.5, 0.9, 0.99)}
+            }
+        }
+
+    def _locations(self, data: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not self.location_detectors:
+            return None
+        return np.array([d.get("location", DEFAULT_LOCATION) for d in data], dtype=object)
+
+    def train(self, training_data: List[Dict[str, Any]], publish: bool = True):
+        features = self.extract_features(training_data, extractor=self.training_extractor())
+        scaler = StandardScaler().fit(features)
+        self._fit(features, scaler, timestamp_window(training_data), publish, self._locations(training_data))
+
+    def fit_features(self, features: np.ndarray, scaler: Optional[StandardScaler] = None,
+                     data_window: Optional[Dict[str, Any]] = None, locations: Optional[np.ndarray] = None):
+        """Fit the detectors on raw feature rows, standardized with the given (already fitted) scaler for
+        detectors that take scaled input. Without locations, per-location detectors fit on every row."""
+        scaler = scaler or self.scaler
+        self._fit(features, scaler, data_window, locations=locations)
+
+    def partial_fit(self, data: List[Dict[str, Any]]):
+        """Update the detectors with new records without a full refit or a new model version.
+
+        Histogram detectors only add the records to their counts; the others refit on
+        their recent window. The scaler keeps its statistics so scores stay comparable.
+        """
+        if not data:
+            return
+        features = self.extract_features(data, extractor=self.training_extractor())
+        locations = np.array([d.get("location", DEFAULT_LOCATION) for d in data], dtype=object)
+        # Update copies and swap them in, so concurrent scoring never sees a half-updated detector
+        model = copy.deepcopy(self.model)
+        location_models = {location: copy.deepcopy(m) for location, m in self.location_models.items()}
+        default_rows = np.ones(len(data), dtype=bool)
+        for location, location_model in location_models.items():
+            rows = locations == location
+            if rows.any():
+                location_model.partial_fit(
+                    self.scaler.transform(features[rows]) if location_model.scaled_input else features[rows]
+                )
+                default_rows &= ~rows
+        if default_rows.any():
+            model.partial_fit(self.scaler.transform(features[default_rows]) if model.scaled_input
+                              else features[default_rows])
+        self.model = model
+        self.location_models = location_models
+
+    def load_version(self, version: Optional[str] = None, mmap: Optional[bool] = None):
+        """Serve a registry version, the active one by default"""
+        if mmap is None:
+            artifact, metadata = self.registry.load(version)
+        else:
+            artifact, metadata = self.registry.load(version, mmap=mmap)
+        if metadata["feature_names"] != list(self.feature_names):
+            raise ValueError(f"Model {metadata['version']} was trained on features {metadata['feature_names']}, "
+                             f"this detector extracts {list(self.feature_names)}")
+        model = artifact["model"]
+        if isinstance(model, IsolationForest):
+            model = IsolationForestDetector.from_forest(model)
+        location_models = artifact.get("location_models", {})
+        # Parallelism is a property of this process, not of the artifact
+        for detector in [model, *location_models.values()]:
+            if "n_jobs" in detector.get_params():
+                detector.set_params(n_jobs=self.n_jobs)
+        self.model = model
+        self.location_models = location_models
+        self.scaler = artifact["scaler"]
+        self.model_version = metadata["version"]
+        self.model_metadata = metadata
+
+    def sync_with_registry(self) -> bool:
+        """Load the active version if another process activated a different one; returns whether it did"""
+        if self.registry is None:
+            return False
+        active = self.registry.active_version()
+        if active is None or active == self.model_version:
+            return False
+        self.load_version(active)
+        return True
     
     def get_anomaly_score(self, data_point: Dict[str, Any]) -> float:
-        X = self.preprocess_data([data_point])
-        return -self.model.score_samples(X)[0]
+        # Scoring a single point for analysis must not advance the location's history
+        features = self.extract_features([data_point], update=False)
+        return float(self.score_batch(features, self.model_for(data_point.get("location")))[0])
     
     def analyze_anomaly(self, data_point: Dict[str, Any]) -> Dict[str, Any]:
-        score = self.get_anomaly_score(data_point)
-        severity = min(1.0, score / 2)  # Normalize score to 0-1 range
-        
-        analysis = {
-            "severity": severity,
-            "anomaly_type": self._determine_anomaly_type(data_point),
-            "description": self._generate_description(data_point, severity)
-        }
-        return analysis
-    
-    def _determine_anomaly_type(self, data: Dict[str, Any]) -> str:
-        if data['vehicle_count'] > 150:  # Further lowered threshold
-            return "high_traffic_volume"
-        elif data['average_speed'] < 40:  # Increased threshold
-            return "traffic_congestion"
-        elif data['average_speed'] > 60:  # Lowered threshold
-            return "speeding_violation"
-        elif data['congestion_level'] > 0.6:  # Lowered threshold
-            return "severe_congestion"
-        return "unusual_pattern"
+        return self._analyze([data_point])[0]
     
-    def _generate_description(self, data: Dict[str, Any], severity: float) -> str:
-        anomaly_type = self._determine_anomaly_type(data)
-        severity_level = "high" if severity > 0.7 else "moderate" if severity > 0.4 else "low"
-        
-        descriptions = {
-            "high_traffic_volume": f"Unusually {severity_level} traffic volume detected with {data['vehicle_count']} vehicles",
-            "traffic_congestion": f"{severity_level.capitalize()} congestion detected with average speed of {data['average_speed']}km/h",
-            "speeding_violation": f"{severity_level.capitalize()} speed violation detected with average speed of {data['average_speed']}km/h",
-            "unusual_pattern": f"{severity_level.capitalize()} anomaly detected in traffic pattern"
-        }
-        return descriptions[anomaly_type]
\ No newline at end of file
+    def analyze_batch(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """analyze_anomaly for many records, scored in one pass per detector"""
+        if not data:
+            return []
+        return self._analyze(data)
+
+    def _analyze(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        features = self.extract_features(data, update=False)
+        severities = np.empty(len(data))
+        for model, rows in self._groups(data):
+            # Normalize scores to 0-1, on the scale of the detector that produced them
+            severities[rows] = model.severity(self.score_batch(features[rows], model))
+        return self._analyses(data, features, severities)
+
+    def detect_and_analyze(self, data: List[Dict[str, Any]],
+                           extractor: Optional[StreamingFeatureExtractor] = None) -> List[Tuple[int, Dict[str, Any]]]:
+        """(index, analysis) of every anomalous record of data, scoring each record once.
+
+        With an extractor, temporal features come from its windows instead of the live ones.
+        """
+        if not data:
+            return []
+        features = self.extract_features(data, extractor=extractor)
+        positions = np.arange(len(data))
+        flagged_rows = []
+        flagged_severities = []
+        for model, rows in self._groups(data):
+            scores = self.score_batch(features[rows], model)
+            flagged = scores > model.threshold_
+            flagged_rows.append(positions[rows][flagged])
+            flagged_severities.append(model.severity(scores[flagged]))
+        indices = np.concatenate(flagged_rows)
+        order = np.argsort(indices, kind="stable")
+        indices = indices[order]
+        severities = np.concatenate(flagged_severities)[order]
+        analyses = self._analyses([data[i] for i in indices.tolist()], features[indices], severities)
+        return list(zip(indices.tolist(), analyses))
+
+    def score_columns(self, values: np.ndarray, timestamps: np.ndarray,
+                      location: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(anomaly flags, severities) of one location's records in time order, given as an (n, 4) array
+        of FEATURE_COLUMNS and epoch second timestamps, e.g. a TrafficStore window.
+
+        Without temporal features the array is scored as is. With them, each record is described
+        relative to the records before it in the array, not the live history.
+        """
+        features = values
+        if self.feature_extractor is not None:
+            features = self.feature_extractor.spawn().transform_columns(location or DEFAULT_LOCATION, values,
+                                                                         timestamps)
+        model = self.model_for(location)
+        scores = self.score_batch(features, model)
+        return scores > model.threshold_, model.severity(scores)
+
+    def explain(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(contributions, anomaly types) of raw feature rows, see attribute()"""
+        return attribute(self.scaler.transform(features), self.feature_names)
+
+    def _analyses(self, data: List[Dict[str, Any]], features: np.ndarray,
+                  severities: np.ndarray) -> List[Dict[str, Any]]:
+        """Analyses of records from their features and severities, typed by what drove their deviation"""
+        if not data:
+            return []
+        contributions, anomaly_types = self.explain(features)
+        levels = np.select([severities > 0.7, severities > 0.4], ["high", "moderate"], default="low")
+        top = contributions.argmax(axis=1)
+        shares = np.round(contributions, 3).tolist()
+        return [
+            {
+                "severity": severity,
+                "anomaly_type": anomaly_type,
+                "description": DESCRIPTION_TEMPLATES[anomaly_type].format_map(
+                    dict(record, level=level, Level=level.capitalize())
+                ) + f" ({FEATURE_COLUMNS[driver]} accounts for {share[driver]:.0%} of the deviation)",
+                "contributions": dict(zip(FEATURE_COLUMNS, share))
+            }
+            for record, severity, anomaly_type, level, driver, share in zip(
+                data, severities.tolist(), anomaly_types.tolist(), levels.tolist(), top.tolist(), shares
+            )
+        ]
@@ -0,0 +1,156 @@
+import asyncio
+import os
+from typing import Any, Dict, List, Optional
+
+from drift import DriftMonitor
+from durable_queue import (
+    RAW_TOPIC, SCORED_TOPIC, TRAFFIC_QUEUE_BATCH_SIZE, DurableQueue, Message, run_consumer
+)
+from metrics import ANOMALIES_DETECTED, QUEUE_LAG
+from model import AnomalyDetector
+
+# The producer appends once this many records are buffered, and at least this often
+PRODUCER_BATCH_SIZE = int(os.getenv("TRAFFIC_PRODUCER_BATCH_SIZE", "100"))
+PRODUCER_LINGER_SECONDS = float(os.getenv("TRAFFIC_PRODUCER_LINGER_SECONDS", "1.0"))
+# Seconds between deletions of messages past retention
+QUEUE_PRUNE_INTERVAL = float(os.getenv("TRAFFIC_QUEUE_PRUNE_INTERVAL", "3600"))
+
+SCORER = "scorer"
+
+
+class TrafficProducer:
+    """Buffers records and appends them to the raw topic in batches.
+
+    send() only waits for the append when the buffer is full; otherwise a background
+    task appends the buffer every linger_seconds. stop() appends what is left.
+    """
+
+    def __init__(self, queue: DurableQueue, batch_size: int = PRODUCER_BATCH_SIZE,
+                 linger_seconds: float = PRODUCER_LINGER_SECONDS):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.linger_seconds = linger_seconds
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def send(self, record: Dict[str, Any]):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        async with self._lock:
+            batch, self._buffer = self._buffer, []
+            if batch:
+                await asyncio.get_running_loop().run_in_executor(None, self.queue.append, RAW_TOPIC, batch)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.linger_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error appending traffic records to the queue: {e}")
+
+
+class ScoringPipeline:
+    """Scorer stage: detects anomalies in batches of the raw topic and appends the results to the scored topic.
+
+    Each scored message carries the record, whether it is an anomaly, its analysis and
+    the model version. Appending results and committing the raw offset happen in one
+    transaction, so after a restart only batches without results are scored again.
+    A batch retried after a failure reuses the regime changes its first attempt found,
+    so the drift monitor sees each record once; the live feature windows already skip
+    records they have seen.
+    """
+
+    def __init__(self, queue: DurableQueue, detector: AnomalyDetector, drift_monitor: Optional[DriftMonitor] = None,
+                 batch_size: int = TRAFFIC_QUEUE_BATCH_SIZE):
+        self.queue = queue
+        self.detector = detector
+        self.drift_monitor = drift_monitor
+        self.batch_size = batch_size
+        # Regime changes by raw offset of the records scored but not yet committed
+        self._uncommitted_changes: Dict[int, List[Dict[str, Any]]] = {}
+        self._stopping: Optional[asyncio.Event] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._pruner: Optional[asyncio.Task] = None
+        QUEUE_LAG.labels(consumer=SCORER, topic=RAW_TOPIC).set_function(lambda: queue.lag(SCORER, RAW_TOPIC))
+
+    async def start(self):
+        self._stopping = asyncio.Event()
+        self._consumer = asyncio.create_task(run_consumer(
+            self.queue, RAW_TOPIC, SCORER, self.score, self._stopping,
+            output_topic=SCORED_TOPIC, batch_size=self.batch_size
+        ))
+        self._pruner = asyncio.create_task(self._prune())
+
+    async def stop(self):
+        """Finish the batch being scored and stop"""
+        if self._stopping is None:
+            return
+        self._stopping.set()
+        self._pruner.cancel()
+        await asyncio.gather(self._consumer, self._pruner, return_exceptions=True)
+        self._stopping = None
+
+    def score(self, messages: List[Message]) -> List[Dict[str, Any]]:
+        records = [message.payload for message in messages]
+        # One scoring pass for the flags and the analyses
+        analyses = dict(self.detector.detect_and_analyze(records))
+        # Batches are read in offset order, so offsets before this one were committed or dead-lettered
+        first = messages[0].offset if messages else 0
+        self._uncommitted_changes = {
+            offset: changes for offset, changes in self._uncommitted_changes.items() if offset >= first
+        }
+        results = []
+        for i, (message, record) in enumerate(zip(messages, records)):
+            analysis = analyses.get(i)
+            if analysis is not None:
+                print(f"Anomaly detected! {analysis['description']}")
+            changes = self._uncommitted_changes.get(message.offset)
+            if changes is None:
+                changes = self._uncommitted_changes[message.offset] = self._changes(record)
+            results.append({
+                "record": record,
+                "is_anomaly": analysis is not None,
+                "analysis": analysis,
+                # regime_change anomalies this record revealed, persisted like analyses
+                "changes": changes,
+                "model_version": self.detector.model_version,
+                "raw_offset": message.offset
+            })
+        return results
+
+    def _changes(self, record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if self.drift_monitor is None:
+            return []
+        changes = self.drift_monitor.update(record)
+        for change in changes:
+            ANOMALIES_DETECTED.labels(anomaly_type=change["anomaly_type"]).inc()
+            print(f"Regime change detected! {change['description']}")
+        return changes
+
+    async def _prune(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(QUEUE_PRUNE_INTERVAL)
+            try:
+                deleted = await loop.run_in_executor(None, self.queue.prune)
+                if deleted:
+                    print(f"Pruned {deleted} queue messages past retention")
+            except Exception as e:
+                print(f"Error pruning the traffic queue: {e}")
@@ -1,30 +1,54 @@
 import asyncio
 import random
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from generate_synthetic_data import generate_normal_traffic, generate_anomaly
 from model import AnomalyDetector
+from drift import DriftMonitor
+from pipeline import TrafficProducer
+from traffic_store import TrafficStore
+from metrics import ANOMALIES_DETECTED, SIMULATOR_TICK_LAG, SIMULATOR_TICKS_DROPPED
 import json
 import os
+from typing import Any, Dict, Optional
+
+# Records written to the data file, newest last
+SNAPSHOT_RECORDS = 1000
 
 class RealtimeTrafficSimulator:
     def __init__(self, 
                  data_interval: float = 1.0,
                  anomaly_probability: float = 0.2,
                  save_interval: float = 5.0,
-                 data_file: str = 'synthetic_traffic_data.json'):
+                 data_file: str = 'synthetic_traffic_data.json',
+                 detector: Optional[AnomalyDetector] = None,
+                 drift_monitor: Optional[DriftMonitor] = None,
+                 producer: Optional[TrafficProducer] = None,
+                 store: Optional[TrafficStore] = None):
         self.data_interval = data_interval
         self.anomaly_probability = anomaly_probability
         self.save_interval = save_interval
         self.data_file = data_file
-        self.traffic_data = []
-        self.detector = AnomalyDetector()
+        # Recent history of every location, queried by window
+        self.store = store or TrafficStore()
+        self.detector = detector or AnomalyDetector()
+        # Catches sustained shifts that per-point scoring cannot see
+        self.drift_monitor = drift_monitor or DriftMonitor()
+        # With a producer, records go to the durable queue and are scored by the pipeline
+        # instead of inline, and the data file is no longer written
+        self.producer = producer
         self.is_running = False
+        # Scoring runs here, off the event loop; one thread keeps records in arrival order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="simulator")
+        self._save_task: Optional[asyncio.Task] = None
+        self.ticks = 0
+        self.dropped_ticks = 0
+        self.last_tick_lag = 0.0
         
         # Initialize with some data if file exists
-        if os.path.exists(self.data_file):
+        if self.producer is None and os.path.exists(self.data_file):
             try:
                 with open(self.data_file, 'r') as f:
-                    self.traffic_data = json.load(f)
+                    self.store.extend(json.load(f))
             except Exception as e:
                 print(f"Error loading existing data: {e}")
 
@@ -36,51 +60,98 @@ class RealtimeTrafficSimulator:
 
     async def save_to_file(self):
         """Save accumulated traffic data to file"""
+        if self.producer is not None:
+            return
+        # Serialize in a thread so the event loop keeps serving requests
+        await asyncio.get_running_loop().run_in_executor(None, self._write_file)
+
+    def recent(self, limit: int = SNAPSHOT_RECORDS):
+        """The newest records as dicts, as written to the data file"""
+        return self.store.recent(limit)
+
+    def _write_file(self):
         try:
-            with open(self.data_file, 'w') as f:
-                json.dump(self.traffic_data, f, indent=2)
+            traffic_data = self.recent()
+            # Replace the file in one step so readers never see a partial write
+            tmp_path = f"{self.data_file}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(traffic_data, f, indent=2)
+            os.replace(tmp_path, self.data_file)
         except Exception as e:
             print(f"Error saving data: {e}")
 
     async def process_data(self, data):
         """Process traffic data through anomaly detector"""
-        is_anomaly = self.detector.detect_anomalies([data])[0]
-        if is_anomaly:
-            analysis = self.detector.analyze_anomaly(data)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._process, data)
+
+    def _process(self, data):
+        # One scoring pass for the flag and the analysis
+        flagged = self.detector.detect_and_analyze([data])
+        for _, analysis in flagged:
             print(f"Anomaly detected! {analysis['description']}")
-        return is_anomaly
+        for change in self.drift_monitor.update(data):
+            ANOMALIES_DETECTED.labels(anomaly_type=change["anomaly_type"]).inc()
+            print(f"Regime change detected! {change['description']}")
+        return bool(flagged)
+
+    async def tick(self):
+        """Generate one record and hand it to the queue or the detector"""
+        data = await self.generate_traffic_data()
+        if self.producer is not None:
+            await self.producer.send(data)
+        else:
+            await self.process_data(data)
+        self.store.append(data)
+
+    def _save_in_background(self):
+        # A save still writing when the next one is due is not doubled up
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self.save_to_file())
 
     async def start_simulation(self):
-        """Start continuous traffic data generation and processing"""
+        """Start continuous traffic data generation and processing.
+
+        Ticks are scheduled on fixed monotonic deadlines, so the rate does not drift
+        by the processing time. A tick that overruns its slot makes the following
+        deadlines that already passed count as dropped instead of firing in a burst.
+        """
+        loop = asyncio.get_running_loop()
         self.is_running = True
-        last_save = datetime.now()
+        deadline = loop.time()
+        next_save = deadline + self.save_interval
 
         while self.is_running:
+            lag = max(0.0, loop.time() - deadline)
+            self.last_tick_lag = lag
+            SIMULATOR_TICK_LAG.observe(lag)
             try:
-                # Generate new traffic data
-                data = await self.generate_traffic_data()
-                
-                # Process the data
-                is_anomaly = await self.process_data(data)
-                
-                # Add to accumulated data
-                self.traffic_data.append(data)
-                
-                # Keep only last 1000 records
-                if len(self.traffic_data) > 1000:
-                    self.traffic_data = self.traffic_data[-1000:]
-                
-                # Save to file periodically
-                if (datetime.now() - last_save).total_seconds() >= self.save_interval:
-                    await self.save_to_file()
-                    last_save = datetime.now()
-                
-                # Wait for next interval
-                await asyncio.sleep(self.data_interval)
-                
+                await self.tick()
+                self.ticks += 1
             except Exception as e:
                 print(f"Error in simulation: {e}")
-                await asyncio.sleep(1)  # Wait before retrying
+
+            if loop.time() >= next_save:
+                self._save_in_background()
+                next_save = loop.time() + self.save_interval
+
+            deadline += self.data_interval
+            now = loop.time()
+            if now > deadline + self.data_interval:
+                missed = int((now - deadline) // self.data_interval)
+                self.dropped_ticks += missed
+                SIMULATOR_TICKS_DROPPED.inc(missed)
+                deadline += missed * self.data_interval
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.is_running,
+            "interval_seconds": self.data_interval,
+            "ticks": self.ticks,
+            "dropped_ticks": self.dropped_ticks,
+            "last_tick_lag_seconds": self.last_tick_lag,
+            "store": self.store.stats()
+        }
 
     def stop_simulation(self):
         """Stop the traffic simulation"""
@@ -0,0 +1,183 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import sklearn
+
+from settings import settings
+
+ARTIFACT_FILE = "model.joblib"
+METADATA_FILE = "metadata.json"
+ACTIVE_FILE = "ACTIVE"
+HISTORY_FILE = "HISTORY"
+
+
+def _write_atomic(path: str, content: str):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    with os.fdopen(fd, "w") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    """Versioned model artifacts in a local directory.
+
+    Layout:
+        versions/v0001/model.joblib    detectors and scaler, uncompressed so it can be memory-mapped
+        versions/v0001/metadata.json   feature schema, data window, scaler stats, detector parameters, metrics
+        ACTIVE                         version that workers serve
+        HISTORY                        previously active versions, most recent last
+
+    Versions are staged in a temporary directory and renamed into place, and the
+    pointer files are replaced atomically, so readers never see a partial version.
+    """
+
+    def __init__(self, root: str = settings.model_registry, keep: int = settings.model_registry_keep):
+        self.root = root
+        self.keep = keep
+        self.versions_dir = os.path.join(root, "versions")
+        os.makedirs(self.versions_dir, exist_ok=True)
+
+    def _version_dir(self, version: str) -> str:
+        return os.path.join(self.versions_dir, version)
+
+    def versions(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.versions_dir) if name.startswith("v"))
+
+    def metadata(self, version: str) -> Dict[str, Any]:
+        path = os.path.join(self._version_dir(version), METADATA_FILE)
+        if not os.path.exists(path):
+            raise KeyError(f"Unknown model version {version}")
+        with open(path) as f:
+            return json.load(f)
+
+    def active_version(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, ACTIVE_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def history(self) -> List[str]:
+        try:
+            with open(os.path.join(self.root, HISTORY_FILE)) as f:
+                return [line.strip() for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def publish(self, artifact: Dict[str, Any], metadata: Dict[str, Any], activate: bool = True) -> str:
+        """Store fitted objects ("model", "scaler", ...) as a new version; returns its version id"""
+        staging = tempfile.mkdtemp(dir=self.versions_dir, prefix=".staging-")
+        try:
+            # Uncompressed, so the arrays can be memory-mapped on load
+            joblib.dump(artifact, os.path.join(staging, ARTIFACT_FILE))
+            existing = self.versions()
+            number = int(existing[-1][1:]) + 1 if existing else 1
+            while True:
+                version = f"v{number:04d}"
+                metadata = dict(metadata, version=version, created_at=datetime.utcnow().isoformat(),
+                                sklearn_version=sklearn.__version__)
+                with open(os.path.join(staging, METADATA_FILE), "w") as f:
+                    json.dump(metadata, f, indent=2)
+                try:
+                    os.rename(staging, self._version_dir(version))
+                    break
+                except OSError:
+                    # Another publisher took this number
+                    if not os.path.exists(self._version_dir(version)):
+                        raise
+                    number += 1
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if activate:
+            self.activate(version)
+        self.prune()
+        return version
+
+    def activate(self, version: str):
+        """Point ACTIVE at version, remembering the current one for rollback"""
+        self.metadata(version)
+        current = self.active_version()
+        if current == version:
+            return
+        if current is not None:
+            # Bounded, so pruning can eventually reclaim old versions
+            history = (self.history() + [current])[-self.keep:]
+            _write_atomic(os.path.join(self.root, HISTORY_FILE), "\n".join(history) + "\n")
+        _write_atomic(os.path.join(self.root, ACTIVE_FILE), version + "\n")
+
+    def rollback_target(self) -> str:
+        """The version rollback would re-activate, without activating it"""
+        for previous in reversed(self.history()):
+            if os.path.exists(self._version_dir(previous)):
+                return previous
+        raise ValueError("No previous model version to roll back to")
+
+    def rollback(self, expected: Optional[str] = None) -> str:
+        """Re-activate the previously active version; returns it.
+
+        With expected, e.g. a rollback_target already loaded, raises ValueError instead if
+        the history moved on in the meantime.
+        """
+        history = self.history()
+        while history:
+            previous = history.pop()
+            if os.path.exists(self._version_dir(previous)):
+                if expected is not None and previous != expected:
+                    raise ValueError(f"Model {expected} is no longer the previous version, {previous} is")
+                _write_atomic(os.path.join(self.root, HISTORY_FILE), "".join(v + "\n" for v in history))
+                _write_atomic(os.path.join(self.root, ACTIVE_FILE), previous + "\n")
+                return previous
+        raise ValueError("No previous model version to roll back to")
+
+    def load(self, version: Optional[str] = None,
+             mmap: bool = settings.model_mmap) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """(artifact, metadata) of a version, the active one by default.
+
+        With mmap, numpy arrays in the artifact are mapped read-only instead of read
+        into memory, which pays off for models made of a few large arrays.
+        """
+        version = version or self.active_version()
+        if version is None:
+            raise KeyError("No active model version")
+        metadata = self.metadata(version)
+        artifact = joblib.load(os.path.join(self._version_dir(version), ARTIFACT_FILE),
+                               mmap_mode="r" if mmap else None)
+        return artifact, metadata
+
+    def prune(self):
+        """Delete the oldest versions beyond keep, never the active one or the rollback history"""
+        protected = set(self.history())
+        active = self.active_version()
+        if active is not None:
+            protected.add(active)
+        candidates = [version for version in self.versions() if version not in protected]
+        for version in candidates[:max(0, len(candidates) - self.keep)]:
+            shutil.rmtree(self._version_dir(version), ignore_errors=True)
+
+
+def scaler_stats(scaler) -> Dict[str, Any]:
+    return {
+        "mean": scaler.mean_.tolist(),
+        "scale": scaler.scale_.tolist(),
+        "n_samples_seen": np.asarray(scaler.n_samples_seen_).tolist()
+    }
+
+
+def timestamp_window(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Rows and timestamp range of a training set"""
+    timestamps = [str(r["timestamp"]) for r in records if r.get("timestamp") is not None]
+    return {
+        "rows": len(records),
+        "start": min(timestamps) if timestamps else None,
+        "end": max(timestamps) if timestamps else None
+    }
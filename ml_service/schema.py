@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class Feature:
+    """A measurement every traffic record carries, with its accepted range"""
+    name: str
+    integer: bool
+    minimum: float
+    maximum: float
+    unit: str = ""
+
+
+# The records' measurements, in the order the detector takes them. Ranges match the backend's ingest validation
+FEATURES = (
+    Feature("vehicle_count", integer=True, minimum=0, maximum=10000, unit="vehicles"),
+    Feature("average_speed", integer=False, minimum=0.0, maximum=300.0, unit="km/h"),
+    Feature("congestion_level", integer=False, minimum=0.0, maximum=1.0),
+    Feature("time_of_day", integer=True, minimum=0, maximum=23, unit="hour")
+)
+FEATURE_COLUMNS = [feature.name for feature in FEATURES]
+INTEGER_COLUMNS = tuple(feature.name for feature in FEATURES if feature.integer)
+
+# Python types a measurement may have; bool is excluded although it subclasses int
+NUMBER_TYPES = frozenset((int, float))
+# Invalid records listed in one validation error
+MAX_REPORTED_ERRORS = 20
+
+
+class SchemaError(ValueError):
+    """Records that do not match FEATURES; errors lists one message per problem"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def to_matrix(records: List[Dict[str, Any]]) -> np.ndarray:
+    """The records' measurements as a (n, len(FEATURES)) float64 array"""
+    return np.array([[record[column] for column in FEATURE_COLUMNS] for record in records], dtype=np.float64)
+
+
+def _type_errors(records: List[Dict[str, Any]], first: int) -> List[str]:
+    errors = []
+    for i, record in enumerate(records, first):
+        for column in FEATURE_COLUMNS:
+            value = record.get(column) if isinstance(record, dict) else None
+            if value is None:
+                errors.append(f"record {i}: {column} is required")
+            elif isinstance(value, bool) or not isinstance(value, (int, float)):
+                errors.append(f"record {i}: {column} must be a number")
+    return errors
+
+
+def validate(records: List[Dict[str, Any]], first: int = 0) -> np.ndarray:
+    """to_matrix(records), raising SchemaError for missing, non-numeric, fractional integer or out of range values.
+
+    The checks run on whole columns, so a valid batch costs about as much as building its matrix.
+    Errors number the records from first, e.g. the offset of a chunk in a stream.
+    """
+    errors = []
+    try:
+        columns = [[record[column] for record in records] for column in FEATURE_COLUMNS]
+        # Exact types, so numeric strings and booleans, which NumPy would convert, are not let through
+        typed = all(NUMBER_TYPES.issuperset(map(type, column)) for column in columns)
+    except (KeyError, TypeError):
+        typed = False
+    if not typed:
+        # Find the offending records one by one; only malformed batches take this path
+        errors = _type_errors(records, first)
+        if errors or not all(isinstance(record, dict) for record in records):
+            raise SchemaError(errors[:MAX_REPORTED_ERRORS] or ["records must be objects"])
+        # Otherwise only subclasses of int or float, such as NumPy scalars, which convert as they are
+    values = np.empty((len(records), len(FEATURES)), dtype=np.float64)
+    for j, column in enumerate(columns):
+        values[:, j] = column
+    if not len(values):
+        return values.reshape(0, len(FEATURES))
+    for j, feature in enumerate(FEATURES):
+        column = values[:, j]
+        invalid = ~np.isfinite(column) | (column < feature.minimum) | (column > feature.maximum)
+        for i in np.flatnonzero(invalid)[:MAX_REPORTED_ERRORS].tolist():
+            errors.append(f"record {first + i}: {feature.name} must be between {feature.minimum} and {feature.maximum}")
+        if feature.integer:
+            for i in np.flatnonzero(~invalid & (column != np.round(column)))[:MAX_REPORTED_ERRORS].tolist():
+                errors.append(f"record {first + i}: {feature.name} must be an integer")
+    if errors:
+        raise SchemaError(errors[:MAX_REPORTED_ERRORS])
+    return values
+
+
+def to_wire(values: np.ndarray) -> List[Dict[str, Any]]:
+    """Rows of measurements as record dicts, with integer features as ints"""
+    columns = [
+        values[:, j].astype(np.int64).tolist() if feature.integer else values[:, j].tolist()
+        for j, feature in enumerate(FEATURES)
+    ]
+    return [dict(zip(FEATURE_COLUMNS, row)) for row in zip(*columns)]
+
+
+def describe() -> List[Dict[str, Any]]:
+    """The schema as served by GET /schema"""
+    return [
+        {"name": feature.name, "type": "integer" if feature.integer else "number",
+         "minimum": feature.minimum, "maximum": feature.maximum, "unit": feature.unit or None}
+        for feature in FEATURES
+    ]
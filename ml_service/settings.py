@@ -0,0 +1,133 @@
+import json
+import os
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, Optional, Union, get_args, get_origin, get_type_hints
+
+# JSON object of environment variable names to values, e.g. {"ML_N_ESTIMATORS": 200, "TRAFFIC_QUEUE_BATCH_SIZE": 1000}.
+# Variables set in the environment take precedence over the file
+CONFIG_FILE_VARIABLE = "ML_CONFIG_FILE"
+
+
+def env(name: str, default: Any):
+    return field(default=default, metadata={"env": name})
+
+
+def secret(name: str):
+    """A setting GET /settings only reports as set or not"""
+    return field(default=None, metadata={"env": name, "secret": True})
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Runtime settings of the ML service, read from the environment after applying the config file"""
+    # Server
+    host: str = env("ML_HOST", "0.0.0.0")
+    port: int = env("ML_PORT", 8001)
+    workers: int = env("ML_WORKERS", 1)  # uvicorn worker processes for python main.py
+    background_election_seconds: float = env("ML_BACKGROUND_ELECTION_SECONDS", 5.0)  # how soon a worker takes over the simulator
+    reload: bool = env("ML_RELOAD", False)
+    api_key: Optional[str] = secret("ML_API_KEY")  # enables the bulk training endpoints
+    # Model
+    detector: str = env("ML_DETECTOR", "isolation_forest")  # isolation_forest, robust_zscore or histogram
+    location_detectors: str = env("ML_LOCATION_DETECTORS", "")  # e.g. corridor_a=histogram,corridor_b=robust_zscore
+    contamination: Optional[float] = env("ML_CONTAMINATION", None)  # share of anomalies; detector default if unset
+    n_estimators: Optional[int] = env("ML_N_ESTIMATORS", None)  # isolation forest trees; 500 if unset
+    max_samples: Optional[str] = env("ML_MAX_SAMPLES", None)  # rows per isolation tree, 'auto' or a count
+    n_jobs: int = env("ML_N_JOBS", 1)  # -1 uses every core
+    parallel_backend: str = env("ML_PARALLEL_BACKEND", "threads")  # threads or processes
+    score_chunk_size: int = env("ML_SCORE_CHUNK_SIZE", 50000)
+    temporal_window: int = env("ML_TEMPORAL_WINDOW", 20)  # 0 scores raw features only
+    model_registry: str = env("ML_MODEL_REGISTRY", "model_registry")  # empty disables the registry
+    model_registry_keep: int = env("ML_MODEL_REGISTRY_KEEP", 20)  # inactive versions kept, and the rollback depth
+    # Memory-map artifact arrays on load. Off by default: sklearn trees copy their node arrays
+    # when unpickled, so for forests mapping many small arrays is slower than reading them
+    model_mmap: bool = env("ML_MODEL_MMAP", False)
+    registry_poll_seconds: float = env("ML_REGISTRY_POLL_SECONDS", 10.0)
+    # Drift
+    drift_threshold: float = env("ML_DRIFT_THRESHOLD", 25.0)
+    drift_retrain_threshold: int = env("ML_DRIFT_RETRAIN_THRESHOLD", 3)
+    # Training
+    training_data_dir: str = env("ML_TRAINING_DATA_DIR", "training_data")  # the only files /train/source reads
+    # Simulator
+    simulator_interval: float = env("ML_SIMULATOR_INTERVAL", 1.0)  # seconds between simulated records
+    anomaly_probability: float = env("ML_SIMULATOR_ANOMALY_PROBABILITY", 0.2)
+    simulator_save_interval: float = env("ML_SIMULATOR_SAVE_INTERVAL", 5.0)  # seconds between data file writes
+    traffic_data_file: str = env("TRAFFIC_DATA_FILE", "synthetic_traffic_data.json")
+    traffic_queue_path: str = env("TRAFFIC_QUEUE_PATH", "")  # durable queue shared with the backend; empty uses the data file
+    # Profiling
+    profiling_enabled: bool = env("PROFILING_ENABLED", False)  # profiling endpoints and Server-Timing headers
+    profiling_token: Optional[str] = secret("PROFILING_TOKEN")  # shared secret the profiling endpoints require
+
+    def detector_params(self) -> Dict[str, Dict[str, Any]]:
+        """Parameters by detector name for the configured model size; unset ones keep the detector's defaults"""
+        forest = {"contamination": self.contamination, "n_estimators": self.n_estimators,
+                  "max_samples": _max_samples(self.max_samples)}
+        histogram = {"contamination": self.contamination}
+        return {
+            "isolation_forest": {name: value for name, value in forest.items() if value is not None},
+            "histogram": {name: value for name, value in histogram.items() if value is not None}
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        """Every setting by its environment variable, as served by GET /settings; secrets are masked"""
+        return {item.metadata["env"]: _masked(getattr(self, item.name)) if item.metadata.get("secret")
+                else getattr(self, item.name) for item in fields(self)}
+
+
+def _masked(value: Optional[str]) -> Optional[str]:
+    return "********" if value else None
+
+
+def _max_samples(value: Optional[str]) -> Union[str, int, float, None]:
+    if value is None or value == "auto":
+        return value
+    return float(value) if "." in value else int(value)
+
+
+def _parse(value: str, annotation, name: str):
+    if get_origin(annotation) is Union:
+        if value == "":
+            return None
+        annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+    try:
+        if annotation is bool:
+            if value.lower() not in ("1", "true", "yes", "0", "false", "no", ""):
+                raise ValueError(value)
+            return value.lower() in ("1", "true", "yes")
+        return annotation(value)
+    except ValueError:
+        raise ValueError(f"{name} must be {annotation.__name__}, got {value!r}") from None
+
+
+def apply_config_file(path: Optional[str] = None):
+    """Export the file's variables that the environment does not set, so every module's settings see them"""
+    path = path or os.getenv(CONFIG_FILE_VARIABLE)
+    if not path:
+        return
+    with open(path) as f:
+        variables = json.load(f)
+    if not isinstance(variables, dict):
+        raise ValueError(f"{path} must contain a JSON object of environment variables")
+    for name, value in variables.items():
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        elif value is None:
+            value = ""
+        elif not isinstance(value, str):
+            value = json.dumps(value)
+        os.environ.setdefault(name, value)
+
+
+def load_settings(config_file: Optional[str] = None) -> Settings:
+    apply_config_file(config_file)
+    hints = get_type_hints(Settings)
+    values = {}
+    for item in fields(Settings):
+        value = os.getenv(item.metadata["env"])
+        if value is not None:
+            values[item.name] = _parse(value, hints[item.name], item.metadata["env"])
+    return Settings(**values)
+
+
+# Loaded on first import, before the modules that read their own variables at import time
+settings = load_settings()
@@ -1,5 +1,8 @@
 import requests
 import json
+import os
+
+ML_SERVICE_URL = os.getenv("ML_SERVICE_URL", "http://localhost:8001")
 
 def test_anomaly_detection():
     # Test data
@@ -23,7 +26,7 @@ def test_anomaly_detection():
     try:
         # Send request to the ML service
         response = requests.post(
-            "http://localhost:8001/detect",
+            f"{ML_SERVICE_URL}/detect",
             json=test_data
         )
         
@@ -1,7 +1,10 @@
 import json
+import os
 import requests
 from generate_synthetic_data import generate_dataset
 
+ML_SERVICE_URL = os.getenv("ML_SERVICE_URL", "http://localhost:8001")
+
 def test_with_synthetic_data():
     # Generate synthetic dataset
     print("Generating synthetic dataset...")
@@ -14,7 +17,7 @@ def test_with_synthetic_data():
         # Send request to the ML service
         print("\nSending data to ML service...")
         response = requests.post(
-            "http://localhost:8001/detect",
+            f"{ML_SERVICE_URL}/detect",
             json=test_data
         )
         
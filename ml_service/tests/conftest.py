@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# Settings are read at import time: no registry, queue or config file, and scratch files outside the tree
+_SCRATCH_DIR = tempfile.mkdtemp(prefix="ml-service-tests-")
+os.environ["ML_MODEL_REGISTRY"] = ""
+os.environ["TRAFFIC_DATA_FILE"] = os.path.join(_SCRATCH_DIR, "synthetic_traffic_data.json")
+os.environ["ML_TEMPORAL_WINDOW"] = "0"
+os.environ["ML_N_ESTIMATORS"] = "50"
+for variable in ("TRAFFIC_QUEUE_PATH", "ML_CONFIG_FILE"):
+    os.environ.pop(variable, None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Without a registry, trained models are saved to the working directory
+os.chdir(_SCRATCH_DIR)
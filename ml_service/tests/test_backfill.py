@@ -0,0 +1,136 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import backfill
+from backfill import Backfill, EpisodeBuilder, reset, run, skip_records
+from streaming import iter_db_pages
+
+ANALYSIS = {"anomaly_type": "traffic_congestion", "severity": 0.7, "description": "congestion"}
+
+
+def test_records_without_a_location_group_like_the_backend():
+    builder = EpisodeBuilder("v0001")
+    builder.add({"timestamp": "2025-01-01T08:00:00"}, ANALYSIS)
+    builder.add({"timestamp": "2025-01-01T08:01:00", "location": None}, ANALYSIS)
+    builder.add({"timestamp": "2025-01-01T08:01:00", "location": "Main St"}, ANALYSIS)
+    assert sorted(builder.open) == [("Main St", "traffic_congestion"), ("System", "traffic_congestion")]
+    assert builder.open[("System", "traffic_congestion")]["record_count"] == 2
+
+
+def traffic_table(path, location: bool):
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE traffic_data (id INTEGER PRIMARY KEY, vehicle_count INTEGER, average_speed FLOAT, "
+        "congestion_level FLOAT, time_of_day INTEGER, timestamp DATETIME, latitude FLOAT, longitude FLOAT"
+        + (", location VARCHAR)" if location else ")")
+    )
+    for i in range(3):
+        connection.execute(
+            "INSERT INTO traffic_data (vehicle_count, average_speed, congestion_level, time_of_day, timestamp) "
+            "VALUES (100, 50.0, 0.5, 8, ?)", (f"2025-01-01 08:00:0{i}",)
+        )
+        if location:
+            connection.execute("UPDATE traffic_data SET location = 'Main St' WHERE id = last_insert_rowid()")
+    connection.commit()
+    connection.close()
+    return f"sqlite:///{path}"
+
+
+def test_database_pages_carry_the_location_column_when_there_is_one(tmp_path):
+    with_location = traffic_table(tmp_path / "with.db", location=True)
+    without_location = traffic_table(tmp_path / "without.db", location=False)
+
+    pages = list(iter_db_pages(with_location, chunk_size=2))
+    assert [len(page) for page in pages] == [2, 1]
+    assert {record["location"] for page in pages for record in page} == {"Main St"}
+    assert all("location" not in record for page in iter_db_pages(without_location) for record in page)
+
+
+class ThresholdDetector:
+    """Flags records with more than 300 vehicles, standing in for a registry model"""
+
+    def training_extractor(self):
+        return None
+
+    def detect_and_analyze(self, records, extractor=None):
+        return [(i, ANALYSIS) for i, record in enumerate(records) if record["vehicle_count"] > 300]
+
+
+def history_records():
+    # Congestion from minute 5 to 14 at one location, and at minute 25 at another
+    return [{"timestamp": f"2025-01-01T08:{minute:02d}:00", "location": "Main St" if minute != 25 else "Elm St",
+             "vehicle_count": 400 if 5 <= minute < 15 or minute == 25 else 100}
+            for minute in range(30)]
+
+
+def chunked(records, size=4):
+    return (records[start:start + size] for start in range(0, len(records), size))
+
+
+def anomalies_table(path):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE anomalies (id INTEGER PRIMARY KEY, timestamp DATETIME, location VARCHAR, "
+            "anomaly_type VARCHAR, severity FLOAT, description TEXT, status VARCHAR, last_seen_at DATETIME, "
+            "duration_seconds FLOAT, record_count INTEGER, model_version VARCHAR, latitude FLOAT, "
+            "longitude FLOAT, geohash VARCHAR)"
+        ))
+    return engine
+
+
+def written_episodes(engine):
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT location, timestamp, last_seen_at, record_count FROM anomalies ORDER BY timestamp"
+        )).all()
+
+
+def test_interrupted_backfill_resumes_from_its_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(backfill, "load_detector", lambda *args: ThresholdDetector())
+    records = history_records()
+    expected = anomalies_table(tmp_path / "expected.db")
+    run(Backfill(expected, "job", "v0001", temporal_window=3), chunked(records), by_id=False, workers=0,
+        registry_dir="unused")
+
+    def crash_after(chunks, count):
+        for number, chunk in enumerate(chunks):
+            if number == count:
+                raise KeyboardInterrupt
+            yield chunk
+
+    engine = anomalies_table(tmp_path / "resumed.db")
+    with pytest.raises(KeyboardInterrupt):
+        # Stops inside the first episode, which stays open in the checkpoint
+        run(Backfill(engine, "job", "v0001", temporal_window=3), crash_after(chunked(records), 3), by_id=False,
+            workers=0, registry_dir="unused")
+    job = Backfill(engine, "job", "v0001", temporal_window=3)
+    assert job.resumed and job.position == 12
+    assert [episode["record_count"] for episode in job.episodes.open.values()] == [7]
+    assert [len(recent) for recent in job.history.values()] == [3]
+
+    run(job, skip_records(chunked(records), job.position), by_id=False, workers=0, registry_dir="unused")
+
+    assert written_episodes(engine) == written_episodes(expected)
+    assert [(location, count) for location, _, _, count in written_episodes(engine)] == [("Main St", 10),
+                                                                                          ("Elm St", 1)]
+
+
+def test_checkpoint_of_another_model_version_is_refused_until_reset(tmp_path, monkeypatch):
+    monkeypatch.setattr(backfill, "load_detector", lambda *args: ThresholdDetector())
+    engine = anomalies_table(tmp_path / "anomalies.db")
+    run(Backfill(engine, "job", "v0001", temporal_window=0), chunked(history_records()), by_id=False, workers=0,
+        registry_dir="unused")
+
+    with pytest.raises(ValueError):
+        Backfill(engine, "job", "v0002", temporal_window=0)
+    assert reset(engine, "job", "v0001") == 2
+    assert not Backfill(engine, "job", "v0002", temporal_window=0).resumed
+    assert written_episodes(engine) == []
+
+
+def test_skip_records_drops_the_records_already_scored():
+    chunks = skip_records(chunked(list(range(10))), 6)
+    assert list(chunks) == [[6, 7], [8, 9]]
@@ -0,0 +1,36 @@
+import copy
+
+import numpy as np
+
+from detectors import IsolationForestDetector
+from model import AnomalyDetector
+from registry import ModelRegistry
+
+
+def records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{"vehicle_count": int(v), "average_speed": float(s), "congestion_level": float(c), "time_of_day": int(h)}
+            for v, s, c, h in zip(rng.integers(50, 151, n), rng.uniform(40, 70, n), rng.uniform(0.3, 0.7, n),
+                                  rng.integers(0, 24, n))]
+
+
+def test_partial_fit_of_a_copy_refits_on_the_whole_window():
+    X = np.random.default_rng(0).normal(size=(1000, 4))
+    detector = IsolationForestDetector(n_estimators=20, max_samples=256).fit(X)
+    updated = copy.deepcopy(detector).partial_fit(X[:3])
+    assert updated.forest_.max_samples_ == 256
+    assert len(updated._recent) == 1003
+
+
+def test_partial_fit_keeps_the_window_across_swaps_and_loads(tmp_path):
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    detector = AnomalyDetector(temporal_window=0, registry=registry,
+                               detector_params={"isolation_forest": {"n_estimators": 20, "max_samples": 256}})
+    detector.train(records(1000))
+    detector.partial_fit(records(3, seed=1))
+    assert detector.model.forest_.max_samples_ == 256
+
+    loaded = AnomalyDetector(temporal_window=0, registry=registry)
+    loaded.partial_fit(records(3, seed=2))
+    assert loaded.model.forest_.max_samples_ == 256
+    assert len(loaded.model._recent) == 1003
@@ -0,0 +1,58 @@
+import threading
+
+from drift import DriftMonitor
+
+
+def shifted_records(location="Main St", before=60, after=60):
+    return [{"location": location, "vehicle_count": 100 if i < before else 400, "average_speed": 50.0,
+             "congestion_level": 0.5, "time_of_day": 8, "timestamp": f"2025-01-01T08:{i // 60:02d}:{i % 60:02d}"}
+            for i in range(before + after)]
+
+
+def test_retrain_on_drift_runs_without_an_event_loop(monkeypatch):
+    import main
+
+    trained = threading.Event()
+    monkeypatch.setattr(main.detector, "train", lambda data: trained.set())
+    # As from the simulator's executor thread
+    worker = threading.Thread(target=main.retrain_on_drift, args=({"change_points": 3, "window_seconds": 600},))
+    worker.start()
+    worker.join()
+    assert trained.wait(5)
+
+
+def test_failing_drift_callback_does_not_fail_the_update():
+    def on_drift(signal):
+        raise RuntimeError("no running event loop")
+
+    monitor = DriftMonitor(retrain_threshold=1, on_drift=on_drift)
+    changes = [change for record in shifted_records() for change in monitor.update(record)]
+    assert changes and changes[0]["anomaly_type"] == "regime_change"
+
+
+def test_least_recently_updated_location_is_dropped():
+    monitor = DriftMonitor(max_locations=2)
+    for location in ["A", "B", "A", "C"]:
+        monitor.update(shifted_records(location, before=1, after=0)[0])
+
+    assert list(monitor._streams) == ["A", "C"]
+    assert monitor.status()["streams"] == 2 * len(monitor.features)
+
+
+def test_concurrent_updates_count_every_record():
+    monitor = DriftMonitor(max_locations=5)
+    records = [dict(record, vehicle_count=100) for record in shifted_records(before=200, after=0)]
+
+    def feed(location):
+        for record in records:
+            monitor.update(dict(record, location=location))
+
+    workers = [threading.Thread(target=feed, args=(f"L{i % 5}",)) for i in range(10)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert len(monitor._streams) == 5
+    assert all(stream.n == 2 * len(records) for streams in monitor._streams.values()
+               for stream in streams.values())
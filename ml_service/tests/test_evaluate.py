@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from detectors import make_detector
+from evaluate import SWEEP_RATES, binary_metrics, evaluate_config, feature_matrix, per_type_metrics
+from generate_synthetic_data import ANOMALY_PROFILES, LABELS, NORMAL_LABEL, generate_labeled_arrays
+from model import FEATURE_COLUMNS
+
+
+def test_binary_metrics_count_hits_and_misses():
+    actual = np.array([True, True, True, False, False])
+    predicted = np.array([True, True, False, True, False])
+
+    metrics = binary_metrics(actual, predicted)
+
+    assert metrics["precision"] == pytest.approx(2 / 3) and metrics["recall"] == pytest.approx(2 / 3)
+    assert (metrics["support"], metrics["flagged"]) == (3, 3)
+    assert binary_metrics(actual, np.zeros(5, dtype=bool))["f1"] == 0.0
+
+
+def test_per_type_hits_need_the_right_type():
+    name = next(iter(ANOMALY_PROFILES))
+    labels = np.array([LABELS.index(name), LABELS.index(name), LABELS.index(NORMAL_LABEL)])
+    flagged = np.array([True, True, True])
+    predicted_types = np.array([name, "other", "other"])
+
+    metrics = per_type_metrics(labels, flagged, predicted_types)
+
+    assert metrics[name]["recall"] == 0.5
+    assert metrics["other"] == {"precision": 0.0, "recall": None, "f1": None, "support": 0, "flagged": 2}
+
+
+def test_detector_separates_labeled_anomalies():
+    train = generate_labeled_arrays(800, 200, seed=0)
+    evaluation = generate_labeled_arrays(800, 200, seed=1)
+    assert np.count_nonzero(evaluation["label"] != LABELS.index(NORMAL_LABEL)) == 200
+
+    result = evaluate_config(make_detector("robust_zscore", FEATURE_COLUMNS), feature_matrix(train),
+                             feature_matrix(evaluation), evaluation["label"],
+                             np.full(1000, next(iter(ANOMALY_PROFILES))))
+
+    assert result["detector"] == "robust_zscore"
+    assert result["curves"]["roc_auc"] > 0.8
+    assert [point["flagged_rate"] for point in result["sweep"]] == SWEEP_RATES
+    assert set(result["per_type"]) == set(ANOMALY_PROFILES)
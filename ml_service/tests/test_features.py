@@ -0,0 +1,39 @@
+import numpy as np
+
+from features import StreamingFeatureExtractor
+
+
+def record(location, second, vehicle_count=100):
+    return {"location": location, "vehicle_count": vehicle_count, "average_speed": 50.0, "congestion_level": 0.5,
+            "time_of_day": 8, "timestamp": f"2025-01-01T08:00:{second:02d}"}
+
+
+def test_idle_locations_are_evicted():
+    extractor = StreamingFeatureExtractor(window=5, max_locations=2)
+    extractor.transform_record(record("a", 0))
+    extractor.transform_record(record("b", 0))
+    # a was updated last, so b is the idle one when c arrives
+    extractor.transform_record(record("a", 1))
+    extractor.transform_record(record("c", 0))
+    assert list(extractor._windows) == ["a", "c"]
+
+    extractor.transform_batch([record("d", 0), record("d", 1), record("a", 2)])
+    assert list(extractor._windows) == ["d", "a"]
+
+
+def test_scoring_without_update_does_not_keep_a_location():
+    extractor = StreamingFeatureExtractor(window=5, max_locations=2)
+    extractor.transform_record(record("a", 0))
+    extractor.transform_record(record("b", 0))
+    extractor.transform_record(record("c", 0), update=False)
+    extractor.transform_batch([record("c", 1), record("c", 2)], update=False)
+    assert list(extractor._windows) == ["a", "b"]
+
+
+def test_evicted_location_starts_from_an_empty_window():
+    extractor = StreamingFeatureExtractor(window=5, max_locations=1)
+    extractor.transform_record(record("a", 0, vehicle_count=100))
+    extractor.transform_record(record("b", 0))
+    features = extractor.transform_record(record("a", 1, vehicle_count=300))
+    fresh = StreamingFeatureExtractor(window=5).transform_record(record("a", 1, vehicle_count=300))
+    np.testing.assert_array_equal(features, fresh)
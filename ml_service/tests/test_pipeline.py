@@ -0,0 +1,67 @@
+import time
+
+from drift import DriftMonitor
+from durable_queue import DurableQueue, Message
+from model import AnomalyDetector
+from pipeline import ScoringPipeline
+from test_drift import shifted_records
+
+
+def test_failing_drift_callback_does_not_fail_the_batch(tmp_path):
+    def on_drift(signal):
+        raise RuntimeError("no running event loop")
+
+    pipeline = ScoringPipeline(DurableQueue(str(tmp_path / "queue.db")), AnomalyDetector(temporal_window=0),
+                               DriftMonitor(retrain_threshold=1, on_drift=on_drift))
+    records = shifted_records()
+    results = pipeline.score([Message(i, record, time.time()) for i, record in enumerate(records)])
+    assert [result["record"] for result in results] == records
+
+
+def test_scored_messages_carry_regime_changes(tmp_path):
+    pipeline = ScoringPipeline(DurableQueue(str(tmp_path / "queue.db")), AnomalyDetector(temporal_window=0),
+                               DriftMonitor())
+    records = shifted_records()
+    results = pipeline.score([Message(i, record, time.time()) for i, record in enumerate(records)])
+    changes = [change for result in results for change in result["changes"]]
+    assert changes and {change["anomaly_type"] for change in changes} == {"regime_change"}
+    assert all(change["location"] == "Main St" for change in changes)
+
+
+def test_batches_are_scored_once(tmp_path, monkeypatch):
+    detector = AnomalyDetector(temporal_window=0)
+    pipeline = ScoringPipeline(DurableQueue(str(tmp_path / "queue.db")), detector, DriftMonitor())
+    calls = []
+    score_batch = detector.score_batch
+    monkeypatch.setattr(detector, "score_batch", lambda features, model=None: calls.append(len(features)) or
+                        score_batch(features, model))
+    records = shifted_records()
+    records[5] = dict(records[5], vehicle_count=9000, average_speed=1.0, congestion_level=1.0)
+    results = pipeline.score([Message(i, record, time.time()) for i, record in enumerate(records)])
+    assert calls == [len(records)]
+    assert results[5]["is_anomaly"] and results[5]["analysis"]["severity"] > 0
+    assert all(result["is_anomaly"] == (result["analysis"] is not None) for result in results)
+
+
+def test_retried_batch_feeds_the_drift_monitor_once(tmp_path, monkeypatch):
+    monitor = DriftMonitor()
+    pipeline = ScoringPipeline(DurableQueue(str(tmp_path / "queue.db")), AnomalyDetector(temporal_window=0), monitor)
+    fed = []
+    update = monitor.update
+    monkeypatch.setattr(monitor, "update", lambda record: fed.append(record["timestamp"]) or update(record))
+    messages = [Message(i, record, time.time()) for i, record in enumerate(shifted_records())]
+
+    first = pipeline.score(messages)
+    # The batch failed to commit and is retried, then halved
+    retried = pipeline.score(messages)
+    pipeline.score(messages[60:])
+    assert len(fed) == len(messages)
+    assert [result["changes"] for result in retried] == [result["changes"] for result in first]
+    assert any(result["changes"] for result in retried)
+
+    # Later batches are new records
+    later = [Message(len(messages) + i, dict(record, timestamp=f"2025-01-01T09:00:{i:02d}"), time.time())
+             for i, record in enumerate(shifted_records(before=0, after=5))]
+    pipeline.score(later)
+    assert len(fed) == len(messages) + 5
+    assert set(pipeline._uncommitted_changes) == {message.offset for message in later}
@@ -0,0 +1,58 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from model import AnomalyDetector
+from registry import ModelRegistry
+from test_detectors import records
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return ModelRegistry(str(tmp_path / "registry"))
+
+
+def publish(registry, temporal_window=0):
+    detector = AnomalyDetector(temporal_window=temporal_window, registry=registry,
+                               detector_params={"isolation_forest": {"n_estimators": 10}})
+    detector.train(records(200))
+    return detector.model_version
+
+
+@pytest.fixture
+def client(registry, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.detector, "registry", registry)
+    return TestClient(main.app)
+
+
+def test_rollback_target_does_not_activate(registry):
+    first = publish(registry)
+    second = publish(registry)
+    assert registry.rollback_target() == first
+    assert registry.active_version() == second
+    with pytest.raises(ValueError):
+        registry.rollback(expected=second)
+    assert registry.rollback(expected=first) == first
+    assert registry.active_version() == first
+
+
+def test_rollback_serves_the_previous_version(client, registry):
+    import main
+
+    first = publish(registry)
+    publish(registry)
+    response = client.post("/models/rollback")
+    assert response.status_code == 200, response.text
+    assert registry.active_version() == first
+    assert main.detector.model_version == first
+
+
+def test_rollback_to_a_version_that_fails_to_load_keeps_the_active_one(client, registry):
+    # Trained with temporal features the serving detector does not extract
+    publish(registry, temporal_window=20)
+    second = publish(registry)
+    response = client.post("/models/rollback")
+    assert response.status_code == 409
+    assert registry.active_version() == second
+    assert registry.history()
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from schema import SchemaError, to_matrix, validate
+
+
+def record(**values):
+    return {"vehicle_count": 20, "average_speed": 50.0, "congestion_level": 0.5, "time_of_day": 8, **values}
+
+
+@pytest.mark.parametrize("value", ["20", True, [20], {"count": 20}])
+def test_non_numbers_are_rejected_in_valid_batches(value):
+    # The rest of the batch is well formed, so the column-wise path sees the value
+    records = [record(), record(vehicle_count=value), record()]
+    with pytest.raises(SchemaError) as error:
+        validate(records)
+    assert error.value.errors == ["record 1: vehicle_count must be a number"]
+
+
+def test_missing_values_and_non_objects_are_listed():
+    with pytest.raises(SchemaError) as error:
+        validate([record(), {k: v for k, v in record().items() if k != "time_of_day"}])
+    assert error.value.errors == ["record 1: time_of_day is required"]
+    with pytest.raises(SchemaError) as error:
+        validate([record(), "record"])
+    assert error.value.errors[0] == "record 1: vehicle_count is required"
+
+
+def test_valid_records_match_to_matrix():
+    records = [record(), record(vehicle_count=30, average_speed=np.float64(42.5))]
+    np.testing.assert_array_equal(validate(records), to_matrix(records))
+    assert validate([]).shape == (0, 4)
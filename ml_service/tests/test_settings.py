@@ -0,0 +1,14 @@
+from settings import load_settings
+
+
+def test_secrets_are_read_but_not_served(monkeypatch):
+    monkeypatch.setenv("ML_API_KEY", "key")
+    monkeypatch.setenv("ML_MODEL_MMAP", "true")
+    monkeypatch.delenv("PROFILING_TOKEN", raising=False)
+    settings = load_settings()
+
+    assert settings.api_key == "key" and settings.model_mmap is True
+    described = settings.describe()
+    assert described["ML_API_KEY"] == "********"
+    assert described["PROFILING_TOKEN"] is None
+    assert described["ML_MODEL_MMAP"] is True
@@ -0,0 +1,39 @@
+from drift import DriftMonitor
+from model import AnomalyDetector
+from realtime_traffic import RealtimeTrafficSimulator
+from traffic_store import TrafficStore
+
+
+def test_processing_scores_each_record_once(tmp_path, monkeypatch):
+    detector = AnomalyDetector(temporal_window=0)
+    simulator = RealtimeTrafficSimulator(data_file=str(tmp_path / "traffic.json"), detector=detector,
+                                         drift_monitor=DriftMonitor(), store=TrafficStore())
+    calls = []
+    score_batch = detector.score_batch
+    monkeypatch.setattr(detector, "score_batch", lambda features, model=None: calls.append(len(features)) or
+                        score_batch(features, model))
+
+    normal = {"vehicle_count": 40, "average_speed": 60.0, "congestion_level": 0.2, "time_of_day": 12,
+              "location": "Main St", "timestamp": "2025-01-01T12:00:00"}
+    jammed = {**normal, "vehicle_count": 9000, "average_speed": 1.0, "congestion_level": 1.0,
+              "timestamp": "2025-01-01T12:00:01"}
+    assert simulator._process(normal) is False
+    assert simulator._process(jammed) is True
+    assert calls == [1, 1]
+
+
+def test_processed_anomalies_are_counted(tmp_path):
+    from metrics import ANOMALIES_DETECTED, instrument_detector
+
+    instrument_detector(AnomalyDetector)
+    simulator = RealtimeTrafficSimulator(data_file=str(tmp_path / "traffic.json"),
+                                         detector=AnomalyDetector(temporal_window=0),
+                                         drift_monitor=DriftMonitor(), store=TrafficStore())
+    jammed = {"vehicle_count": 9000, "average_speed": 1.0, "congestion_level": 1.0, "time_of_day": 12,
+              "location": "Main St", "timestamp": "2025-01-01T12:00:00"}
+    before = sum(sample.value for metric in ANOMALIES_DETECTED.collect() for sample in metric.samples
+                 if sample.name.endswith("_total"))
+    assert simulator._process(jammed) is True
+    after = sum(sample.value for metric in ANOMALIES_DETECTED.collect() for sample in metric.samples
+                if sample.name.endswith("_total"))
+    assert after == before + 1
@@ -0,0 +1,39 @@
+import numpy as np
+
+from streaming import ReservoirSampler
+
+
+def stream(rows: int) -> np.ndarray:
+    return np.arange(rows, dtype=np.float64).reshape(-1, 1)
+
+
+def sample_of(rows: np.ndarray, capacity: int, chunk_size: int, seed: int = 42) -> np.ndarray:
+    sampler = ReservoirSampler(capacity, rows.shape[1], seed)
+    for start in range(0, len(rows), chunk_size):
+        sampler.add(rows[start:start + chunk_size])
+    return sampler.result()
+
+
+def test_short_stream_is_kept_whole():
+    rows = stream(50)
+    assert np.array_equal(sample_of(rows, capacity=100, chunk_size=7), rows)
+
+
+def test_sample_does_not_depend_on_chunking():
+    rows = stream(5000)
+    sample = sample_of(rows, capacity=100, chunk_size=1000)
+    assert sample.shape == (100, 1)
+    assert len(np.unique(sample)) == 100
+    for chunk_size in (1, 37, 5000):
+        assert np.array_equal(sample_of(rows, capacity=100, chunk_size=chunk_size), sample)
+
+
+def test_every_row_is_equally_likely_to_be_sampled():
+    rows, capacity, runs = stream(2000), 100, 400
+    counts = np.zeros(len(rows))
+    for seed in range(runs):
+        counts[sample_of(rows, capacity, chunk_size=300, seed=seed)[:, 0].astype(int)] += 1
+
+    # Each row is expected in capacity / rows of the samples; compare tenths of the stream
+    expected = runs * capacity / 10
+    assert np.all(np.abs(counts.reshape(10, -1).sum(axis=1) - expected) < 0.1 * expected)
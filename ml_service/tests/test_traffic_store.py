@@ -0,0 +1,48 @@
+import numpy as np
+
+from traffic_store import TrafficStore
+
+
+def record(second: int, location="Main St", vehicle_count=100):
+    return {"timestamp": f"2025-01-01T08:00:{second:02d}", "location": location, "vehicle_count": vehicle_count,
+            "average_speed": 50.0, "congestion_level": 0.5, "time_of_day": 8}
+
+
+def counts(rows) -> list:
+    return rows["values"][:, 0].astype(int).tolist()
+
+
+def test_windows_are_per_location_and_in_time_order():
+    store = TrafficStore()
+    store.extend([record(s, vehicle_count=s) for s in (0, 1, 4)] + [record(2, "Elm St")])
+    # A late record lands in its place
+    store.append(record(3, vehicle_count=3))
+
+    assert counts(store.window("Main St")) == [0, 1, 3, 4]
+    assert counts(store.window("Main St", seconds=1.5)) == [3, 4]
+    assert counts(store.window("Main St", since=np.datetime64("2025-01-01T08:00:01"),
+                               until=np.datetime64("2025-01-01T08:00:03"))) == [1, 3]
+    assert len(store.window("Elm St")) == 1 and len(store.window("Oak St")) == 0
+    assert [(r["location"], r["timestamp"]) for r in store.recent(2)] == \
+        [("Main St", "2025-01-01T08:00:03.000000"), ("Main St", "2025-01-01T08:00:04.000000")]
+
+
+def test_windows_handed_out_do_not_change():
+    store = TrafficStore(retention_seconds=2)
+    store.extend([record(s, vehicle_count=s) for s in range(3)])
+    window = store.window("Main St")
+
+    store.extend([record(s, vehicle_count=s) for s in range(3, 10)])
+
+    assert counts(window) == [0, 1, 2]
+    assert not window.flags.writeable
+    # Records at most retention_seconds older than the newest are kept
+    assert counts(store.window("Main St")) == [7, 8, 9]
+
+
+def test_history_is_capped_per_location():
+    store = TrafficStore(max_records_per_location=3)
+    store.extend([record(s, vehicle_count=s) for s in range(10)] + [record(0, "Elm St")])
+
+    assert counts(store.window("Main St")) == [7, 8, 9]
+    assert len(store) == 4 and store.stats()["locations"] == 2
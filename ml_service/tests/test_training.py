@@ -0,0 +1,132 @@
+import asyncio
+import dataclasses
+
+import pytest
+from fastapi.testclient import TestClient
+
+from test_drift import shifted_records
+
+
+def fit_on_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+@pytest.fixture
+def client():
+    import main
+
+    # Without the context manager, so the simulator and pipeline stay off
+    return TestClient(main.app)
+
+
+def test_train_fits_off_the_event_loop(client, monkeypatch):
+    import main
+
+    on_loop = []
+    monkeypatch.setattr(main.detector, "train", lambda data: on_loop.append(fit_on_loop()))
+    response = client.post("/train", json={"data": shifted_records()})
+    assert response.status_code == 200
+    assert on_loop == [False]
+
+
+def test_train_stream_fits_off_the_event_loop(client, monkeypatch):
+    import json
+    import main
+    from streaming import StreamingTrainer
+
+    on_loop = []
+    update, finish = StreamingTrainer.update, StreamingTrainer.finish
+
+    def watched_update(self, records):
+        on_loop.append(fit_on_loop())
+        return update(self, records)
+
+    def watched_finish(self):
+        on_loop.append(fit_on_loop())
+        return finish(self)
+
+    monkeypatch.setattr(StreamingTrainer, "update", watched_update)
+    monkeypatch.setattr(StreamingTrainer, "finish", watched_finish)
+    monkeypatch.setattr(main.detector, "registry", None)
+    body = "\n".join(json.dumps(record) for record in shifted_records())
+    monkeypatch.setattr(main, "settings", dataclasses.replace(main.settings, api_key="key"))
+    response = client.post("/train/stream?chunk_size=50", content=body, headers={"X-API-Key": "key"})
+    assert response.status_code == 200, response.text
+    assert on_loop and not any(on_loop)
+
+
+@pytest.fixture
+def training_data(tmp_path, monkeypatch):
+    import json
+    import main
+
+    directory = tmp_path / "training_data"
+    directory.mkdir()
+    (directory / "history.ndjson").write_text("\n".join(json.dumps(record) for record in shifted_records()))
+    (tmp_path / "secret.ndjson").write_text("{}")
+    monkeypatch.setattr(main, "settings", dataclasses.replace(main.settings, api_key="key",
+                                                              training_data_dir=str(directory)))
+    monkeypatch.setattr(main.detector, "registry", None)
+    return directory
+
+
+def test_train_source_needs_the_api_key(client, training_data, monkeypatch):
+    import main
+
+    source = {"source": "ndjson", "path": "history.ndjson"}
+    assert client.post("/train/source", json=source).status_code == 403
+    assert client.post("/train/source", json=source, headers={"X-API-Key": "wrong"}).status_code == 403
+    monkeypatch.setattr(main, "settings", dataclasses.replace(main.settings, api_key=None))
+    assert client.post("/train/source", json=source, headers={"X-API-Key": "key"}).status_code == 404
+
+
+def test_train_source_reads_only_the_training_data_directory(client, training_data):
+    headers = {"X-API-Key": "key"}
+    for path in ("../secret.ndjson", str(training_data.parent / "secret.ndjson"), "/etc/passwd", None):
+        response = client.post("/train/source", json={"source": "ndjson", "path": path}, headers=headers)
+        assert response.status_code == 400, path
+
+    response = client.post("/train/source", json={"source": "ndjson", "path": "history.ndjson"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["rows_seen"] == len(shifted_records())
+
+
+def test_train_stream_rejects_records_outside_the_schema(client, monkeypatch):
+    import json
+    import main
+
+    monkeypatch.setattr(main.detector, "registry", None)
+    model = main.detector.model
+    records = shifted_records()
+    records[70]["congestion_level"] = "high"
+    body = "\n".join(json.dumps(record) for record in records)
+    monkeypatch.setattr(main, "settings", dataclasses.replace(main.settings, api_key="key"))
+    response = client.post("/train/stream?chunk_size=50", content=body, headers={"X-API-Key": "key"})
+    assert response.status_code == 422
+    assert response.json()["detail"] == ["record 70: congestion_level must be a number"]
+    assert main.detector.model is model
+
+
+def test_train_stream_needs_the_api_key(client, monkeypatch):
+    import main
+
+    assert client.post("/train/stream", content=b"").status_code == 404
+    monkeypatch.setattr(main, "settings", dataclasses.replace(main.settings, api_key="key"))
+    assert client.post("/train/stream", content=b"", headers={"X-API-Key": "wrong"}).status_code == 403
+
+
+@pytest.mark.parametrize("query", ["reservoir_size=0", "reservoir_size=1000000000", "chunk_size=0",
+                                   "chunk_size=100000000"])
+def test_training_sizes_are_bounded(client, monkeypatch, query):
+    import main
+
+    monkeypatch.setattr(main, "settings", dataclasses.replace(main.settings, api_key="key"))
+    headers = {"X-API-Key": "key"}
+    assert client.post(f"/train/stream?{query}", content=b"", headers=headers).status_code == 422
+    name, value = query.split("=")
+    source = {"source": "database", name: int(value)}
+    assert client.post("/train/source", json=source, headers=headers).status_code == 422
@@ -0,0 +1,41 @@
+import asyncio
+import dataclasses
+
+from process_lock import ProcessLock
+
+
+def test_process_lock_is_exclusive(tmp_path):
+    first, second = ProcessLock(str(tmp_path / "jobs.lock")), ProcessLock(str(tmp_path / "jobs.lock"))
+    assert first.acquire() and first.held
+    assert not second.acquire() and not second.held
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_only_the_lock_holder_runs_the_background_jobs(tmp_path, monkeypatch):
+    import main
+
+    path = str(tmp_path / "jobs.lock")
+    running = ProcessLock(path)
+    assert running.acquire()
+    started = []
+
+    async def start_background_jobs():
+        started.append(True)
+
+    monkeypatch.setattr(main, "background_lock", ProcessLock(path))
+    monkeypatch.setattr(main, "start_background_jobs", start_background_jobs)
+    monkeypatch.setattr(main, "settings", dataclasses.replace(main.settings, background_election_seconds=0.01))
+
+    async def scenario():
+        election = asyncio.create_task(main.elect_background_worker())
+        await asyncio.sleep(0.1)
+        assert started == []
+        # The worker running the jobs exits
+        running.release()
+        await asyncio.wait_for(election, 1)
+        assert started == [True]
+
+    asyncio.run(scenario())
+    main.background_lock.release()
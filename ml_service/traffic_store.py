@@ -0,0 +1,177 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from schema import FEATURE_COLUMNS, to_matrix, to_wire
+
+# Measurements kept per record, in the order the detector takes them
+STORE_COLUMNS = FEATURE_COLUMNS
+
+# 40 bytes per record: epoch microseconds and the measurements as one float64 block,
+# so a window's values are a (n, 4) view the detector can take as is
+RECORD_DTYPE = np.dtype([("timestamp", np.int64), ("values", np.float64, (len(STORE_COLUMNS),))])
+
+# History kept per location, measured back from its newest record, and a hard cap on its records
+TRAFFIC_STORE_RETENTION_SECONDS = float(os.getenv("TRAFFIC_STORE_RETENTION_SECONDS", "21600"))
+TRAFFIC_STORE_MAX_RECORDS = int(os.getenv("TRAFFIC_STORE_MAX_RECORDS", "1000000"))
+_MIN_CAPACITY = 1024
+
+
+def to_rows(records: List[Dict[str, Any]]) -> np.ndarray:
+    """Records as a RECORD_DTYPE array; ISO 8601 timestamps are read as naive times, like the records' own"""
+    rows = np.empty(len(records), dtype=RECORD_DTYPE)
+    rows["timestamp"] = np.array([record["timestamp"] for record in records], dtype="datetime64[us]").astype(np.int64)
+    rows["values"] = to_matrix(records)
+    return rows
+
+
+class _Segment:
+    """Time-ordered records of one location in a growable array.
+
+    Records are only ever appended past the end or dropped from the front by moving
+    start, and anything else builds a new array, so views handed out earlier never
+    change under their holder.
+    """
+
+    __slots__ = ("buffer", "start", "size")
+
+    def __init__(self):
+        self.buffer = np.empty(_MIN_CAPACITY, dtype=RECORD_DTYPE)
+        self.start = 0
+        self.size = 0
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self.buffer[self.start:self.size]
+
+    def extend(self, rows: np.ndarray):
+        """Add rows sorted by timestamp"""
+        if self.size > self.start and rows["timestamp"][0] < self.buffer["timestamp"][self.size - 1]:
+            # Out of order: merge into a new array (rare, e.g. a late sensor batch)
+            merged = np.concatenate([self.rows, rows])
+            self._replace(merged[np.argsort(merged["timestamp"], kind="stable")])
+            return
+        if self.size + len(rows) > len(self.buffer):
+            # Grow, leaving the expired front behind
+            self._replace(self.rows, room=len(rows))
+        self.buffer[self.size:self.size + len(rows)] = rows
+        self.size += len(rows)
+
+    def _replace(self, rows: np.ndarray, room: int = 0):
+        buffer = np.empty(max(_MIN_CAPACITY, (len(rows) + room) * 3 // 2), dtype=RECORD_DTYPE)
+        buffer[:len(rows)] = rows
+        self.buffer, self.start, self.size = buffer, 0, len(rows)
+
+    def expire(self, retention_us: int, max_records: int):
+        if self.size == self.start:
+            return
+        timestamps = self.rows["timestamp"]
+        self.start += int(np.searchsorted(timestamps, timestamps[-1] - retention_us, side="left"))
+        self.start = max(self.start, self.size - max_records)
+
+    def window(self, since: Optional[int], until: Optional[int]) -> np.ndarray:
+        rows = self.rows
+        timestamps = rows["timestamp"]
+        lo = 0 if since is None else int(np.searchsorted(timestamps, since, side="left"))
+        hi = len(rows) if until is None else int(np.searchsorted(timestamps, until, side="right"))
+        return rows[lo:hi]
+
+
+class TrafficStore:
+    """Recent traffic per location as columns in NumPy structured arrays.
+
+    About 40 bytes per record instead of a dict with an ISO timestamp string, so hours
+    of history per sensor fit in memory. Window queries are binary searches over the
+    sorted timestamps and return views, not copies: window(...)["values"] goes to the
+    detector (AnomalyDetector.score_columns) without building a record. Records
+    without a location are kept under None.
+    """
+
+    def __init__(self, retention_seconds: float = TRAFFIC_STORE_RETENTION_SECONDS,
+                 max_records_per_location: int = TRAFFIC_STORE_MAX_RECORDS):
+        self.retention_us = int(retention_seconds * 1e6)
+        self.max_records_per_location = max_records_per_location
+        self._segments: Dict[Optional[str], _Segment] = {}
+        self._lock = threading.Lock()
+
+    def append(self, record: Dict[str, Any]):
+        self.extend([record])
+
+    def extend(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        rows = to_rows(records)
+        locations = np.array([record.get("location") for record in records], dtype=object)
+        groups = {locations[0]: slice(None)} if (locations == locations[0]).all() else \
+            {location: locations == location for location in set(locations.tolist())}
+        with self._lock:
+            for location, selector in groups.items():
+                group = rows[selector]
+                group = group[np.argsort(group["timestamp"], kind="stable")]
+                segment = self._segments.get(location)
+                if segment is None:
+                    segment = self._segments[location] = _Segment()
+                segment.extend(group)
+                segment.expire(self.retention_us, self.max_records_per_location)
+
+    def window(self, location: Optional[str], seconds: Optional[float] = None,
+               since: Optional[np.datetime64] = None, until: Optional[np.datetime64] = None) -> np.ndarray:
+        """Records of a location between since and until, or in the last seconds of its history.
+
+        The result is a read-only view; it stays valid and unchanged while the store moves on.
+        """
+        with self._lock:
+            segment = self._segments.get(location)
+            if segment is None:
+                return np.empty(0, dtype=RECORD_DTYPE)
+            until_us = None if until is None else np.datetime64(until, "us").astype(np.int64)
+            if seconds is not None:
+                latest = segment.buffer["timestamp"][segment.size - 1] if segment.size > segment.start else 0
+                since_us = (latest if until_us is None else until_us) - int(seconds * 1e6)
+            else:
+                since_us = None if since is None else np.datetime64(since, "us").astype(np.int64)
+            rows = segment.window(since_us, until_us)
+        rows.flags.writeable = False
+        return rows
+
+    def to_records(self, rows: np.ndarray, location: Optional[str] = None) -> List[Dict[str, Any]]:
+        """rows as record dicts with naive ISO 8601 timestamps"""
+        timestamps = np.datetime_as_string(rows["timestamp"].astype("datetime64[us]"), unit="us").tolist()
+        records = to_wire(rows["values"])
+        for record, timestamp in zip(records, timestamps):
+            record["timestamp"] = timestamp
+            if location is not None:
+                record["location"] = location
+        return records
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        """The newest limit records over every location, oldest first"""
+        with self._lock:
+            windows = [(location, segment.rows[-limit:]) for location, segment in self._segments.items()]
+        records = []
+        timestamps = []
+        for location, rows in windows:
+            records.extend(self.to_records(rows, location))
+            timestamps.append(rows["timestamp"])
+        if not records:
+            return []
+        order = np.argsort(np.concatenate(timestamps), kind="stable")[-limit:]
+        return [records[i] for i in order.tolist()]
+
+    def locations(self) -> List[Optional[str]]:
+        with self._lock:
+            return list(self._segments)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(segment.size - segment.start for segment in self._segments.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "locations": len(self._segments),
+                "records": sum(segment.size - segment.start for segment in self._segments.values()),
+                "bytes": sum(segment.buffer.nbytes for segment in self._segments.values())
+            }